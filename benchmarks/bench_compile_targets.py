@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Syscall-count benchmark for the creation and validation of the target
+directories during the compile step of a toolchain.
+
+Usage::
+
+    python benchmarks/bench_compile_targets.py [--modules N] [--dirs D]
+
+Compiles N generated modules spread across D directories with the
+NullToolchain, once with the target directories prepared in a single
+pass and cached for the run (the default behavior), and once with the
+cache discarded before every entry (the behavior prior to the batching
+of the target directories).  Reports the number of stat, lstat and
+mkdir calls made through the os module along with the time taken.
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import timeit
+from os.path import join
+from os.path import realpath
+
+from calmjs.toolchain import NullToolchain
+from calmjs.toolchain import Spec
+from calmjs.toolchain import toolchain_spec_compile_entries
+
+COUNTED = ('stat', 'lstat', 'mkdir')
+
+
+class SyscallCounter(object):
+    """
+    Count the calls made to the COUNTED functions of the os module.
+    """
+
+    def __init__(self):
+        self.counts = dict.fromkeys(COUNTED, 0)
+        self.originals = {}
+
+    def _wrap(self, name, f):
+        def wrapper(*a, **kw):
+            self.counts[name] += 1
+            return f(*a, **kw)
+        return wrapper
+
+    def __enter__(self):
+        for name in COUNTED:
+            self.originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self.originals[name]))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, f in self.originals.items():
+            setattr(os, name, f)
+
+
+class UnbatchedToolchain(NullToolchain):
+    """
+    Discards the prepared directories before every entry.
+    """
+
+    def prepare_compile_transpile_entries(self, spec, entries):
+        pass
+
+    def compile_transpile_entry(self, spec, entry):
+        self._reset_build_target_cache()
+        return super(UnbatchedToolchain, self).compile_transpile_entry(
+            spec, entry)
+
+
+def make_sources(root, modules, dirs):
+    entries = []
+    for i in range(modules):
+        path = join('pkg%d' % (i % dirs), 'nested', 'mod%d.js' % i)
+        source = join(root, 'src', path)
+        if not os.path.isdir(os.path.dirname(source)):
+            os.makedirs(os.path.dirname(source))
+        with open(source, 'w') as fd:
+            fd.write('var mod%d = %d;\n' % (i, i))
+        modname = path[:-3].replace(os.sep, '/')
+        entries.append((modname, source, path, modname))
+    return entries
+
+
+def run(toolchain, root, entries):
+    build_dir = realpath(tempfile.mkdtemp(dir=root))
+    spec = Spec(build_dir=build_dir)
+    toolchain._reset_build_target_cache()
+    with SyscallCounter() as counter:
+        start = timeit.default_timer()
+        toolchain_spec_compile_entries(
+            toolchain, spec, entries, process_name='transpile')
+        duration = timeit.default_timer() - start
+    shutil.rmtree(build_dir)
+    return counter.counts, duration
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--modules', type=int, default=2000)
+    parser.add_argument('--dirs', type=int, default=10)
+    parsed = parser.parse_args(args)
+
+    logging.getLogger('calmjs').addHandler(logging.NullHandler())
+    logging.getLogger('calmjs').propagate = False
+
+    root = tempfile.mkdtemp()
+    try:
+        entries = make_sources(root, parsed.modules, parsed.dirs)
+        print('%d modules in %d directories' % (
+            parsed.modules, parsed.dirs))
+        for name, toolchain in (
+                ('unbatched', UnbatchedToolchain()),
+                ('batched', NullToolchain())):
+            counts, duration = run(toolchain, root, entries)
+            print('%-10s %s %8.3f msec' % (name, ' '.join(
+                '%s=%-7d' % (key, counts[key]) for key in COUNTED),
+                duration * 1e3))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark for the concatenating ConcatToolchain.
+
+Usage::
+
+    python benchmarks/bench_concat.py [--modules N] [--repeat R]
+        [--external COMMAND]
+
+Generates N CommonJS modules and builds them into a single artifact
+with source maps using the ConcatToolchain, reporting the best time
+for the whole toolchain run along with the throughput in modules per
+second.
+
+For comparison with an external bundler, a command may be provided by
+``--external``, which will be executed through the shell after the
+sources are generated, with ``{entry}``, ``{src_dir}`` and
+``{export_target}`` substituted with the path to the module requiring
+every other module, the directory with the sources and the path to
+the artifact to be written, e.g.::
+
+    --external 'browserify {entry} -d -o {export_target}'
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import timeit
+from os.path import join
+
+from calmjs.concat import ConcatToolchain
+from calmjs.toolchain import Spec
+
+
+def make_sources(src_dir, modules):
+    sources = {}
+    for i in range(modules):
+        path = join(src_dir, 'mod%d.js' % i)
+        with open(path, 'w') as fd:
+            fd.write(
+                'var value = %d;\n'
+                'exports.value = function(x) {\n'
+                '    if (x > value) {\n'
+                '        return x - value;\n'
+                '    }\n'
+                '    return value;\n'
+                '};\n' % i
+            )
+        sources['mod%d' % i] = path
+    entry = join(src_dir, 'index.js')
+    with open(entry, 'w') as fd:
+        for i in range(modules):
+            fd.write('require("./mod%d");\n' % i)
+    sources['index'] = entry
+    return sources
+
+
+def run_concat(sources, export_target):
+    spec = Spec(
+        export_target=export_target,
+        generate_source_map=True,
+        transpile_sourcepath=sources,
+    )
+    ConcatToolchain()(spec)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--modules', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--external', default=None)
+    parsed = parser.parse_args(args)
+
+    logging.getLogger('calmjs').addHandler(logging.NullHandler())
+    logging.getLogger('calmjs').propagate = False
+
+    root = tempfile.mkdtemp()
+    try:
+        src_dir = join(root, 'src')
+        os.mkdir(src_dir)
+        sources = make_sources(src_dir, parsed.modules)
+        export_target = join(root, 'bundle.js')
+
+        runs = [('ConcatToolchain', lambda: run_concat(
+            sources, export_target))]
+        if parsed.external:
+            command = parsed.external.format(
+                entry=sources['index'], src_dir=src_dir,
+                export_target=export_target)
+            runs.append(('external', lambda: subprocess.check_call(
+                command, shell=True)))
+
+        for name, f in runs:
+            best = min(timeit.repeat(f, number=1, repeat=parsed.repeat))
+            print('%-16s %8.3f sec %10.1f modules/sec %10d bytes' % (
+                name, best, len(sources) / best,
+                os.path.getsize(export_target)))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
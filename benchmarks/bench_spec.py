@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the calmjs.toolchain.Spec access, advise and handle
+methods.
+
+Usage::
+
+    python benchmarks/bench_spec.py [--number N] [--repeat R]
+
+Reports the best time per call for each of the benchmarks, in
+microseconds.
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import timeit
+import warnings
+
+from calmjs.toolchain import Spec
+from calmjs.toolchain import BUILD_DIR
+from calmjs.toolchain import CALMJS_LOADERPLUGIN_REGISTRY
+
+
+def noop():
+    pass
+
+
+def setup_spec():
+    return Spec(build_dir='/tmp', calmjs_loaderplugin_registry=None)
+
+
+def bench_construct():
+    Spec(build_dir='/tmp', export_target='/tmp/out.js')
+
+
+def bench_getitem(spec=setup_spec()):
+    spec[BUILD_DIR]
+
+
+def bench_get(spec=setup_spec()):
+    spec.get(CALMJS_LOADERPLUGIN_REGISTRY)
+
+
+def bench_get_default(spec=setup_spec()):
+    spec.get('missing_key', None)
+
+
+def bench_setitem(spec=setup_spec()):
+    spec[BUILD_DIR] = '/tmp'
+
+
+def bench_deprecated_getitem(spec=Spec(test_sourcepath='/')):
+    spec['test_source_map']
+
+
+def bench_advise(spec=setup_spec()):
+    spec.advise('bench', noop)
+    # keep the advice list from growing without bounds.
+    spec._advices.clear()
+
+
+def bench_advise_debug(spec=Spec(debug=2)):
+    spec.advise('bench', noop)
+    spec._advices.clear()
+    spec._frames.clear()
+
+
+def bench_advise_called_group(spec=setup_spec()):
+    # advising to a group that has been handled triggers the frame
+    # protection check.
+    spec._called.add('bench')
+    spec.advise('bench', noop)
+    spec._advices.clear()
+
+
+def bench_handle():
+    spec = Spec()
+    for i in range(10):
+        spec.advise('bench', noop)
+    spec.handle('bench')
+
+
+BENCHMARKS = [
+    ('Spec()', bench_construct),
+    ('spec[key]', bench_getitem),
+    ('spec.get(key)', bench_get),
+    ('spec.get(missing, default)', bench_get_default),
+    ('spec[key] = value', bench_setitem),
+    ('spec[deprecated_key]', bench_deprecated_getitem),
+    ('spec.advise(name, f)', bench_advise),
+    ('spec.advise(name, f) [debug=2]', bench_advise_debug),
+    ('spec.advise(name, f) [handled]', bench_advise_called_group),
+    ('spec.handle(name) [10 advices]', bench_handle),
+]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--number', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parsed = parser.parse_args(args)
+
+    # the deprecated key benchmark will warn and log on every access.
+    warnings.simplefilter('ignore')
+    logging.getLogger('calmjs').addHandler(logging.NullHandler())
+    logging.getLogger('calmjs').propagate = False
+
+    for name, f in BENCHMARKS:
+        best = min(timeit.repeat(
+            f, number=parsed.number, repeat=parsed.repeat))
+        print('%-34s %8.3f usec' % (name, best / parsed.number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -68,11 +68,13 @@ setup(
         ],
         'calmjs.runtime': [
             'artifact = calmjs.runtime:artifact',
+            'daemon = calmjs.runtime:daemon',
             'npm = calmjs.npm:npm.runtime',
             'yarn = calmjs.yarn:yarn.runtime',
         ],
         'calmjs.runtime.artifact': [
             'build = calmjs.runtime:artifact_build',
+            'store = calmjs.runtime:artifact_store',
         ],
         'distutils.commands': [
             'npm = calmjs.npm:npm',
@@ -90,6 +92,8 @@ setup(
             'extras_calmjs.json = calmjs.dist:write_extras_calmjs',
             ('calmjs_module_registry.txt = '
                 'calmjs.dist:write_module_registry_names'),
+            ('calmjs_module_index.json = '
+                'calmjs.dist:write_module_index'),
         ],
         'calmjs.extras_keys': [
             'node_modules = enabled',
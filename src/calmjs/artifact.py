@@ -114,6 +114,11 @@ with the entry point setup, the setup call may look something like this:
 
 from __future__ import absolute_import
 
+import base64
+import bz2
+import gzip
+import hashlib
+import io
 import json
 import warnings
 from codecs import open
@@ -123,14 +128,24 @@ from logging import getLogger
 from os.path import basename
 from os.path import dirname
 from os.path import exists
+from os.path import getsize
 from os.path import isdir
+from os.path import isfile
 from os.path import join
 from os.path import normcase
 from os import makedirs
 from os import unlink
 from shutil import rmtree
 
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
 from calmjs.base import BaseRegistry
+from calmjs.cache import BuildCache
+from calmjs.cache import pack
+from calmjs.cache import unpack
 from calmjs.base import PackageKeyMapping
 from calmjs.dist import find_packages_requirements_dists
 from calmjs.dist import find_pkg_dist
@@ -139,6 +154,8 @@ from calmjs.dist import pkg_names_to_dists
 from calmjs.cli import get_bin_version_str
 from calmjs.command import BuildArtifactCommand
 from calmjs.registry import get
+from calmjs.store import ArtifactStore
+from calmjs.store import spec_fingerprint
 from calmjs.types.exceptions import ToolchainAbort
 from calmjs.toolchain import Toolchain
 from calmjs.toolchain import Spec
@@ -148,10 +165,27 @@ from calmjs.toolchain import EXPORT_TARGET
 
 ARTIFACT_BASENAME = 'calmjs_artifacts'
 ARTIFACT_REGISTRY_NAME = 'calmjs.artifacts'
+# the size of the chunks read from the export target while processing.
+ARTIFACT_CHUNK_SIZE = 1 << 16
 
 logger = getLogger(__name__)
 
 
+def _gzip_open(path):
+    # a fixed mtime for reproducible outputs.
+    return gzip.GzipFile(path, 'wb', mtime=0)
+
+
+# the writers for the compressed siblings of export targets, keyed by
+# the suffix for their filenames.
+COMPRESSORS = {
+    'gz': _gzip_open,
+    'bz2': lambda path: bz2.BZ2File(path, 'wb'),
+}
+if lzma is not None:
+    COMPRESSORS['xz'] = lambda path: lzma.LZMAFile(path, 'wb')
+
+
 def _cls_lookup_dist(cls):
     """
     Attempt to resolve the distribution from the provided class in the
@@ -214,6 +248,72 @@ def trace_toolchain(toolchain):
     return pkgs
 
 
+def process_export_target(
+        export_target, compressions=('gz',),
+        integrity_algorithms=('sha256', 'sha384'),
+        chunk_size=ARTIFACT_CHUNK_SIZE):
+    """
+    Read through the export target once, writing out a compressed
+    sibling for every one of the compressions (as named by the keys of
+    COMPRESSORS) while computing the digests for subresource integrity
+    using the integrity_algorithms.
+
+    Return a dict with the size of the export target, the integrity
+    values and the filename and size of every compressed sibling, or an
+    empty dict if the export target is not a file or an error occurred.
+    """
+
+    if not isfile(export_target):
+        return {}
+
+    hashers = [
+        (algorithm, hashlib.new(algorithm))
+        for algorithm in integrity_algorithms
+    ]
+    writers = []
+    size = 0
+    try:
+        for suffix in compressions:
+            if suffix not in COMPRESSORS:
+                logger.warning(
+                    "unsupported compression '%s' for export target '%s'",
+                    suffix, export_target)
+                continue
+            writers.append((suffix, COMPRESSORS[suffix](
+                export_target + '.' + suffix)))
+
+        with io.open(export_target, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(chunk_size), b''):
+                size += len(chunk)
+                for algorithm, hasher in hashers:
+                    hasher.update(chunk)
+                for suffix, writer in writers:
+                    writer.write(chunk)
+    except (IOError, OSError) as e:
+        logger.error(
+            "failed to process export target '%s': %s", export_target, e)
+        return {}
+    finally:
+        for suffix, writer in writers:
+            writer.close()
+
+    return {
+        'size': size,
+        'integrity': {
+            algorithm: '%s-%s' % (algorithm, base64.b64encode(
+                hasher.digest()).decode('ascii'))
+            for algorithm, hasher in hashers
+        },
+        'compressed': {
+            suffix: {
+                'filename': basename(export_target) + '.' + suffix,
+                'size': getsize(export_target + '.' + suffix),
+            }
+            for suffix, writer in writers
+        },
+    }
+
+
 def setup_export_location(export_target):
     target_dir = dirname(export_target)
     try:
@@ -265,6 +365,13 @@ class BaseArtifactRegistry(BaseRegistry):
     which method to generate the artifact and what name to use.
     """
 
+    # the compressed siblings to be written for every export target,
+    # as named by the keys of COMPRESSORS.
+    compressions = ('gz',)
+    # the algorithms for the subresource integrity values recorded for
+    # every export target.
+    integrity_algorithms = ('sha256', 'sha384')
+
     def _init(self):
         # default (self.records) is a map of package + name to path
         # this is the reverse lookup for that
@@ -278,6 +385,10 @@ class BaseArtifactRegistry(BaseRegistry):
         # TODO determine if the full import name lookup table is
         # required.
         # self.builders = {}
+        # the optional content-addressed store for the artifacts.
+        self.store = ArtifactStore.from_environ()
+        # the optional build cache shared with other build hosts.
+        self.build_cache = BuildCache.from_environ()
 
         for ep in self.raw_entry_points:
             # the expected path to the artifact.
@@ -507,6 +618,17 @@ class BaseArtifactRegistry(BaseRegistry):
         if not self.setup_export_location(export_target):
             raise ToolchainAbort()
 
+    def process_export_target(self, export_target):
+        """
+        Produce the compressed siblings and the integrity values for
+        the export target in a single pass, returning the values to be
+        recorded in the metadata.
+        """
+
+        return process_export_target(
+            export_target, compressions=self.compressions,
+            integrity_algorithms=self.integrity_algorithms)
+
     def extract_builder_result(self, builder_result):
         return extract_builder_result(builder_result)
 
@@ -591,20 +713,128 @@ class BaseArtifactRegistry(BaseRegistry):
             for builder in self.generate_builder(entry_point, export_target):
                 yield builder
 
+    def artifact_fingerprint(self, entry_point, toolchain, spec):
+        """
+        Return the fingerprint of the inputs for the artifact to be
+        built by the toolchain and spec, for the artifact store; None if
+        it cannot be determined.
+        """
+
+        return spec_fingerprint(
+            spec,
+            '%s:%s' % (entry_point.module_name, '.'.join(entry_point.attrs)),
+            trace_toolchain(toolchain),
+            basename(spec['export_target']),
+        )
+
+    def retrieve_stored_artifact(self, fingerprint, export_target):
+        """
+        Place the artifact for the fingerprint from the store at the
+        export target, returning its metadata entry; None if the store
+        does not have it.
+        """
+
+        if not self.setup_export_location(export_target):
+            return None
+        try:
+            metadata = self.store.get(fingerprint, export_target)
+        except (IOError, OSError) as e:
+            logger.warning(
+                "failed to retrieve artifact '%s' from store: %s",
+                fingerprint, e)
+            return None
+        if metadata is not None:
+            logger.info(
+                "artifact '%s' retrieved from artifact store '%s'",
+                export_target, self.store.root)
+        return metadata
+
+    def retrieve_cached_artifact(self, fingerprint, export_target):
+        """
+        Write the artifact for the fingerprint from the build cache to
+        the export target, returning its metadata entry; None if the
+        build cache does not have it.
+        """
+
+        data = self.build_cache.get('artifact-' + fingerprint)
+        if data is None:
+            return None
+        try:
+            metadata, (artifact,) = unpack(data)
+        except (ValueError, KeyError) as e:
+            logger.warning(
+                "discarding malformed artifact '%s' from build cache: %s",
+                fingerprint, e)
+            return None
+        if not self.setup_export_location(export_target):
+            return None
+        with io.open(export_target, 'wb') as fd:
+            fd.write(artifact)
+        logger.info(
+            "artifact '%s' retrieved from build cache %r",
+            export_target, self.build_cache)
+        return metadata
+
+    def cache_artifact(self, fingerprint, export_target, metadata):
+        try:
+            with io.open(export_target, 'rb') as fd:
+                artifact = fd.read()
+        except (IOError, OSError) as e:
+            logger.warning(
+                "failed to read artifact '%s' for build cache: %s",
+                export_target, e)
+            return
+        self.build_cache.put(
+            'artifact-' + fingerprint, pack(metadata, [artifact]))
+
+    def store_artifact(self, fingerprint, export_target, metadata):
+        try:
+            self.store.put(fingerprint, export_target, metadata)
+        except (IOError, OSError) as e:
+            logger.warning(
+                "failed to store artifact '%s': %s", export_target, e)
+
     def execute_builder(self, entry_point, toolchain, spec):
         """
         Accepts the arguments provided by the builder and executes them.
+
+        If an artifact store or build cache is available and it has the
+        artifact for the same inputs, that will be used instead.
         """
 
-        toolchain(spec)
-        if not exists(spec['export_target']):
-            logger.error(
-                "the entry point '%s' from package '%s' failed to "
-                "generate an artifact at '%s'",
-                entry_point, entry_point.dist, spec['export_target']
-            )
-            return {}
-        return self.generate_metadata_entry(entry_point, toolchain, spec)
+        export_target = spec['export_target']
+        fingerprint = (self.store or self.build_cache) and (
+            self.artifact_fingerprint(entry_point, toolchain, spec))
+        metadata = None
+        if fingerprint and self.store:
+            metadata = self.retrieve_stored_artifact(
+                fingerprint, export_target)
+        if fingerprint and self.build_cache and not metadata:
+            metadata = self.retrieve_cached_artifact(
+                fingerprint, export_target)
+            if metadata and self.store:
+                self.store_artifact(fingerprint, export_target, metadata)
+
+        if not metadata:
+            toolchain(spec)
+            if not exists(export_target):
+                logger.error(
+                    "the entry point '%s' from package '%s' failed to "
+                    "generate an artifact at '%s'",
+                    entry_point, entry_point.dist, export_target
+                )
+                return {}
+            metadata = self.generate_metadata_entry(
+                entry_point, toolchain, spec)
+            if fingerprint and self.store:
+                self.store_artifact(fingerprint, export_target, metadata)
+            if fingerprint and self.build_cache:
+                self.cache_artifact(fingerprint, export_target, metadata)
+
+        processed = self.process_export_target(spec['export_target'])
+        for entry in metadata.values():
+            entry.update(processed)
+        return metadata
 
     def process_package(self, package_name):
         results = {}
@@ -11,20 +11,42 @@ import os
 
 import errno
 import json
+import sys
+import threading
+from bisect import bisect_left
+from itertools import chain
+from operator import itemgetter
 from os import getcwd
+from os.path import basename
+from os.path import commonprefix
 from os.path import dirname
 from os.path import isdir
 from os.path import join
+from os.path import normcase
+from os.path import normpath
+from os.path import pardir
 from os.path import pathsep
 from os.path import realpath
+from os.path import relpath
 from os.path import sep
+from os.path import split
+from os.path import splitext
 
 from collections import OrderedDict
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 try:
+    from collections.abc import Mapping
     from collections.abc import MutableMapping
 except ImportError:  # pragma: no cover
+    from collections import Mapping
     from collections import MutableMapping
+try:
+    from sys import intern
+except ImportError:  # pragma: no cover
+    from __builtin__ import intern
 from logging import getLogger
+from pkg_resources import DEVELOP_DIST
 from pkg_resources import Distribution
 from pkg_resources import working_set
 from pkg_resources import safe_name
@@ -33,21 +55,80 @@ from calmjs.utils import which
 from calmjs.utils import finalize_env
 from calmjs.utils import fork_exec
 from calmjs.utils import raise_os_error
+from calmjs.trace import tracer
 
 NODE_PATH = 'NODE_PATH'
 NODE_MODULES = 'node_modules'
 # the usual path to binary within node modules.
 NODE_MODULES_BIN = '.bin'
 NODE = 'node'
+# the number of threads for the mapping of the modules for the entry
+# points registered to module registries.
+CALMJS_REGISTRY_WORKERS = 'CALMJS_REGISTRY_WORKERS'
 
 logger = getLogger(__name__)
 _marker = object()
+_empty_record = {}
+
+try:
+    from types import MappingProxyType
+except ImportError:  # pragma: no cover
+    class MappingProxyType(Mapping):
+        """
+        Minimal read-only view of a mapping for Python 2.
+        """
+
+        __slots__ = ('_mapping',)
+
+        def __init__(self, mapping):
+            self._mapping = mapping
+
+        def __getitem__(self, key):
+            return self._mapping[key]
+
+        def __iter__(self):
+            return iter(self._mapping)
+
+        def __len__(self):
+            return len(self._mapping)
+
+        def __contains__(self, key):
+            return key in self._mapping
+
+        def copy(self):
+            return self._mapping.copy()
+
+        def __repr__(self):
+            return 'mappingproxy(%r)' % (self._mapping,)
+
+
+def _intern(value):
+    # only the native str type may be interned.
+    return intern(value) if type(value) is str else value
 
 
 def _import_module(module_name):
     return __import__(module_name, fromlist=['__name__'], level=0)
 
 
+def _module_import_root(module):
+    """
+    Return the directory from which the provided module is imported
+    from, or None if that cannot be determined.
+    """
+
+    path = getattr(module, '__file__', None)
+    if not path:
+        return None
+    levels = module.__name__.count('.')
+    if splitext(basename(path))[0] == '__init__':
+        levels += 1
+    root = dirname(path)
+    for _ in range(levels):
+        root = dirname(root)
+    return root
+
+
 def _check_isdir_assign_key(d, key, value, error_msg=None):
     if isdir(value):
         d[key] = value
@@ -120,6 +201,208 @@ class PackageKeyMapping(MutableMapping):
         return repr(self.__map)
 
 
+class ChainedRecordsView(Mapping):
+    """
+    A read-only view over a sequence of mappings, where the values in
+    the later mappings take precedence over the earlier ones, matching
+    the result of updating a dict with each of the mappings in order,
+    without doing the actual copying.
+    """
+
+    __slots__ = ('_mappings',)
+
+    def __init__(self, mappings):
+        self._mappings = tuple(mappings)
+
+    def __getitem__(self, key):
+        for mapping in reversed(self._mappings):
+            if key in mapping:
+                return mapping[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return any(key in mapping for mapping in self._mappings)
+
+    def __iter__(self):
+        if len(self._mappings) == 1:
+            for key in self._mappings[0]:
+                yield key
+            return
+        seen = set()
+        for mapping in self._mappings:
+            for key in mapping:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        if len(self._mappings) == 1:
+            return len(self._mappings[0])
+        return len(set().union(*self._mappings))
+
+    def copy(self):
+        result = {}
+        for mapping in self._mappings:
+            result.update(mapping)
+        return result
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.copy())
+
+
+class RecordView(Mapping):
+    """
+    A read-only view of the record stored under the name in records,
+    such that the view reflects any replacement of that record.
+    """
+
+    __slots__ = ('_records', '_name')
+
+    def __init__(self, records, name):
+        self._records = records
+        self._name = name
+
+    def _record(self):
+        return self._records.get(self._name, _empty_record)
+
+    def __getitem__(self, key):
+        return self._record()[key]
+
+    def __contains__(self, key):
+        return key in self._record()
+
+    def __iter__(self):
+        return iter(self._record())
+
+    def __len__(self):
+        return len(self._record())
+
+    def copy(self):
+        return dict(self._record())
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.copy())
+
+
+def _shared_dirname(values):
+    # the longest leading directory shared by all values, if they are
+    # all strings of the same type.
+    types = set(type(value) for value in values)
+    if len(types) != 1 or not issubclass(types.pop(), (type(u''), str)):
+        return None
+    prefix = commonprefix(values)
+    index = prefix.rfind(sep)
+    return _intern(prefix[:index]) if index > 0 else None
+
+
+class CompactRecord(Mapping):
+    """
+    A read-only mapping for the records of a module, with the keys and
+    the values kept in tuples ordered by the keys.  The leading
+    directory shared by all the values (i.e. the paths to the source
+    files) is kept once, interned, with only the remainder of each path
+    stored, such that the full paths are produced when they are read.
+    """
+
+    __slots__ = ('_prefix', '_keys', '_values')
+
+    def __init__(self, mapping):
+        items = sorted(mapping.items(), key=itemgetter(0))
+        values = [value for key, value in items]
+        self._prefix = _shared_dirname(values)
+        self._keys = tuple(_intern(key) for key, value in items)
+        if self._prefix is None:
+            self._values = tuple(values)
+        else:
+            offset = len(self._prefix)
+            self._values = tuple(value[offset:] for value in values)
+
+    def __getitem__(self, key):
+        try:
+            index = bisect_left(self._keys, key)
+        except TypeError:
+            raise KeyError(key)
+        if index == len(self._keys) or self._keys[index] != key:
+            raise KeyError(key)
+        if self._prefix is None:
+            return self._values[index]
+        return self._prefix + self._values[index]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __reduce__(self):
+        return type(self), (self.copy(),)
+
+    def copy(self):
+        if self._prefix is None:
+            return dict(zip(self._keys, self._values))
+        return dict(zip(self._keys, (
+            self._prefix + value for value in self._values)))
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.copy())
+
+
+def _sizeof(obj, seen):
+    """
+    Return the approximate number of bytes used by obj along with the
+    containers, strings and other values held by it, excluding those
+    with their id in seen, which will be updated.  Other objects (e.g.
+    modules or instances of other classes) are referenced and not owned,
+    so their contents are not counted.
+    """
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        children = chain(obj.keys(), obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    elif isinstance(obj, CompactRecord):
+        children = (obj._prefix, obj._keys, obj._values)
+    elif isinstance(obj, PackageKeyMapping):
+        children = (vars(obj),)
+    else:
+        return size
+    return size + sum(_sizeof(child, seen) for child in children)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def dist_fingerprint(dist):
+    """
+    Return the fingerprint of a distribution, which is derived from its
+    location, and the path and modification time of its metadata
+    directory, such that upgrading or reinstalling the package, or
+    regenerating the metadata of a package installed in development
+    mode, will change the result.  The version is not used directly as
+    that may require the metadata to be read.
+    """
+
+    egg_info = getattr(dist, 'egg_info', None)
+    return (getattr(dist, 'location', None), egg_info, _mtime(egg_info))
+
+
+def _is_overridden(inst, name, base):
+    # Check whether the named attribute for the type of the instance is
+    # provided by a class other than the specified base class.
+    for cls in type(inst).__mro__:
+        if name in vars(cls):
+            return cls is not base
+    return False
+
+
 class BaseRegistry(object):
     """
     A base registry implementation that make use of ``pkg_resources``
@@ -137,9 +420,21 @@ class BaseRegistry(object):
         # The container for the resolved item.
         self.records = OrderedDict()
         self.registry_name = registry_name
+        # locks for the records being built on demand, by their name.
+        self._record_locks = {}
+        self._record_locks_guard = threading.Lock()
+        # serializes the refreshes, which rebuild the records in place.
+        self._refresh_lock = threading.RLock()
         _working_set = kw.pop('_working_set', working_set)
+        self._working_set = _working_set
         self.raw_entry_points = [] if _working_set is None else list(
             _working_set.iter_entry_points(self.registry_name))
+        # the fingerprints of the distributions that provided the entry
+        # points, for the detection of changes by refresh.
+        self.dist_fingerprints = self._fingerprint_entry_points(
+            self.raw_entry_points)
+        # incremented by every refresh that changed the records.
+        self.generation = 0
         self._init(*a, **kw)
 
     def _init(self, *a, **kw):
@@ -163,22 +458,33 @@ class BaseRegistry(object):
             len(entry_points), self.registry_name,
         )
         for entry_point in entry_points:
-            try:
-                logger.debug(
-                    "registering entry point '%s' from '%s'",
-                    entry_point, entry_point.dist,
-                )
-                self._init_entry_point(entry_point)
-            except ImportError:
-                logger.warning(
-                    'ImportError: %s not found; skipping registration',
-                    entry_point.module_name)
-            except Exception:
-                logger.exception(
-                    "registration of entry point '%s' from '%s' to registry "
-                    "'%s' failed with the following exception",
-                    entry_point, entry_point.dist, self.registry_name,
-                )
+            logger.debug(
+                "registering entry point '%s' from '%s'",
+                entry_point, entry_point.dist,
+            )
+            self._call_for_entry_point(
+                entry_point, self._init_entry_point, entry_point)
+
+    def _call_for_entry_point(self, entry_point, f, *a):
+        """
+        Call f with the arguments for the registration of entry_point,
+        with the failures logged; return a 2-tuple of whether the call
+        succeeded and its result.
+        """
+
+        try:
+            return True, f(*a)
+        except ImportError:
+            logger.warning(
+                'ImportError: %s not found; skipping registration',
+                entry_point.module_name)
+        except Exception:
+            logger.exception(
+                "registration of entry point '%s' from '%s' to registry "
+                "'%s' failed with the following exception",
+                entry_point, entry_point.dist, self.registry_name,
+            )
+        return False, None
 
     def _init_entry_point(self, entry_point):
         """
@@ -188,12 +494,126 @@ class BaseRegistry(object):
     def get_record(self, name):
         raise NotImplementedError
 
+    def _fingerprint_entry_points(self, entry_points):
+        results = {}
+        for entry_point in entry_points:
+            if entry_point.dist is None:
+                continue
+            fingerprint, declared = results.get(
+                entry_point.dist.project_name,
+                (dist_fingerprint(entry_point.dist), ()))
+            results[entry_point.dist.project_name] = (
+                fingerprint, declared + (str(entry_point),))
+        return results
+
+    def _scan_distributions(self):
+        """
+        Return the set of the names of the distributions that provided
+        entry points for this registry which have been added, removed
+        or changed since the last refresh, along with the current entry
+        points and their fingerprints.
+        """
+
+        if self._working_set is None:
+            return set(), self.raw_entry_points, self.dist_fingerprints
+        entry_points = list(
+            self._working_set.iter_entry_points(self.registry_name))
+        fingerprints = self._fingerprint_entry_points(entry_points)
+        changed = set(
+            name for name in set(fingerprints) | set(self.dist_fingerprints)
+            if fingerprints.get(name) != self.dist_fingerprints.get(name)
+        )
+        return changed, entry_points, fingerprints
+
+    def refresh(self):
+        """
+        Bring the records up to date with the working set, such that
+        the entry points provided by the distributions that have been
+        added, removed or changed since construction (or the previous
+        refresh) are registered again.  Return the set of the names of
+        those distributions.
+        """
+
+        with self._refresh_lock:
+            changed, entry_points, fingerprints = self._scan_distributions()
+            if changed:
+                logger.debug(
+                    "refreshing registry '%s' for changed distributions: %s",
+                    self.registry_name, ', '.join(sorted(changed)),
+                )
+                self.raw_entry_points = entry_points
+                self.dist_fingerprints = fingerprints
+                self._refresh(changed)
+                self.generation += 1
+            return changed
+
+    def _refresh(self, changed):
+        """
+        Re-register the records after raw_entry_points have been updated
+        with the current entry points, with changed being the set of the
+        names of the distributions that changed.  The default
+        implementation rebuilds all records through _init.
+        """
+
+        self.records = OrderedDict()
+        self._init()
+
+    def _build_record(self, name, factory):
+        """
+        Return the record for name, building it through factory if it
+        is not already in records.  Concurrent callers for the same name
+        will wait for the build in progress rather than starting their
+        own, such that factory is invoked at most once per name unless
+        it fails to produce a record (i.e. returns None).
+        """
+
+        try:
+            return self.records[name]
+        except KeyError:
+            pass
+        with self._record_locks_guard:
+            # reentrant, such that a factory may look up other records
+            # from this registry.
+            lock = self._record_locks.setdefault(name, threading.RLock())
+        with lock:
+            if name in self.records:
+                return self.records[name]
+            record = factory(name)
+            if record is not None:
+                self.records[name] = record
+            return record
+
     def get(self, name):
         return self.get_record(name)
 
     def iter_records(self):
         raise NotImplementedError
 
+    # the attributes that hold the data retained by the registry, for
+    # the accounting done by memory_report.
+    memory_report_attributes = ('records',)
+
+    def memory_report(self):
+        """
+        Return a dict with the number of records in this registry, and
+        the approximate number of bytes retained by the attributes that
+        hold them, in total and for each of the attributes.  Objects
+        referenced by more than one attribute are only counted once.
+        """
+
+        return self._memory_report(set())
+
+    def _memory_report(self, seen):
+        attributes = {}
+        for name in self.memory_report_attributes:
+            attributes[name] = _sizeof(getattr(self, name, None), seen)
+        return {
+            'registry_name': self.registry_name,
+            'records': len(self.records),
+            'bytes': sum(attributes.values()),
+            'attributes': attributes,
+        }
+
 
 class BasePkgRefRegistry(BaseRegistry):
     """
@@ -201,11 +621,27 @@ class BasePkgRefRegistry(BaseRegistry):
     packages.
     """
 
+    memory_report_attributes = ('records', 'package_module_map')
+
     def __init__(self, registry_name, *a, **kw):
         super(BasePkgRefRegistry, self).__init__(registry_name, *a, **kw)
         self.package_module_map = PackageKeyMapping()
         self.register_entry_points(self.raw_entry_points)
 
+    def _reset_records(self):
+        self.records = OrderedDict()
+        self.package_module_map = PackageKeyMapping()
+
+    def _refresh(self, changed):
+        """
+        As the records of a package may not be separable from the rest
+        in general, all entry points are registered again; subclasses
+        should override this to only register the changed ones.
+        """
+
+        self._reset_records()
+        self.register_entry_points(self.raw_entry_points)
+
     def register_entry_points(self, entry_points):
         """
         Register all entry_points provided by the list, if and only if
@@ -270,6 +706,22 @@ class BasePkgRefRegistry(BaseRegistry):
             yield item
 
 
+# the owner of a source file registered to a module registry.
+SourcepathRecord = namedtuple('SourcepathRecord', [
+    'modname', 'module_name', 'package_name'])
+
+
+def _sourcepath_key(path):
+    # the normalized directory (interned, such that it is shared by all
+    # the files within) and the filename of path.
+    try:
+        head, tail = split(normcase(normpath(path)))
+    except (AttributeError, TypeError):
+        # not a path, so not something that may be indexed.
+        return None
+    return _intern(head), tail
+
+
 class BaseModuleRegistry(BasePkgRefRegistry):
     """
     Extending off the BasePkgRefRegistry, ensure that there is a
@@ -277,17 +729,126 @@ class BaseModuleRegistry(BasePkgRefRegistry):
     of the target.
     """
 
+    def __init__(self, registry_name, *a, **kw):
+        # the reverse lookup of the records, from the normalized source
+        # path to the SourcepathRecord for it, with the filenames nested
+        # under their directories.
+        self.sourcepath_index = {}
+        super(BaseModuleRegistry, self).__init__(registry_name, *a, **kw)
+
+    memory_report_attributes = (
+        'records', 'package_module_map', 'sourcepath_index')
+
+    # store the records of each module as a read-only CompactRecord to
+    # reduce the memory retained; only for the subclasses that never
+    # modify the stored records in place, hence not enabled by default.
+    compact_records = False
+
+    # the number of threads for the mapping of the modules of the entry
+    # points; None to use the CALMJS_REGISTRY_WORKERS environment
+    # variable, with anything less than 2 meaning serial registration.
+    registration_workers = None
+
+    def get_registration_workers(self):
+        if self.registration_workers is not None:
+            return self.registration_workers
+        value = os.environ.get(CALMJS_REGISTRY_WORKERS)
+        if not value:
+            return 0
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning(
+                "ignoring invalid %s value %r", CALMJS_REGISTRY_WORKERS, value)
+            return 0
+
+    def register_entry_points(self, entry_points):
+        """
+        Register all entry_points provided by the list, if and only if
+        the associated module can be imported.
+
+        If more than one registration worker is configured, the mapping
+        of the modules (i.e. the walking of the directories for the
+        files) will be done in a pool of threads, while the imports and
+        the merging of the records remain serialized in the order of
+        the entry points, such that the result will be identical to the
+        serial registration.  Subclasses that override
+        register_entry_point or _register_entry_point_module are always
+        registered serially.
+        """
+
+        workers = self.get_registration_workers()
+        if workers < 2 or len(entry_points) < 2 or _is_overridden(
+                self, 'register_entry_point', BaseModuleRegistry) or (
+                self._overrides_entry_point_module()):
+            return super(BaseModuleRegistry, self).register_entry_points(
+                entry_points)
+
+        logger.debug(
+            "registering %d entry points for registry '%s' using %d threads",
+            len(entry_points), self.registry_name, workers,
+        )
+        pool = ThreadPool(workers)
+        try:
+            pending = []
+            for entry_point in entry_points:
+                logger.debug(
+                    "registering entry point '%s' from '%s'",
+                    entry_point, entry_point.dist,
+                )
+                ok, result = self._call_for_entry_point(
+                    entry_point, self._prepare_entry_point_records_map,
+                    entry_point, pool)
+                if ok:
+                    pending.append((entry_point, result))
+
+            for entry_point, result in pending:
+                self._call_for_entry_point(
+                    entry_point, self._register_pending_records_map,
+                    entry_point, result)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _prepare_entry_point_records_map(self, entry_point, pool):
+        # return the records map from the index, or the pending result
+        # for the mapping of the imported module done by the pool.
+        records_map = self.read_entry_point_index(entry_point)
+        if records_map is not None:
+            return records_map
+        module = _import_module(entry_point.module_name)
+        return pool.apply_async(
+            self._map_entry_point_module, (entry_point, module))
+
+    def _register_pending_records_map(self, entry_point, result):
+        records_map = result if isinstance(result, dict) else result.get()
+        self._register_records_map(entry_point, records_map)
+
     def register_entry_point(self, entry_point):
         """
         Register a lone entry_point
 
-        Will raise ImportError if the entry_point leads to an invalid
-        import.
+        The precomputed module index shipped with the distribution of
+        the entry_point will be used if it is available and valid,
+        otherwise the module will be imported and registered through
+        _register_entry_point_module.  The index is not used for the
+        subclasses that override that method, as the module must be
+        provided to it.  Will raise ImportError if the entry_point leads
+        to an invalid import.
         """
 
+        if not self._overrides_entry_point_module():
+            records_map = self.read_entry_point_index(entry_point)
+            if records_map is not None:
+                self._register_records_map(entry_point, records_map)
+                return
         module = _import_module(entry_point.module_name)
         self._register_entry_point_module(entry_point, module)
 
+    def _overrides_entry_point_module(self):
+        return _is_overridden(
+            self, '_register_entry_point_module', BaseModuleRegistry)
+
     def _register_entry_point_module(self, entry_point, module):
         """
         Private method that registers an entry_point with a provided
@@ -295,6 +856,14 @@ class BaseModuleRegistry(BasePkgRefRegistry):
         """
 
         records_map = self._map_entry_point_module(entry_point, module)
+        self._register_records_map(entry_point, records_map)
+
+    def _register_records_map(self, entry_point, records_map):
+        """
+        Private method that registers the records map produced for an
+        entry_point.
+        """
+
         self.store_records_for_package(entry_point, list(records_map.keys()))
 
         for module_name, records in records_map.items():
@@ -308,13 +877,198 @@ class BaseModuleRegistry(BasePkgRefRegistry):
                     set(self.records[module_name].keys()) &
                     set(records.keys())
                 ))
-                self.records[module_name].update(records)
+                self._unindex_sourcepaths(
+                    module_name, self.records[module_name], records)
+                self.records[module_name] = self._store_record(
+                    records, self.records[module_name])
             else:
                 logger.debug(
                     "adding records for module '%s' to registry '%s'",
                     module_name, self.registry_name,
                 )
-                self.records[module_name] = records
+                self.records[_intern(module_name)] = self._store_record(
+                    records)
+            self._index_sourcepaths(entry_point, module_name, records)
+
+    def _store_record(self, records, current=None):
+        """
+        Return the record to be stored for the records of a module,
+        applied on top of the current record if provided.
+        """
+
+        if not self.compact_records:
+            if current is None:
+                return records
+            current.update(records)
+            return current
+        if current is not None:
+            merged = dict(current)
+            merged.update(records)
+            records = merged
+        return CompactRecord(records)
+
+    def _index_sourcepaths(self, entry_point, module_name, records):
+        package_name = (
+            None if entry_point.dist is None else
+            entry_point.dist.project_name
+        )
+        for modname, path in records.items():
+            key = _sourcepath_key(path)
+            if key is not None:
+                self.sourcepath_index.setdefault(key[0], {})[key[1]] = (
+                    SourcepathRecord(
+                        _intern(modname), _intern(module_name), package_name))
+
+    def _unindex_sourcepaths(self, module_name, current, records):
+        # drop the entries for the paths that are being replaced.
+        for modname, path in current.items():
+            if modname not in records or records[modname] == path:
+                continue
+            key = _sourcepath_key(path)
+            entry = self._get_sourcepath(key)
+            if entry and entry[:2] == (modname, module_name):
+                self._pop_sourcepath(key)
+
+    def _get_sourcepath(self, key):
+        if key is None:
+            return None
+        return self.sourcepath_index.get(key[0], {}).get(key[1])
+
+    def _pop_sourcepath(self, key):
+        if key is None:
+            return
+        entries = self.sourcepath_index.get(key[0], {})
+        entries.pop(key[1], None)
+        if not entries:
+            self.sourcepath_index.pop(key[0], None)
+
+    def _reset_records(self):
+        super(BaseModuleRegistry, self)._reset_records()
+        self.sourcepath_index = {}
+
+    def _refresh(self, changed):
+        """
+        Only the entry points of the changed distributions are registered
+        again, unless their modules (before or after the change) are
+        also declared by distributions that have not changed, as the
+        records of those modules cannot be separated, which will require
+        all entry points to be registered again.
+        """
+
+        normalize = self.package_module_map.normalize
+        changed_keys = set(normalize(name) for name in changed)
+
+        def is_shared():
+            modules = set()
+            for name in changed_keys:
+                modules.update(self.package_module_map.get(name, ()))
+            return any(modules.intersection(module_names) for (
+                name, module_names) in self.package_module_map.items()
+                if name not in changed_keys)
+
+        if is_shared():
+            return super(BaseModuleRegistry, self)._refresh(changed)
+
+        for name in changed_keys:
+            for module_name in self.package_module_map.pop(name, ()):
+                for path in self.records.pop(module_name, {}).values():
+                    self._pop_sourcepath(_sourcepath_key(path))
+        self.register_entry_points([
+            entry_point for entry_point in self.raw_entry_points
+            if entry_point.dist is not None and
+            normalize(entry_point.dist.project_name) in changed_keys
+        ])
+        if is_shared():
+            return super(BaseModuleRegistry, self)._refresh(changed)
+
+    def lookup_sourcepath(self, path):
+        """
+        Return the SourcepathRecord of the modname, the module name and
+        the package name that registered the source file at path, or
+        None if it is not registered to this registry.
+        """
+
+        return self._get_sourcepath(_sourcepath_key(path))
+
+    def index_entry_point(self, entry_point):
+        """
+        Produce the records map for the entry_point for the precomputed
+        module index, with the paths made relative to the directory the
+        module is imported from, using '/' as the separator.
+
+        Return None if the records cannot be indexed.
+        """
+
+        module = _import_module(entry_point.module_name)
+        root = _module_import_root(module)
+        if root is None:
+            return None
+
+        result = {}
+        records_map = self._map_entry_point_module(entry_point, module)
+        for module_name, records in records_map.items():
+            result[module_name] = relative = {}
+            for modname, path in records.items():
+                try:
+                    path = relpath(path, root)
+                except (AttributeError, TypeError, ValueError):
+                    return None
+                if path.split(sep)[0] == pardir:
+                    return None
+                relative[modname] = '/'.join(path.split(sep))
+        return result
+
+    def read_entry_point_index(self, entry_point):
+        """
+        Return the records map for the entry_point from the precomputed
+        module index of its distribution, or None if no valid index is
+        available.  Development distributions are never considered as
+        their files may change at any time.
+        """
+
+        # TODO see the comment on the import of registry.get in the
+        # BaseChildModuleRegistry constructor.
+        from calmjs.dist import read_dist_module_index
+
+        dist = entry_point.dist
+        if (dist is None or not dist.location or
+                dist.precedence == DEVELOP_DIST):
+            return None
+
+        # the cached index is shared, only the records produced from it
+        # for this entry_point are new.
+        index = read_dist_module_index(dist)
+        try:
+            relative_map = index[self.registry_name][str(entry_point)]
+            records_map = {
+                module_name: {
+                    modname: join(dist.location, *path.split('/'))
+                    for modname, path in records.items()
+                }
+                for module_name, records in relative_map.items()
+            }
+        except (AttributeError, KeyError, TypeError):
+            return None
+
+        # the files of the distribution may not be found at its location
+        # (e.g. editable installs using path hooks), so ensure that the
+        # directories are present.
+        for path in set(
+                dirname(path) for records in records_map.values()
+                for path in records.values()):
+            if not isdir(path):
+                logger.debug(
+                    "module index for entry_point '%s' from '%s' references "
+                    "missing directory '%s'; ignoring index",
+                    entry_point, dist, path,
+                )
+                return None
+
+        logger.debug(
+            "using module index for entry_point '%s' from '%s' for "
+            "registry '%s'", entry_point, dist, self.registry_name,
+        )
+        return records_map
 
     def _map_entry_point_module(self, entry_point, module):
         """
@@ -346,6 +1100,33 @@ class BaseModuleRegistry(BasePkgRefRegistry):
             result.update(self.get_record(name))
         return result
 
+    def get_record_view(self, name):
+        """
+        Get a read-only view of the record by name, without copying.
+
+        The view reflects further registration to the same name; use
+        get_record if an independent copy is required.
+        """
+
+        if _is_overridden(self, 'get_record', BaseModuleRegistry):
+            return MappingProxyType(self.get_record(name))
+        return RecordView(self.records, name)
+
+    def get_records_view_for_package(self, package_name):
+        """
+        Get a read-only view of all records identified by package, with
+        the same precedence as get_records_for_package but without
+        copying the underlying records.
+        """
+
+        if _is_overridden(self, 'get_records_for_package', BaseModuleRegistry):
+            return MappingProxyType(self.get_records_for_package(
+                package_name))
+        return ChainedRecordsView(
+            self.get_record_view(name)
+            for name in self.package_module_map.get(package_name, ())
+        )
+
 
 class BaseChildModuleRegistry(BaseModuleRegistry):
     """
@@ -378,6 +1159,30 @@ class BaseChildModuleRegistry(BaseModuleRegistry):
                     registry_name, parent_name)
             )
         super(BaseChildModuleRegistry, self).__init__(registry_name, *a, **kw)
+        self._parent_generation = self.parent.generation
+
+    def refresh(self):
+        """
+        As the records are derived from the parent registry, they will
+        also be registered again if the parent has been refreshed since.
+        Concurrent callers will wait for the refresh in progress, such
+        that the records are only registered again once.
+        """
+
+        with self._refresh_lock:
+            changed = super(BaseChildModuleRegistry, self).refresh()
+            parent_generation = self.parent.generation
+            if not changed and self._parent_generation != parent_generation:
+                self._refresh(changed)
+                self.generation += 1
+            self._parent_generation = parent_generation
+            return changed
+
+    def _refresh(self, changed):
+        # the records for the modules of a distribution may be derived
+        # from any of the entry points, so all of them are registered
+        # again.
+        BasePkgRefRegistry._refresh(self, changed)
 
     def resolve_parent_registry_name(self, registry_name, suffix):
         """
@@ -428,7 +1233,50 @@ class BaseExternalModuleRegistry(BasePkgRefRegistry):
         # the record is stored as an inverse mapping to the set of
         # paths that called on that module_name.
         self.records[entry_point.module_name] = self.records.get(
-            entry_point.module_name, set()).union(paths)
+            entry_point.module_name, frozenset()).union(paths)
+
+    def _store_entry_point_record(self, entry_point):
+        self.store_record(entry_point, self.process_entry_point(entry_point))
+
+    def _refresh(self, changed):
+        """
+        Only the records of the modules declared by the changed
+        distributions (before or after the change) are built again, from
+        all the current entry points declaring those modules, with the
+        entry points of the changed distributions registered again.
+        """
+
+        if _is_overridden(
+                self, 'register_entry_point', BaseExternalModuleRegistry):
+            return super(BaseExternalModuleRegistry, self)._refresh(changed)
+
+        normalize = self.package_module_map.normalize
+        changed_keys = set(normalize(name) for name in changed)
+
+        def is_changed(entry_point):
+            return entry_point.dist is not None and normalize(
+                entry_point.dist.project_name) in changed_keys
+
+        paths = set()
+        for name in changed_keys:
+            paths.update(self.package_module_map.pop(name, ()))
+        module_names = set(
+            module_name for module_name, record in self.records.items()
+            if paths.intersection(record)
+        )
+        module_names.update(
+            entry_point.module_name for entry_point in self.raw_entry_points
+            if is_changed(entry_point))
+        for module_name in module_names:
+            self.records.pop(module_name, None)
+
+        for entry_point in self.raw_entry_points:
+            if entry_point.module_name not in module_names:
+                continue
+            self._call_for_entry_point(entry_point, (
+                self.register_entry_point if is_changed(entry_point) else
+                self._store_entry_point_record
+            ), entry_point)
 
     def process_entry_point(self, entry_point):
         """
@@ -457,6 +1305,21 @@ class BaseExternalModuleRegistry(BasePkgRefRegistry):
         result.extend(self.package_module_map.get(package_name))
         return result
 
+    def get_record_view(self, name):
+        """
+        Get the record for the registered name as a frozenset, without
+        copying.
+        """
+
+        return self.records.get(name, frozenset())
+
+    def get_records_view_for_package(self, package_name):
+        """
+        Get all records identified by package as a tuple.
+        """
+
+        return tuple(self.package_module_map.get(package_name, ()))
+
 
 class BaseDriver(object):
     """
@@ -685,7 +1548,11 @@ class BaseDriver(object):
         call_kw = self._gen_call_kws(**env)
         call_args = [self._get_exec_binary(call_kw)]
         call_args.extend(args)
-        return fork_exec(call_args, stdin, **call_kw)
+        if not tracer.enabled:
+            return fork_exec(call_args, stdin, **call_kw)
+        with tracer.span(
+                binary, 'driver', args=' '.join(map(str, call_args))):
+            return fork_exec(call_args, stdin, **call_kw)
 
     @property
     def cwd(self):
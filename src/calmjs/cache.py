@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable build cache for artifacts and compile outputs.
+
+A build cache maps the fingerprint of the inputs for some unit of work
+(e.g. an artifact or the output of a transpiled module) to the blob
+that was produced, such that any build host that is configured to use
+the same cache may skip that work.  The storage is provided by the
+backends, which only need to implement ``get`` and ``put`` for the
+blobs by their keys; a backend for a shared filesystem and a backend
+for a simple HTTP server (where the blobs are retrieved by ``GET`` and
+stored by ``PUT`` requests at the URL of the key relative to the base
+URL) are provided.
+
+Every blob is stored with a header containing the digest of its
+contents, which is verified when the blob is retrieved such that any
+corrupted or truncated blobs will be treated as absent.
+
+The cache is enabled by setting the ``CALMJS_BUILD_CACHE`` environment
+variable to either a path or a HTTP URL, with the ``CALMJS_BUILD_CACHE_MODE``
+environment variable set to either ``read-write`` (the default) or
+``read-only``, the latter of which will never store anything.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import json
+import os
+import tempfile
+from logging import getLogger
+from os.path import abspath
+from os.path import dirname
+from os.path import exists
+from os.path import isabs
+from os.path import isdir
+from os.path import join
+from os.path import normpath
+from os.path import realpath
+from os.path import relpath
+
+try:  # pragma: no cover
+    from http.client import HTTPException
+    from urllib.request import Request
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    from urllib.error import URLError
+except ImportError:  # pragma: no cover
+    from httplib import HTTPException
+    from urllib2 import Request
+    from urllib2 import urlopen
+    from urllib2 import HTTPError
+    from urllib2 import URLError
+
+from calmjs.store import source_digest
+
+logger = getLogger(__name__)
+
+CALMJS_BUILD_CACHE = 'CALMJS_BUILD_CACHE'
+CALMJS_BUILD_CACHE_MODE = 'CALMJS_BUILD_CACHE_MODE'
+READ_ONLY = 'read-only'
+READ_WRITE = 'read-write'
+MODES = (READ_ONLY, READ_WRITE)
+
+_BLOB_MAGIC = b'calmjs-cache-1'
+
+
+def fingerprint(*parts):
+    """
+    Return the fingerprint for the JSON serializable parts.
+    """
+
+    return hashlib.sha256(json.dumps(
+        parts, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def pack(header, blobs=()):
+    """
+    Pack the JSON serializable header and the list of blobs (bytes)
+    into a single blob.
+    """
+
+    blobs = list(blobs)
+    meta = json.dumps({
+        'header': header,
+        'sizes': [len(blob) for blob in blobs],
+    }).encode('utf8')
+    return b'\n'.join([meta, b''.join(blobs)])
+
+
+def unpack(data):
+    """
+    The reverse of pack; return the header and the list of blobs.
+    Raises ValueError if the data is malformed.
+    """
+
+    meta, _, payload = data.partition(b'\n')
+    meta = json.loads(meta.decode('utf8'))
+    blobs = []
+    offset = 0
+    for size in meta['sizes']:
+        blobs.append(payload[offset:offset + size])
+        offset += size
+    if offset != len(payload):
+        raise ValueError('size of payload does not match')
+    return meta['header'], blobs
+
+
+def seal(data):
+    """
+    Prefix the data with the header containing its digest.
+    """
+
+    return b' '.join([
+        _BLOB_MAGIC, hashlib.sha256(data).hexdigest().encode('ascii'),
+    ]) + b'\n' + data
+
+
+def verify(blob):
+    """
+    Return the data from the sealed blob if it matches the digest in
+    its header; otherwise raise ValueError.
+    """
+
+    header, _, data = blob.partition(b'\n')
+    magic, _, digest = header.partition(b' ')
+    if magic != _BLOB_MAGIC:
+        raise ValueError('not a calmjs cache blob')
+    if hashlib.sha256(data).hexdigest().encode('ascii') != digest:
+        raise ValueError('digest mismatch')
+    return data
+
+
+def _sourcemap_path(value, map_path):
+    # the absolute path referenced by the value in the source map.
+    return normpath(abspath(join(dirname(map_path), value)))
+
+
+def sourcemap_anchors(blob, map_path, source, build_dir):
+    """
+    Return a dict with the anchors for the paths in the source map at
+    map_path (with blob being its contents) that reference the source
+    or a file inside the build_dir, for the ``file`` key and for each of
+    the ``sources`` by their index; each anchor is a list of the name of
+    the anchor (``source`` or ``build_dir``), the path relative to it,
+    and whether the path was absolute.  An empty dict is returned if
+    there is nothing to be relocated.
+    """
+
+    try:
+        sourcemap = json.loads(blob.decode('utf8'))
+        values = [('file', sourcemap.get('file'))] + [
+            (str(index), value)
+            for index, value in enumerate(sourcemap.get('sources') or [])]
+    except (ValueError, AttributeError, TypeError):
+        return {}
+
+    source = normpath(abspath(source))
+    build_dir = normpath(abspath(build_dir))
+    anchors = {}
+    for key, value in values:
+        if not isinstance(value, (type(u''), str)):
+            continue
+        path = _sourcemap_path(value, map_path)
+        if path == source:
+            anchors[key] = ['source', '', isabs(value)]
+        elif path.startswith(join(build_dir, '')):
+            anchors[key] = [
+                'build_dir', relpath(path, build_dir), isabs(value)]
+    return anchors
+
+
+def relocate_sourcemap(blob, anchors, map_path, source, build_dir):
+    """
+    Return the contents of the source map with the paths at the anchors
+    (as produced by sourcemap_anchors) relocated to the source and the
+    build_dir, for the source map to be written to map_path.
+    """
+
+    sourcemap = json.loads(blob.decode('utf8'))
+    roots = {
+        'source': normpath(abspath(source)),
+        'build_dir': normpath(abspath(build_dir)),
+    }
+    for key, (anchor, path, absolute) in anchors.items():
+        path = normpath(join(roots[anchor], path)) if path else roots[anchor]
+        if not absolute:
+            path = relpath(path, dirname(abspath(map_path))).replace(
+                os.sep, '/')
+        if key == 'file':
+            sourcemap['file'] = path
+        else:
+            sourcemap['sources'][int(key)] = path
+    return json.dumps(sourcemap).encode('utf8')
+
+
+class BaseCacheBackend(object):
+    """
+    The interface for the storage of the blobs of a build cache.
+    """
+
+    def get(self, key):
+        """
+        Return the blob for the key, or None if absent.
+        """
+
+        raise NotImplementedError
+
+    def put(self, key, blob):
+        """
+        Store the blob under the key.
+        """
+
+        raise NotImplementedError
+
+
+class FilesystemCacheBackend(BaseCacheBackend):
+    """
+    Blobs stored as files inside a directory, which may be shared.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.root)
+
+    def path_for(self, key):
+        return join(self.root, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self.path_for(key), 'rb') as fd:
+                return fd.read()
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, blob):
+        directory = join(self.root, key[:2])
+        if not isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(blob)
+        os.rename(tmp, self.path_for(key))
+
+
+class HTTPCacheBackend(BaseCacheBackend):
+    """
+    Blobs retrieved and stored through GET and PUT requests on the URLs
+    for the keys, relative to the base URL.
+    """
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/') + '/'
+        self.timeout = timeout
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.url)
+
+    def get(self, key):
+        try:
+            response = urlopen(self.url + key, timeout=self.timeout)
+            try:
+                return response.read()
+            finally:
+                response.close()
+        except HTTPError as e:
+            if e.code != 404:
+                raise IOError('GET %s%s failed: %s' % (self.url, key, e))
+            return None
+        except URLError as e:
+            raise IOError('GET %s%s failed: %s' % (self.url, key, e.reason))
+        except HTTPException as e:
+            # e.g. IncompleteRead for a truncated response.
+            raise IOError('GET %s%s failed: %r' % (self.url, key, e))
+
+    def put(self, key, blob):
+        request = Request(self.url + key, data=blob, headers={
+            'Content-Type': 'application/octet-stream'})
+        request.get_method = lambda: 'PUT'
+        try:
+            urlopen(request, timeout=self.timeout).close()
+        except (HTTPError, URLError, HTTPException) as e:
+            raise IOError('PUT %s%s failed: %s' % (
+                self.url, key, getattr(e, 'reason', None) or repr(e)))
+
+
+def backend_for(location):
+    """
+    Return the backend for the location, which is either a HTTP URL or
+    a path.
+    """
+
+    if location.startswith(('http://', 'https://')):
+        return HTTPCacheBackend(location)
+    if location.startswith('file://'):
+        location = location[len('file://'):]
+    return FilesystemCacheBackend(location)
+
+
+class BuildCache(object):
+    """
+    The build cache, which stores and verifies the blobs through the
+    backend, with failures from the backend logged and treated as if
+    the blob is absent.
+    """
+
+    def __init__(self, backend, mode=READ_WRITE):
+        if mode not in MODES:
+            raise ValueError('mode must be one of %r' % (MODES,))
+        self.backend = backend
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<%s %r %s>' % (type(self).__name__, self.backend, self.mode)
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """
+        Return the build cache as configured by the environment
+        variables, or None if not configured.
+        """
+
+        environ = os.environ if environ is None else environ
+        location = environ.get(CALMJS_BUILD_CACHE)
+        if not location:
+            return None
+        mode = environ.get(CALMJS_BUILD_CACHE_MODE) or READ_WRITE
+        if mode not in MODES:
+            logger.warning(
+                "ignoring invalid %s value %r; using '%s'",
+                CALMJS_BUILD_CACHE_MODE, mode, READ_WRITE)
+            mode = READ_WRITE
+        return cls(backend_for(location), mode=mode)
+
+    @property
+    def writable(self):
+        return self.mode == READ_WRITE
+
+    def get(self, key):
+        """
+        Return the verified data for the key, or None.
+        """
+
+        try:
+            blob = self.backend.get(key)
+        except (IOError, OSError) as e:
+            logger.warning("failed to retrieve '%s' from %r: %s", key, self, e)
+            blob = None
+        if blob is not None:
+            try:
+                data = verify(blob)
+            except ValueError as e:
+                logger.warning(
+                    "discarding blob '%s' from %r: %s", key, self, e)
+            else:
+                self.hits += 1
+                return data
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """
+        Store the data for the key, if the cache is writable.
+        """
+
+        if not self.writable:
+            return False
+        try:
+            self.backend.put(key, seal(data))
+        except (IOError, OSError) as e:
+            logger.warning("failed to store '%s' into %r: %s", key, self, e)
+            return False
+        return True
+
+    def memoize(
+            self, namespace, process_name, processor, config=None,
+            reused=None):
+        """
+        Wrap the processor for the compile entries of the process_name,
+        such that the outputs for an entry with the same source contents
+        will be retrieved from the cache instead of being processed.
+        The namespace should identify the producer of the outputs (e.g.
+        the toolchain class), and config the JSON serializable digest
+        of its configuration (e.g. from Toolchain.config_digest).
+
+        The processor must only write the files at the targets in its
+        results (along with their source maps), relative to build_dir.
+        The paths in the source maps that reference the source or the
+        build directory will be relocated for the build that restores
+        them.  If provided, reused will be called with the spec, the
+        entry and the results for every entry restored from the cache.
+        """
+
+        def wrapper(spec, entry):
+            modname, source, target, modpath = entry
+            digest = source_digest(source)
+            if digest is None:
+                return processor(spec, entry)
+            # the spec keys are as defined by calmjs.toolchain
+            key = fingerprint(
+                namespace, process_name, config, modname, target, modpath,
+                digest, bool(spec.get('generate_source_map')))
+            build_dir = spec['build_dir']
+            data = self.get(key)
+            if data is not None:
+                try:
+                    result = self._restore(build_dir, source, data)
+                    logger.debug(
+                        "restored the outputs for '%s' from %r",
+                        modname, self)
+                except (ValueError, KeyError, IOError, OSError) as e:
+                    logger.warning(
+                        "failed to restore '%s' for '%s' from %r: %s",
+                        key, modname, self, e)
+                else:
+                    if reused is not None:
+                        reused(spec, entry, result)
+                    return result
+
+            result = processor(spec, entry)
+            if self.writable:
+                try:
+                    data = self._collect(build_dir, source, result)
+                except (IOError, OSError) as e:
+                    logger.debug(
+                        "not caching outputs for '%s': %s", modname, e)
+                else:
+                    self.put(key, data)
+            return result
+
+        return wrapper
+
+    def _collect(self, build_dir, source, result):
+        modpaths, targetpaths, export_module_names = result
+        names = []
+        blobs = []
+        sourcemaps = {}
+        for target in sorted(set(targetpaths.values())):
+            for name in (target, target + '.map'):
+                path = join(build_dir, normpath(name))
+                if name != target and not exists(path):
+                    continue
+                with open(path, 'rb') as fd:
+                    blob = fd.read()
+                if name != target:
+                    anchors = sourcemap_anchors(
+                        blob, path, source, build_dir)
+                    if anchors:
+                        sourcemaps[name] = anchors
+                blobs.append(blob)
+                names.append(name)
+        return pack({
+            'result': [modpaths, targetpaths, list(export_module_names)],
+            'files': names,
+            'sourcemaps': sourcemaps,
+        }, blobs)
+
+    def _restore(self, build_dir, source, data):
+        header, blobs = unpack(data)
+        build_root = realpath(build_dir)
+        sourcemaps = header.get('sourcemaps', {})
+        paths = []
+        for name in header['files']:
+            path = join(build_dir, normpath(name))
+            if not realpath(path).startswith(build_root):
+                raise ValueError('file %r is outside build_dir' % name)
+            paths.append(path)
+        for name, path, blob in zip(header['files'], paths, blobs):
+            if name in sourcemaps:
+                blob = relocate_sourcemap(
+                    blob, sourcemaps[name], path, source, build_dir)
+            directory = os.path.dirname(path)
+            if not isdir(directory):
+                os.makedirs(directory)
+            with open(path, 'wb') as fd:
+                fd.write(blob)
+        modpaths, targetpaths, export_module_names = header['result']
+        return dict(modpaths), dict(targetpaths), list(export_module_names)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+A toolchain that bundles by concatenation, without external processes.
+
+The typical toolchains that produce artifacts will pass the compiled
+modules through some Node.js based bundler in the assemble and link
+steps.  For the simpler cases where all that is needed is for all the
+compiled modules be made available through a single file, the
+``ConcatToolchain`` provided here will concatenate every compiled
+module into the ``export_target``, each wrapped by a small module
+definition that provides the CommonJS ``require``, ``exports`` and
+``module`` bindings, with a minimal loader that will only execute a
+module once it is first required.
+
+If the generation of source maps is enabled, the source map produced
+for every transpiled module is merged into a single index source map
+for the ``export_target``.
+
+Note that the module names must be absolute, as relative imports are
+not resolved by the loader.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import codecs
+import json
+import re
+from logging import getLogger
+from os.path import basename
+from os.path import dirname
+from os.path import exists
+from os.path import isfile
+from os.path import join
+from os.path import normpath
+from os.path import relpath
+
+from calmjs.toolchain import ES5Toolchain
+from calmjs.toolchain import BUILD_DIR
+from calmjs.toolchain import EXPORT_TARGET
+from calmjs.toolchain import GENERATE_SOURCE_MAP
+
+logger = getLogger(__name__)
+
+# the list of (modname, path) of the modules to be concatenated into the
+# export_target, as produced by the assemble step.
+CONCAT_MODULES = 'concat_modules'
+
+_source_mapping_url = re.compile(r'\n?//[#@] sourceMappingURL=[^\n]*\n?$')
+
+LOADER = '''\
+var __calmjs_define__ = (function(root) {
+    var factories = {}, cache = {};
+    var has = Object.prototype.hasOwnProperty;
+    function require(name) {
+        if (has.call(cache, name)) {
+            return cache[name].exports;
+        }
+        if (!has.call(factories, name)) {
+            throw new Error("module '" + name + "' not found");
+        }
+        var module = cache[name] = {exports: {}};
+        factories[name].call(
+            module.exports, require, module.exports, module);
+        return module.exports;
+    }
+    root.require = root.require || require;
+    return function(name, factory) {
+        factories[name] = factory;
+    };
+})(this);
+'''
+
+WRAPPER_HEAD = '__calmjs_define__(%s, function(require, exports, module) {\n'
+WRAPPER_TAIL = '});\n'
+
+
+def _read(path):
+    with codecs.open(path, encoding='utf8') as fd:
+        return fd.read()
+
+
+def _url_path(path):
+    return path.replace('\\', '/')
+
+
+def rebase_sourcemap(sourcemap, map_path, target_dir):
+    """
+    Return a copy of the sourcemap that was read from map_path, with
+    the sources made relative to target_dir.
+    """
+
+    result = dict(sourcemap)
+    root = join(dirname(map_path), result.pop('sourceRoot', None) or '')
+    result['sources'] = [
+        _url_path(relpath(normpath(join(root, source)), target_dir))
+        for source in sourcemap.get('sources', [])
+    ]
+    return result
+
+
+class ConcatToolchain(ES5Toolchain):
+    """
+    A toolchain that concatenates all the compiled modules into the
+    export_target, wrapped with a minimal module definition.
+    """
+
+    def prepare(self, spec):
+        if not spec.get(EXPORT_TARGET):
+            raise ValueError(
+                "'%s' must be specified for '%s'" % (
+                    EXPORT_TARGET, type(self).__name__))
+
+    def assemble(self, spec):
+        """
+        Gather the compiled modules that are to be concatenated, which
+        are all the transpiled modules along with the bundled JavaScript
+        files, ordered by their module names.
+        """
+
+        modules = {}
+        for prefix in ('bundled', 'transpiled'):
+            targets = spec.get(prefix + self.targetpath_suffix) or {}
+            for modname, target in targets.items():
+                path = join(spec[BUILD_DIR], normpath(target))
+                if not target.endswith(self.filename_suffix) or (
+                        not isfile(path)):
+                    logger.debug(
+                        "'%s' at '%s' is not a JavaScript file; "
+                        "not concatenated", modname, target)
+                    continue
+                modules[modname] = path
+        spec[CONCAT_MODULES] = sorted(modules.items())
+
+    def link(self, spec):
+        """
+        Write the concatenated modules into the export_target, along
+        with the index source map if enabled.
+        """
+
+        export_target = spec[EXPORT_TARGET]
+        target_dir = dirname(export_target)
+        generate_source_map = spec.get(GENERATE_SOURCE_MAP)
+        sections = []
+        chunks = [LOADER]
+        line = LOADER.count('\n')
+
+        for modname, path in spec[CONCAT_MODULES]:
+            code = _source_mapping_url.sub('\n', _read(path))
+            if not code.endswith('\n'):
+                code += '\n'
+            chunks.append(WRAPPER_HEAD % json.dumps(modname))
+            line += 1
+            map_path = path + '.map'
+            if generate_source_map and exists(map_path):
+                sections.append({
+                    'offset': {'line': line, 'column': 0},
+                    'map': rebase_sourcemap(
+                        json.loads(_read(map_path)), map_path, target_dir),
+                })
+            chunks.append(code)
+            chunks.append(WRAPPER_TAIL)
+            line += code.count('\n') + 1
+
+        if generate_source_map:
+            map_target = export_target + '.map'
+            chunks.append('//# sourceMappingURL=%s\n' % basename(map_target))
+            with codecs.open(map_target, 'w', encoding='utf8') as fd:
+                fd.write(json.dumps({
+                    'version': 3,
+                    'file': basename(export_target),
+                    'sections': sections,
+                }))
+
+        with codecs.open(export_target, 'w', encoding='utf8') as fd:
+            fd.write(''.join(chunks))
+        logger.info(
+            "concatenated %d modules into '%s'",
+            len(spec[CONCAT_MODULES]), export_target)
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+A long-lived build daemon for calmjs.
+
+Every invocation of the ``calmjs`` command will rebuild the root
+registry, every module, loader plugin and artifact registry, along with
+all the argument parsers for the runtimes, from scratch.  The daemon
+provided here keeps a single instance of the runtime (and thus all the
+state it has constructed) warm in a long running process, and accepts
+the requests to execute that runtime with some arguments over a local
+Unix socket.
+
+The protocol is a single line of JSON sent by the client, in the form
+of ``{"args": [...], "cwd": "...", "environ": {...}}``, with the daemon
+replying with a single line of JSON in the form of ``{"code": 0,
+"stdout": "...", "stderr": "..."}`` once the execution completes.
+Requests are executed one at a time, as the runtime makes use of global
+state (e.g. the current working directory, the environment and the
+standard streams).
+
+Before every request, the daemon checks whether the working set (i.e.
+the path entries, the installed distributions and their metadata) or
+the directories holding the sources for the module registries that
+have been constructed have changed.  Changes to the working set are
+applied through the refresh of the registries, which only registers
+again the entry points of the changed distributions, while changes to
+the sources will have all the warm state discarded and rebuilt.
+
+The ``calmjs`` command will forward its arguments to the daemon if the
+``CALMJS_DAEMON_SOCKET`` environment variable is set to the path of
+the socket of a running daemon, and will fall back to executing locally
+if the daemon cannot be reached.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+from logging import getLogger
+from os.path import dirname
+from os.path import exists
+from os.path import join
+
+from pkg_resources import working_set as default_working_set
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from calmjs import registry
+from calmjs.base import BaseModuleRegistry
+from calmjs.base import _mtime
+from calmjs.dist import metadata_cache
+from calmjs.dist import resolution_cache
+from calmjs.registry import refresh_working_set
+from calmjs.registry import working_set_fingerprint
+
+logger = getLogger(__name__)
+
+CALMJS_DAEMON_SOCKET = 'CALMJS_DAEMON_SOCKET'
+_AF_UNIX = getattr(socket, 'AF_UNIX', None)
+
+
+def default_socket_path():
+    """
+    Return the path of the socket for the daemon, which is the value of
+    the CALMJS_DAEMON_SOCKET environment variable if set, otherwise a
+    path in the temporary directory specific to the current user.
+    """
+
+    path = os.environ.get(CALMJS_DAEMON_SOCKET)
+    if path:
+        return path
+    uid = getattr(os, 'getuid', lambda: 0)()
+    return join(tempfile.gettempdir(), 'calmjs-daemon-%d.sock' % uid)
+
+
+def send_message(sock, message):
+    sock.sendall((json.dumps(message) + '\n').encode('utf8'))
+
+
+def recv_message(sock):
+    """
+    Read a single line of JSON from the socket; returns None if the
+    connection was closed before a complete message was received.
+    """
+
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return None
+        if chunk.endswith(b'\n'):
+            chunks.append(chunk)
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf8'))
+
+
+def sources_fingerprint(root=None):
+    """
+    Return a digest of the modification times of the directories that
+    contain the sources tracked by the module registries that have been
+    constructed by the root registry, such that adding, removing or
+    renaming a source file will change the result.
+    """
+
+    root = registry._inst if root is None else root
+    paths = set()
+    for name, instance in sorted(root.records.items()):
+        if not isinstance(instance, BaseModuleRegistry):
+            continue
+        for _, records in instance.iter_records():
+            paths.update(dirname(path) for path in records.values())
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        digest.update(repr((path, _mtime(path))).encode('utf8'))
+    return digest.hexdigest()
+
+
+class Daemon(object):
+    """
+    The build daemon, which keeps a runtime instance warm for the
+    execution of requests received through a Unix socket.
+    """
+
+    def __init__(
+            self, runtime_factory, path=None,
+            working_set=default_working_set):
+        """
+        Arguments:
+
+        runtime_factory
+            A callable that produces the runtime that will be used to
+            execute the requests.
+
+        path
+            The path for the Unix socket.
+
+            Default: the value returned by default_socket_path()
+
+        working_set
+            The working_set that the runtime will be making use of.
+
+            Default: pkg_resources.working_set
+        """
+
+        self.runtime_factory = runtime_factory
+        self.path = path or default_socket_path()
+        self.working_set = working_set
+        self.running = False
+        self._runtime = None
+        self._fingerprint = None
+
+    @property
+    def runtime(self):
+        if self._runtime is None:
+            self._runtime = self.runtime_factory()
+            # construct the argparser and thus all the runtimes up front
+            self._runtime.argparser
+        return self._runtime
+
+    def fingerprint(self):
+        return (
+            working_set_fingerprint(self.working_set),
+            sources_fingerprint(),
+        )
+
+    def reset(self):
+        """
+        Discard all the warm state, such that it will be rebuilt from
+        the current working set on the next request.
+        """
+
+        if self.working_set is default_working_set:
+            refresh_working_set(self.working_set)
+        resolution_cache.invalidate()
+        metadata_cache.invalidate()
+        registry._inst = registry.Registry(registry.__name__)
+        self._runtime = None
+
+    def update(self):
+        """
+        Bring the warm state up to date with the working set, where
+        only the registry records from the distributions that changed
+        will be registered again.
+        """
+
+        if self.working_set is default_working_set:
+            refresh_working_set(self.working_set)
+        resolution_cache.invalidate()
+        metadata_cache.invalidate()
+        registry._inst.refresh()
+        self._runtime = None
+
+    def refresh(self):
+        """
+        Update the warm state if only the working set has changed since
+        the previous request, or reset it if the sources have changed.
+        Return True if either was done.
+        """
+
+        fingerprint = self.fingerprint()
+        if self._fingerprint is None or self._fingerprint == fingerprint:
+            self._fingerprint = fingerprint
+            return False
+        if self._fingerprint[1] == fingerprint[1]:
+            logger.info('working set changed; updating daemon state')
+            self.update()
+        else:
+            logger.info('sources changed; resetting daemon state')
+            self.reset()
+        self._fingerprint = self.fingerprint()
+        return True
+
+    def execute(self, args, cwd=None, environ=None):
+        """
+        Execute the runtime with the provided arguments, with the
+        working directory and environment variables set up as provided
+        for the duration.  Return a dict with the exit code and the
+        contents written to stdout and stderr.
+        """
+
+        stdout, stderr = StringIO(), StringIO()
+        original_streams = sys.stdin, sys.stdout, sys.stderr
+        original_cwd = os.getcwd()
+        original_environ = dict(os.environ)
+        try:
+            if cwd:
+                os.chdir(cwd)
+        except OSError as e:
+            return {
+                'code': 2,
+                'stdout': '',
+                'stderr': 'cannot change directory to %r: %s\n' % (cwd, e),
+            }
+        try:
+            if environ is not None:
+                os.environ.clear()
+                os.environ.update(environ)
+            sys.stdin, sys.stdout, sys.stderr = StringIO(), stdout, stderr
+            try:
+                code = 0 if self.runtime(args) else 1
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (
+                    0 if e.code is None else 1)
+            except Exception:
+                logger.exception('unexpected error executing %r', args)
+                code = 1
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = original_streams
+            os.chdir(original_cwd)
+            os.environ.clear()
+            os.environ.update(original_environ)
+        return {
+            'code': code,
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+        }
+
+    def handle(self, request):
+        """
+        Handle a single request, returning the response.
+        """
+
+        args = request.get('args') if isinstance(request, dict) else None
+        if not isinstance(args, list) or not all(
+                isinstance(arg, (str, type(u''))) for arg in args):
+            return {'code': 2, 'stdout': '', 'stderr': 'invalid request\n'}
+        self.refresh()
+        return self.execute(
+            args, cwd=request.get('cwd'), environ=request.get('environ'))
+
+    def serve(self):
+        """
+        Listen on the socket and handle requests until stopped.
+        """
+
+        if _AF_UNIX is None:
+            raise OSError('Unix sockets are not supported on this platform')
+        if exists(self.path):
+            if ping(self.path):
+                raise OSError(
+                    "a daemon is already listening on '%s'" % self.path)
+            os.unlink(self.path)
+
+        server = socket.socket(_AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # the socket must never be accessible to other users, not
+            # even between the bind and the chmod.
+            umask = os.umask(0o077)
+            try:
+                server.bind(self.path)
+            finally:
+                os.umask(umask)
+            os.chmod(self.path, 0o600)
+            server.listen(8)
+            # construct everything before accepting requests.
+            self.runtime
+            self._fingerprint = self.fingerprint()
+            self.running = True
+            logger.info("calmjs daemon listening on '%s'", self.path)
+            while self.running:
+                connection, _ = server.accept()
+                try:
+                    self.serve_connection(connection)
+                finally:
+                    connection.close()
+        finally:
+            self.running = False
+            server.close()
+            if exists(self.path):
+                os.unlink(self.path)
+
+    def serve_connection(self, connection):
+        try:
+            request = recv_message(connection)
+        except ValueError:
+            request = None
+        if isinstance(request, dict) and request.get('ping'):
+            send_message(connection, {'pong': True})
+            return
+        if isinstance(request, dict) and request.get('shutdown'):
+            self.running = False
+            send_message(connection, {'code': 0})
+            return
+        send_message(connection, self.handle(request))
+
+
+def _connect(path, timeout=None):
+    # return the client socket connected to the daemon, or None if the
+    # daemon could not be reached.
+    if _AF_UNIX is None or not path:
+        return None
+    client = socket.socket(_AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(timeout)
+        client.connect(path)
+    except (OSError, IOError, socket.error) as e:
+        logger.debug("could not connect to daemon at '%s': %s", path, e)
+        client.close()
+        return None
+    return client
+
+
+def _request(path, message, timeout=None):
+    client = _connect(path, timeout)
+    if client is None:
+        return None
+    try:
+        send_message(client, message)
+        return recv_message(client)
+    except (OSError, IOError, socket.error, ValueError) as e:
+        logger.debug("could not communicate with daemon at '%s': %s", path, e)
+        return None
+    finally:
+        client.close()
+
+
+def ping(path):
+    """
+    Return True if a daemon is listening on the socket at path.
+    """
+
+    response = _request(path, {'ping': True}, timeout=5)
+    return bool(response and response.get('pong'))
+
+
+def shutdown(path):
+    """
+    Request the daemon listening on the socket at path to stop.
+    """
+
+    return _request(path, {'shutdown': True}, timeout=5) is not None
+
+
+def forward(args, path=None, stdout=None, stderr=None):
+    """
+    Forward the execution of the arguments to the daemon listening on
+    the socket at path (default: the value of the CALMJS_DAEMON_SOCKET
+    environment variable), writing the output produced to the streams.
+
+    Return the exit code, or None if the request could not be sent to
+    the daemon, in which case the caller should execute the arguments
+    locally.  Once sent, the daemon may have executed the arguments, so
+    a failure to receive a valid response is reported as an error,
+    rather than having the arguments executed again.
+    """
+
+    path = path or os.environ.get(CALMJS_DAEMON_SOCKET)
+    if not path or not exists(path):
+        return None
+    stderr = sys.stderr if stderr is None else stderr
+    client = _connect(path)
+    if client is None:
+        return None
+    try:
+        try:
+            send_message(client, {
+                'args': list(args),
+                'cwd': os.getcwd(),
+                'environ': dict(os.environ),
+            })
+        except (OSError, IOError, socket.error) as e:
+            logger.debug(
+                "could not send request to daemon at '%s': %s", path, e)
+            return None
+        try:
+            response = recv_message(client)
+        except (OSError, IOError, socket.error, ValueError) as e:
+            response = e
+    finally:
+        client.close()
+
+    if not isinstance(response, dict) or 'code' not in response:
+        reason = (
+            'connection closed' if response is None else
+            response if isinstance(response, Exception) else
+            'invalid response'
+        )
+        stderr.write(
+            "calmjs: no valid response from the daemon at '%s' (%s); the "
+            "command may have been partially executed\n" % (path, reason))
+        return 1
+    (sys.stdout if stdout is None else stdout).write(
+        response.get('stdout', ''))
+    stderr.write(response.get('stderr', ''))
+    return response['code']
@@ -11,14 +11,20 @@ import json
 
 from functools import partial
 from logging import getLogger
+from os import stat
+from os.path import join
+from weakref import WeakKeyDictionary
 
 from distutils.command.build import build as BuildCommand
 from distutils.errors import DistutilsSetupError
 
+from pkg_resources import EntryPoint
 from pkg_resources import Requirement
 from pkg_resources import working_set as default_working_set
 
 from calmjs.registry import get
+from calmjs.registry import get_class
+from calmjs.base import BaseChildModuleRegistry
 from calmjs.base import BaseModuleRegistry
 
 logger = getLogger(__name__)
@@ -27,6 +33,7 @@ logger = getLogger(__name__)
 JSON_EXTRAS_REGISTRY_KEY = 'calmjs.extras_keys'
 CALMJS_MODULE_REGISTRY_FIELD = 'calmjs_module_registry'
 CALMJS_MODULE_REGISTRY_TXT = 'calmjs_module_registry.txt'
+CALMJS_MODULE_INDEX_JSON = 'calmjs_module_index.json'
 DEFAULT_JSON = 'default.json'
 EXTRAS_CALMJS_FIELD = 'extras_calmjs'
 EXTRAS_CALMJS_JSON = 'extras_calmjs.json'
@@ -159,10 +166,98 @@ def pkg_names_to_dists(pkg_names, working_set=None):
         pkg_name, working_set=working_set) for pkg_name in pkg_names) if dist]
 
 
+class ResolutionCache(object):
+    """
+    A cache for the results of ``WorkingSet.resolve``, as the typical
+    toolchain or package manager invocation will resolve the exact same
+    set of requirements against the exact same working set a number of
+    times.
+
+    Results are tracked per working set instance (weakly referenced, so
+    that discarded working sets will not be retained), and are only
+    valid for the generation of the working set that produced them; the
+    generation is derived from the path entries and the distributions
+    tracked by the working set, such that adding or replacing any
+    distribution will invalidate the previously cached results.
+    """
+
+    def __init__(self):
+        self._caches = WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, working_set):
+        """
+        Return a value that identifies the current state of the provided
+        working set, or None if this cannot be determined.
+        """
+
+        entries = getattr(working_set, 'entries', None)
+        by_key = getattr(working_set, 'by_key', None)
+        if entries is None or by_key is None:
+            return None
+        return (tuple(entries), tuple(id(dist) for dist in by_key.values()))
+
+    def resolve(self, working_set, requirements):
+        """
+        Resolve the list of requirements using the working set, making
+        use of the cached results if available.  A new list is always
+        returned.
+        """
+
+        key = tuple(str(req) for req in requirements)
+        generation = self.generation(working_set)
+        try:
+            cache = self._caches.get(working_set)
+        except TypeError:
+            # working set cannot be weakly referenced.
+            generation = None
+            cache = None
+
+        if generation is not None and cache is not None:
+            if cache[0] == generation and key in cache[1]:
+                self.hits += 1
+                return list(cache[1][key])
+
+        self.misses += 1
+        result = working_set.resolve(requirements)
+        if generation is None:
+            return result
+
+        if cache is None or cache[0] != generation:
+            cache = self._caches[working_set] = (generation, {})
+        cache[1][key] = tuple(result)
+        return list(result)
+
+    def invalidate(self, working_set=None):
+        """
+        Invalidate the cached results for the provided working set, or
+        all cached results if no working set is provided.
+        """
+
+        if working_set is None:
+            self._caches.clear()
+        else:
+            self._caches.pop(working_set, None)
+
+    def stats(self):
+        """
+        Return a dict reporting the number of resolutions avoided (hits)
+        and performed (misses) by this cache.
+        """
+
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+resolution_cache = ResolutionCache()
+
+
 def find_packages_requirements_dists(pkg_names, working_set=None):
     """
     Return the entire list of dependency requirements, reversed from the
     bottom.
+
+    Results are cached by the module level ``resolution_cache``.
     """
 
     working_set = working_set or default_working_set
@@ -170,7 +265,7 @@ def find_packages_requirements_dists(pkg_names, working_set=None):
         r for r in (Requirement.parse(req) for req in pkg_names)
         if working_set.find(r)
     ]
-    return list(reversed(working_set.resolve(requirements)))
+    return list(reversed(resolution_cache.resolve(working_set, requirements)))
 
 
 def find_packages_parents_requirements_dists(pkg_names, working_set=None):
@@ -189,11 +284,96 @@ def find_packages_parents_requirements_dists(pkg_names, working_set=None):
     return dists
 
 
-def read_dist_egginfo_json(dist, filename=DEFAULT_JSON):
+def _copy_json_value(value):
+    if isinstance(value, dict):
+        return {k: _copy_json_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_json_value(v) for v in value]
+    return value
+
+
+class MetadataCache(object):
     """
-    Safely get a json within an egginfo from a distribution.
+    A cache for the parsed contents of metadata files read from the
+    egg-info of distributions.
+
+    Entries are keyed by the location of the distribution, the egg-info
+    path and the filename, and they are only valid for as long as the
+    modification time and size of the underlying file remain unchanged.
+    Distributions without an egg-info directory on the filesystem (e.g.
+    zipped eggs or ones with a mocked metadata provider) are never
+    cached.
+
+    The parsed objects are stored once, and every consumer will receive
+    their own copy, such that modifications done by one caller will not
+    corrupt the values received by the others.
     """
 
+    def __init__(self):
+        self._records = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self, dist, filename):
+        egg_info = getattr(dist, 'egg_info', None)
+        if not egg_info:
+            return None, None
+        try:
+            st = stat(join(egg_info, filename))
+        except (OSError, TypeError, ValueError):
+            return None, None
+        return (dist.location, egg_info, filename), (st.st_mtime, st.st_size)
+
+    def read(self, dist, filename, reader, copier=_copy_json_value):
+        """
+        Return the value produced by reader(dist, filename), using the
+        cached value if the underlying file has not changed.  The copier
+        is applied to the cached value before it is returned.
+        """
+
+        key, stamp = self._stamp(dist, filename)
+        if key is not None:
+            record = self._records.get(key)
+            if record is not None and record[0] == stamp:
+                self.hits += 1
+                return copier(record[1])
+
+        self.misses += 1
+        value = reader(dist, filename)
+        if key is not None and value is not None:
+            self._records[key] = (stamp, value)
+            return copier(value)
+        return value
+
+    def invalidate(self, dist=None):
+        """
+        Invalidate all cached entries for the provided distribution, or
+        all cached entries if no distribution is provided.
+        """
+
+        if dist is None:
+            self._records.clear()
+            return
+        for key in [k for k in self._records if k[0] == dist.location]:
+            self._records.pop(key)
+
+    def stats(self):
+        """
+        Return a dict reporting the number of reads avoided (hits) and
+        performed (misses) by this cache.
+        """
+
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+metadata_cache = MetadataCache()
+
+
+def _shared_json_value(value):
+    return value
+
+
+def _read_dist_egginfo_json(dist, filename):
     # use the given package's distribution to acquire the json file.
     if not dist.has_metadata(filename):
         logger.debug("no '%s' for '%s'", filename, dist)
@@ -212,10 +392,39 @@ def read_dist_egginfo_json(dist, filename=DEFAULT_JSON):
             "the '%s' found in '%s' is not a valid json.", filename, dist)
         return
 
-    logger.debug("found '%s' for '%s'.", filename, dist)
     return obj
 
 
+def read_dist_egginfo_json(dist, filename=DEFAULT_JSON):
+    """
+    Safely get a json within an egginfo from a distribution.
+
+    Results are cached by the module level ``metadata_cache``; a new
+    copy of the parsed json is returned for every call.
+    """
+
+    obj = metadata_cache.read(dist, filename, _read_dist_egginfo_json)
+    if obj is not None:
+        logger.debug("found '%s' for '%s'.", filename, dist)
+    return obj
+
+
+def read_dist_module_index(dist):
+    """
+    Return the precomputed module index from the egginfo of the given
+    distribution.
+
+    Unlike read_dist_egginfo_json, the value cached by the module level
+    ``metadata_cache`` is returned as is instead of a copy, as the index
+    may be consulted for every entry point of the distribution; callers
+    must treat the returned value as read-only.
+    """
+
+    return metadata_cache.read(
+        dist, CALMJS_MODULE_INDEX_JSON, _read_dist_egginfo_json,
+        _shared_json_value)
+
+
 def read_egginfo_json(pkg_name, filename=DEFAULT_JSON, working_set=None):
     """
     Read json from egginfo of a package identified by `pkg_name` that's
@@ -227,7 +436,7 @@ def read_egginfo_json(pkg_name, filename=DEFAULT_JSON, working_set=None):
     return read_dist_egginfo_json(dist, filename)
 
 
-def read_dist_line_list(dist, filename):
+def _read_dist_line_list(dist, filename):
     if not dist.has_metadata(filename):
         return []
 
@@ -242,6 +451,10 @@ def read_dist_line_list(dist, filename):
     return result.split()
 
 
+def read_dist_line_list(dist, filename):
+    return metadata_cache.read(dist, filename, _read_dist_line_list, list)
+
+
 def flatten_dist_egginfo_json(
         source_dists, filename=DEFAULT_JSON, dep_keys=DEP_KEYS,
         working_set=None):
@@ -395,6 +608,14 @@ def build_helpers_egginfo_json(
         EXTRAS_CALMJS_FIELD, JSON_EXTRAS_REGISTRY_KEY)
 
 
+def _get_records_view_for_package(registry):
+    # module registries from before the introduction of the read-only
+    # views only provide the copying lookup.
+    return getattr(
+        registry, 'get_records_view_for_package',
+        registry.get_records_for_package)
+
+
 def build_helpers_module_registry_dependencies(registry_name='calmjs.module'):
     """
     Return a tuple of funtions that will provide the functions that
@@ -418,8 +639,9 @@ def build_helpers_module_registry_dependencies(registry_name='calmjs.module'):
         if not isinstance(registry, BaseModuleRegistry):
             return {}
         result = {}
+        get_records = _get_records_view_for_package(registry)
         for pkg_name in pkg_names:
-            result.update(registry.get_records_for_package(pkg_name))
+            result.update(get_records(pkg_name))
         return result
 
     def _flatten_module_registry_dependencies(
@@ -439,9 +661,10 @@ def build_helpers_module_registry_dependencies(registry_name='calmjs.module'):
         if not isinstance(registry, BaseModuleRegistry):
             return result
 
+        get_records = _get_records_view_for_package(registry)
         dists = find_dists(pkg_names, working_set=working_set)
         for dist in dists:
-            result.update(registry.get_records_for_package(dist.project_name))
+            result.update(get_records(dist.project_name))
 
         return result
 
@@ -545,6 +768,76 @@ def build_helpers_module_registry_name(
         CALMJS_MODULE_REGISTRY_FIELD)
 
 
+def generate_module_index(entry_map):
+    """
+    Generate the module index for the provided entry map, which is a
+    mapping of entry point group names to a mapping of entry points.
+    Only the groups that are names of module registries will be indexed
+    through the ``index_entry_point`` method of an instance of the
+    registry class that has none of the entry points from the working
+    set registered, as only the provided entry points are of interest.
+    Child module registries are not indexed, as their records are
+    derived from the records of their parents.
+    """
+
+    index = {}
+    for group, entry_points in sorted(entry_map.items()):
+        cls = get_class(group)
+        if not isinstance(cls, type) or not issubclass(
+                cls, BaseModuleRegistry) or issubclass(
+                cls, BaseChildModuleRegistry):
+            continue
+        try:
+            registry = cls(group, _working_set=None)
+        except Exception:
+            logger.exception(
+                "failed to construct registry '%s' for indexing", group)
+            continue
+        records = {}
+        for entry_point in entry_points.values():
+            try:
+                result = registry.index_entry_point(entry_point)
+            except ImportError:
+                logger.warning(
+                    "ImportError: %s not found; not indexing entry point "
+                    "'%s' for registry '%s'",
+                    entry_point.module_name, entry_point, group,
+                )
+                continue
+            except Exception:
+                logger.exception(
+                    "indexing of entry point '%s' for registry '%s' failed "
+                    "with the following exception", entry_point, group,
+                )
+                continue
+            if result is not None:
+                records[str(entry_point)] = result
+        if records:
+            index[group] = records
+    return index
+
+
+def write_module_index(cmd, basename, filename):
+    """
+    Write out the precomputed module index for all the entry points
+    declared by the distribution for module registries into the
+    package's egg-info directory.
+    """
+
+    entry_points = getattr(cmd.distribution, 'entry_points', None) or {}
+    try:
+        entry_map = EntryPoint.parse_map(entry_points)
+    except ValueError:
+        logger.warning(
+            "invalid entry points declared; not writing '%s'", filename)
+        entry_map = {}
+    index = generate_module_index(entry_map)
+    value = json.dumps(
+        index, indent=4, sort_keys=True, separators=(',', ': ')
+    ) if index else None
+    cmd.write_or_delete_file('module index', filename, value, force=True)
+
+
 # These depend on the artifact registry that is defined in the artifact
 # module.
 
@@ -215,10 +215,21 @@ class ModuleLoaderRegistry(BaseChildModuleRegistry):
     this work in tandem with `calmjs.module`.
     """
 
+    memory_report_attributes = (
+        BaseChildModuleRegistry.memory_report_attributes +
+        ('package_loader_map',))
+
+    # the records are never modified in place after being registered.
+    compact_records = True
+
     def __init__(self, registry_name, *a, **kw):
         self.package_loader_map = PackageKeyMapping()
         super(ModuleLoaderRegistry, self).__init__(registry_name, *a, **kw)
 
+    def _reset_records(self):
+        super(ModuleLoaderRegistry, self)._reset_records()
+        self.package_loader_map = PackageKeyMapping()
+
     def resolve_parent_registry_name(
             self, registry_name, suffix=MODULE_LOADER_SUFFIX):
         return super(ModuleLoaderRegistry, self).resolve_parent_registry_name(
@@ -233,6 +244,11 @@ class ModuleLoaderRegistry(BaseChildModuleRegistry):
             module = calmjs_base._import_module(module_name)
             self._register_entry_point_module(entry_point, module)
 
+    def index_entry_point(self, entry_point):
+        # the records are derived from the modules registered for the
+        # package in the parent registry, so they cannot be indexed.
+        return None
+
     def store_records_for_package(self, entry_point, records):
         """
         Given that records are based on the parent, and the same entry
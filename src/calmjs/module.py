@@ -50,6 +50,9 @@ class ModuleRegistry(BaseModuleRegistry):
     ``calmjs.module``.
     """
 
+    # the records are never modified in place after being registered.
+    compact_records = True
+
     def _init(self):
         self.mapper = mapper_es6
 
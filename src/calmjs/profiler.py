@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling helpers for calmjs.
+
+Provides context managers that will run the managed block under the
+cProfile profiler or with memory allocations traced by tracemalloc,
+with the results written to a file and a summary of the results
+written to a stream, for use by the global ``--profile`` and
+``--profile-memory`` options of the calmjs runtime.
+"""
+
+from __future__ import absolute_import
+
+import cProfile
+import pstats
+import sys
+from contextlib import contextmanager
+from logging import getLogger
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+logger = getLogger(__name__)
+
+# the number of entries to include in the summaries.
+SUMMARY_LIMIT = 20
+
+# the paths being written to by the profiles currently active, such
+# that the profiles nested within them will not be started again.
+_active = set()
+
+
+@contextmanager
+def _activate(key):
+    _active.add(key)
+    try:
+        yield
+    finally:
+        _active.discard(key)
+
+
+@contextmanager
+def cpu_profile(path, stream=None, limit=SUMMARY_LIMIT):
+    """
+    Profile the managed block using cProfile, with the statistics
+    written as a pstats file at path, and a summary of the most
+    expensive calls by cumulative time written to stream, which
+    defaults to sys.stderr.
+
+    Does nothing if path is not provided, or if the managed block is
+    nested within a block already being profiled to path.
+    """
+
+    if not path or ('cpu', path) in _active:
+        yield
+        return
+
+    stream = sys.stderr if stream is None else stream
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        with _activate(('cpu', path)):
+            yield
+    finally:
+        profiler.disable()
+        try:
+            profiler.dump_stats(path)
+        except (IOError, OSError) as e:
+            logger.error("failed to write profile to '%s': %s", path, e)
+        else:
+            logger.info("wrote profile statistics to '%s'", path)
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(limit)
+
+
+@contextmanager
+def memory_profile(path, stream=None, limit=SUMMARY_LIMIT):
+    """
+    Trace the memory allocations done by the managed block using
+    tracemalloc, with the snapshot taken at the end written to path,
+    and the differences from the snapshot taken at the start, grouped
+    by line, written to stream, which defaults to sys.stderr.
+
+    Does nothing if path is not provided, if tracemalloc is not
+    available, or if the managed block is nested within a block already
+    being traced to path.
+    """
+
+    if not path or ('memory', path) in _active:
+        yield
+        return
+
+    if tracemalloc is None:
+        logger.warning(
+            "tracemalloc is not available for this version of Python; "
+            "memory profiling disabled")
+        yield
+        return
+
+    stream = sys.stderr if stream is None else stream
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    try:
+        with _activate(('memory', path)):
+            yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        if started:
+            tracemalloc.stop()
+        try:
+            after.dump(path)
+        except (IOError, OSError) as e:
+            logger.error(
+                "failed to write memory snapshot to '%s': %s", path, e)
+        else:
+            logger.info("wrote memory snapshot to '%s'", path)
+        stats = after.compare_to(before, 'lineno')
+        stream.write('top %d memory allocation differences:\n' % limit)
+        for stat in stats[:limit]:
+            stream.write('%s\n' % stat)
@@ -18,15 +18,33 @@ Typically, usage is done through this::
 The iter_records is typically used by the other parts of the calmjs
 framework to produce configuration files and/or transpile the source
 into the usable final form.
+
+Long running processes that may have packages installed or upgraded
+while running may bring the root registry and every registry that it
+has constructed up to date by calling ``refresh``; the module registries
+will only register again the records affected by the distributions that
+changed.
+
+The number of records held by the registries, along with the approximate
+memory retained by them, may be found using ``memory_report``.
 """
 
 from __future__ import absolute_import
 
+import hashlib
+import sys
+from collections import OrderedDict
+from os.path import exists
+
 from pkg_resources import working_set
 from pkg_resources import Requirement
+from pkg_resources import WorkingSet
 
 from logging import getLogger
 from calmjs.base import BaseRegistry
+from calmjs.base import _mtime
+from calmjs.base import dist_fingerprint
+from calmjs.trace import tracer
 
 logger = getLogger(__name__)
 
@@ -34,6 +52,56 @@ PACKAGE_NAME = 'calmjs'
 CALMJS_RESERVED = 'calmjs.reserved'
 
 
+def working_set_fingerprint(working_set=working_set):
+    """
+    Return a digest of the state of the working set, derived from the
+    path entries and their modification times, and the fingerprint of
+    every distribution in it.  Installing, removing or upgrading a
+    package, or regenerating the metadata of a package installed in
+    development mode, will change the result.
+    """
+
+    digest = hashlib.sha1()
+    for entry in working_set.entries:
+        digest.update(repr((entry, _mtime(entry))).encode('utf8'))
+    for dist in working_set:
+        digest.update(repr(
+            (dist.project_name,) + dist_fingerprint(dist)).encode('utf8'))
+    return digest.hexdigest()
+
+
+def refresh_working_set(working_set=working_set):
+    """
+    Rebuild the provided working set in place, such that every existing
+    reference to it will see the distributions that are currently
+    installed.  All the existing entries, including the ones added at
+    runtime, are scanned again, with the entries in sys.path that are not
+    yet in the working set added after them.  Only the site directories
+    that have not been processed already will have their .pth files
+    processed, as doing so will execute the import lines within again.
+    """
+
+    import site
+    for sitedir in getattr(site, 'getsitepackages', lambda: [])():
+        if exists(sitedir) and sitedir not in sys.path:
+            site.addsitedir(sitedir)
+    try:
+        from importlib import invalidate_caches
+    except ImportError:  # pragma: no cover
+        pass
+    else:
+        invalidate_caches()
+
+    fresh = WorkingSet([])
+    for entry in list(working_set.entries) + [
+            entry for entry in sys.path
+            if entry not in working_set.entries]:
+        fresh.add_entry(entry)
+    callbacks = list(working_set.callbacks)
+    vars(working_set).update(vars(fresh))
+    working_set.callbacks = callbacks
+
+
 class Registry(BaseRegistry):
 
     def __init__(
@@ -99,10 +167,23 @@ class Registry(BaseRegistry):
         # records on-demand.
 
     def get_record(self, name):
-        if name in self.records:
+        # a refresh may replace the records at any time.
+        records = self.records
+        if name in records:
             # maybe do some other sanity check if pedantic.
             logger.debug('found existing registry %s', name)
-            return self.records[name]
+            return records[name]
+        # only one thread may construct the registry for a given name,
+        # and never while a refresh is rebuilding the records and the
+        # entry points they are constructed from.
+        with self._refresh_lock:
+            return self._build_record(name, self._construct_record)
+
+    def get_record_class(self, name):
+        """
+        Return the registry class registered for name without
+        constructing it, or None if it cannot be loaded.
+        """
 
         entry_point = self._entry_points.get(name)
         if not entry_point:
@@ -110,37 +191,154 @@ class Registry(BaseRegistry):
             return
 
         try:
-            cls = entry_point.load()
+            return entry_point.load()
         except ImportError:
             logger.debug(
                 "ImportError '%s' from '%s'",
                 entry_point, entry_point.dist)
             return
 
+    def _construct_record(self, name):
+        cls = self.get_record_class(name)
+        if cls is None:
+            return
+
+        entry_point = self._entry_points[name]
         if cls is type(self) and entry_point.name == self.registry_name:
             logger.debug(
                 "registry '%s' has entry point '%s' which is the identity "
                 "registration", name, entry_point,
             )
-            self.records[name] = self
             return self
 
         logger.debug(
             "registering '%s' from '%s'", entry_point, entry_point.dist)
         try:
-            self.records[name] = cls(name)
+            with tracer.span(name, 'registry', entry_point=str(entry_point)):
+                return cls(name)
         except Exception:
             logger.exception(
                 "'%s' from '%s' does not lead to a valid registry constructor",
                 entry_point, entry_point.dist,
             )
             return
-        return self.records[name]
+
+    def refresh(self):
+        """
+        Refresh this registry along with every registry it constructed.
+
+        The registries provided by the distributions that changed will
+        be dropped, to be constructed again on their next lookup, along
+        with the child registries of the dropped registries; the rest
+        will be refreshed in the order they were constructed.  Return
+        the set of the names of the distributions that changed.
+        Concurrent refreshes are serialized.
+        """
+
+        with self._refresh_lock:
+            changed, entry_points, fingerprints = self._scan_distributions()
+            if changed:
+                previous = self._entry_points
+                records = self.records
+                self.raw_entry_points = entry_points
+                self.dist_fingerprints = fingerprints
+                self.records = OrderedDict()
+                self._init()
+                for name, instance in records.items():
+                    entry_point = previous.get(name)
+                    current = self._entry_points.get(name)
+                    # records that were not constructed from entry points
+                    # are kept as is.
+                    if instance is self or entry_point is current is None or (
+                            current is not None and
+                            str(current) == str(entry_point) and
+                            getattr(current.dist, 'project_name', None)
+                            not in changed):
+                        self.records[name] = instance
+                    else:
+                        logger.debug("dropping registry '%s'", name)
+                self.generation += 1
+
+            for name, instance in list(self.records.items()):
+                if instance is self or not isinstance(instance, BaseRegistry):
+                    continue
+                parent = getattr(instance, 'parent', None)
+                if isinstance(parent, BaseRegistry) and not any(
+                        parent is record for record in self.records.values()):
+                    logger.debug(
+                        "dropping registry '%s' as its parent was dropped",
+                        name)
+                    self.records.pop(name)
+                    continue
+                try:
+                    changed.update(instance.refresh())
+                except Exception:
+                    logger.exception(
+                        "failed to refresh registry '%s'; dropping it", name)
+                    self.records.pop(name)
+            return changed
+
+    def memory_report(self):
+        """
+        Return the memory report of this registry, with the reports of
+        the registries it constructed under ``registries``, which are
+        also included in the total number of bytes.  Objects that are
+        shared between the registries (e.g. the interned paths) are
+        only counted by the first registry that was constructed.
+        """
+
+        seen = set()
+        report = self._memory_report(seen)
+        report['registries'] = registries = {}
+        for name, instance in list(self.records.items()):
+            if instance is self or not isinstance(instance, BaseRegistry):
+                continue
+            registries[name] = instance._memory_report(seen)
+            report['bytes'] += registries[name]['bytes']
+        return report
 
 
 # Initialize the root registry instance
 _inst = Registry(__name__)  # __name__ == calmjs.registry
+# the fingerprint of the working set as of the last refresh.
+_fingerprint = None
 
 
 def get(registry_name):
     return _inst.get(registry_name)
+
+
+def get_class(registry_name):
+    """
+    Return the class of the registry registered for the name, without
+    constructing it.
+    """
+
+    return _inst.get_record_class(registry_name)
+
+
+def memory_report():
+    """
+    Return the memory report of the root registry, which includes the
+    reports of all the registries that have been constructed.
+    """
+
+    return _inst.memory_report()
+
+
+def refresh():
+    """
+    Rebuild the default working set from sys.path and refresh the root
+    registry, if the working set has changed since the previous call
+    (the first call will always refresh).  Return the set of the names
+    of the distributions that changed.
+    """
+
+    global _fingerprint
+    fingerprint = working_set_fingerprint(working_set)
+    if fingerprint == _fingerprint:
+        return set()
+    refresh_working_set(working_set)
+    changed = _inst.refresh()
+    _fingerprint = working_set_fingerprint(working_set)
+    return changed
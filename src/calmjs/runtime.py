@@ -8,13 +8,17 @@ from __future__ import absolute_import
 import warnings
 import logging
 import re
+import shutil
 import sys
+import time
 from collections import namedtuple
 from functools import partial
 from argparse import Action
 from argparse import SUPPRESS
 from inspect import currentframe
 from os.path import exists
+from os.path import realpath
+from tempfile import mkdtemp
 
 from pkg_resources import working_set as default_working_set
 
@@ -27,11 +31,21 @@ from calmjs.argparse import ATTR_ROOT_PKG
 from calmjs.argparse import metavar
 from calmjs.artifact import ArtifactBuilder
 from calmjs.artifact import ARTIFACT_REGISTRY_NAME
+from calmjs.daemon import CALMJS_DAEMON_SOCKET
+from calmjs.daemon import Daemon
+from calmjs.daemon import default_socket_path
+from calmjs.daemon import forward
+from calmjs.daemon import shutdown
 from calmjs.exc import RuntimeAbort
+from calmjs.store import ArtifactStore
+from calmjs.store import CALMJS_ARTIFACT_STORE
+from calmjs.store import parse_size
 from calmjs.toolchain import Spec
 from calmjs.toolchain import ToolchainCancel
 from calmjs.toolchain import ADVICE_PACKAGES
+from calmjs.toolchain import ADVICE_PROFILE
 from calmjs.toolchain import AFTER_PREPARE
+from calmjs.toolchain import BUILD_CACHE_DIR
 from calmjs.toolchain import BUILD_DIR
 from calmjs.toolchain import CALMJS_MODULE_REGISTRY_NAMES
 from calmjs.toolchain import CALMJS_LOADERPLUGIN_REGISTRY_NAME
@@ -39,7 +53,14 @@ from calmjs.toolchain import DEBUG
 from calmjs.toolchain import EXPORT_TARGET
 from calmjs.toolchain import EXPORT_TARGET_OVERWRITE
 from calmjs.toolchain import SOURCE_PACKAGE_NAMES
+from calmjs.toolchain import SUCCESS
 from calmjs.toolchain import WORKING_DIR
+from calmjs.toolchain import cls_to_name
+from calmjs.profiler import cpu_profile
+from calmjs.profiler import memory_profile
+from calmjs.trace import tracer
+from calmjs.trace import CALMJS_TRACE
+from calmjs.watch import make_watcher
 from calmjs.ui import prompt_overwrite_json
 from calmjs.ui import prompt
 from calmjs.utils import pretty_logging
@@ -76,6 +97,13 @@ def _global_runtime_attrs_get(key):
     return 0
 
 
+def _global_runtime_attrs_get_str(key):
+    result = _global_runtime_attrs.get(key)
+    if isinstance(result, (str, type(u''))):
+        return result
+    return None
+
+
 def _reset_global_runtime_attrs():
     _global_runtime_attrs.clear()
     _global_runtime_attrs.update({
@@ -83,6 +111,9 @@ def _reset_global_runtime_attrs():
         'log_level': 0,
         'bootstrap_log_level': -1,
         'verbosity': 0,
+        'trace': None,
+        'profile': None,
+        'profile_memory': None,
     })
 
 
@@ -101,6 +132,9 @@ def _initialize_global_runtime_attrs(**kwargs):
         'log_level': log_level,
         'bootstrap_log_level': bootstrap_log_level,
         'verbosity': verbosity,
+        'trace': kwargs.pop('trace', None),
+        'profile': kwargs.pop('profile', None),
+        'profile_memory': kwargs.pop('profile_memory', None),
     })
 
 
@@ -163,6 +197,19 @@ class BootstrapRuntime(object):
         self.global_opts.add_argument(
             '-v', '--verbose', action='count', default=0,
             help="be more verbose")
+        self.global_opts.add_argument(
+            '--trace', metavar='<file>', default=None,
+            help="write a trace of the execution in the Chrome trace event "
+                 "format to the file; may also be enabled by setting the "
+                 "%s environment variable" % CALMJS_TRACE)
+        self.global_opts.add_argument(
+            '--profile', metavar='<file>', default=None,
+            help="run with the cProfile profiler, writing the statistics to "
+                 "the file and a summary to stderr")
+        self.global_opts.add_argument(
+            '--profile-memory', metavar='<file>', default=None,
+            help="trace memory allocations with tracemalloc, writing the "
+                 "final snapshot to the file and the differences to stderr")
 
     def prepare_keywords(self, kwargs):
         _initialize_global_runtime_attrs(**kwargs)
@@ -184,6 +231,18 @@ class BootstrapRuntime(object):
     def verbosity(self):
         return _global_runtime_attrs_get('verbosity')
 
+    @property
+    def trace(self):
+        return _global_runtime_attrs_get_str('trace')
+
+    @property
+    def profile(self):
+        return _global_runtime_attrs_get_str('profile')
+
+    @property
+    def profile_memory(self):
+        return _global_runtime_attrs_get_str('profile_memory')
+
     def run(self, argparser=None, **kwargs):
         self.prepare_keywords(kwargs)
 
@@ -341,6 +400,21 @@ class BaseRuntime(BootstrapRuntime):
         # the bootstrap knows, only process any leftovers.
         args = bootstrap(args)
 
+        # only stop the tracing if it was started here, as the main
+        # function may have started it already.
+        tracing = tracer.start(bootstrap.trace)
+        try:
+            with tracer.span(
+                    cls_to_name(type(self)), 'runtime', args=' '.join(args)):
+                return self._call(args)
+        finally:
+            if tracing:
+                with pretty_logging(
+                        logger=self.logger, level=self.log_level,
+                        stream=sys.stderr):
+                    tracer.stop()
+
+    def _call(self, args):
         # NOT using parse_args directly because argparser is dumb when
         # it comes to bad keywords in a subparser - it doesn't invoke
         # its help text.  Nor does it keep track of what or where the
@@ -368,7 +442,9 @@ class BaseRuntime(BootstrapRuntime):
                 if extras:
                     self.unrecognized_arguments_error(args, parsed, extras)
                 kwargs = vars(parsed)
-                return self.run(argparser=self.argparser, **kwargs)
+                with memory_profile(self.profile_memory), cpu_profile(
+                        self.profile):
+                    return self.run(argparser=self.argparser, **kwargs)
             except KeyboardInterrupt:
                 logger.critical('termination requested; aborted.')
             except Exception as e:
@@ -839,6 +915,23 @@ class ToolchainRuntime(DriverRuntime):
             metavar=metavar(BUILD_DIR), help=help,
         )
 
+    def init_argparser_build_cache_dir(
+            self, argparser, help=(
+                'the cache root for persistent build directories; if '
+                'specified without a build directory, the build will use a '
+                'directory inside it that is kept between runs, specific to '
+                'the toolchain, export target and packages, such that the '
+                'outputs of unchanged sources may be reused'
+            )):
+        """
+        For setting up the cache root for build directories.
+        """
+
+        argparser.add_argument(
+            '--build-cache-dir', default=None, dest=BUILD_CACHE_DIR,
+            metavar=metavar(BUILD_CACHE_DIR), help=help,
+        )
+
     def init_argparser_optional_advice(
             self, argparser, default=[], help=(
                 'a comma separated list of packages to retrieve optional '
@@ -858,6 +951,34 @@ class ToolchainRuntime(DriverRuntime):
             help=help
         )
 
+    def init_argparser_advice_profile(
+            self, argparser, help=(
+                'report the time spent by each advice invoked during the '
+                'execution of the toolchain to stderr, slowest first'
+            )):
+        """
+        For setting up the advice profile report.
+        """
+
+        argparser.add_argument(
+            '--advice-profile', default=False, dest=ADVICE_PROFILE,
+            action='store_true', help=help,
+        )
+
+    def init_argparser_watch(
+            self, argparser, help=(
+                'after the build, keep watching the source files for changes '
+                'and rebuild the affected modules when they change, until '
+                'interrupted; the build directory is kept for the duration'
+            )):
+        """
+        For setting up the watch mode.
+        """
+
+        argparser.add_argument(
+            '--watch', default=False, action='store_true', help=help,
+        )
+
     def init_argparser(self, argparser):
         """
         Other runtimes (or users of ArgumentParser) can pass their
@@ -874,7 +995,10 @@ class ToolchainRuntime(DriverRuntime):
         self.init_argparser_export_target(argparser)
         self.init_argparser_working_dir(argparser)
         self.init_argparser_build_dir(argparser)
+        self.init_argparser_build_cache_dir(argparser)
         self.init_argparser_optional_advice(argparser)
+        self.init_argparser_advice_profile(argparser)
+        self.init_argparser_watch(argparser)
 
     def check_export_target_exists(self, spec):
         # to ensure the key is really available.
@@ -924,6 +1048,9 @@ class ToolchainRuntime(DriverRuntime):
                 spec[ADVICE_PACKAGES]
             )
 
+    def prepare_spec_advice_profile(self, spec, **kwargs):
+        spec[ADVICE_PROFILE] = kwargs.get(ADVICE_PROFILE, False)
+
     def prepare_spec(self, spec, **kwargs):
         """
         Prepare a spec for usage with the generic ToolchainRuntime.
@@ -935,6 +1062,7 @@ class ToolchainRuntime(DriverRuntime):
         self.prepare_spec_debug_flag(spec, **kwargs)
         self.prepare_spec_export_target_checks(spec, **kwargs)
         self.prepare_spec_advice_packages(spec, **kwargs)
+        self.prepare_spec_advice_profile(spec, **kwargs)
 
     def create_spec(self, **kwargs):
         """
@@ -953,9 +1081,109 @@ class ToolchainRuntime(DriverRuntime):
         self.prepare_spec(spec, **kwargs)
         return spec
 
+    def report_advice_profile(self, spec, stream=None):
+        """
+        Write out the advice trace recorded on the spec, ranked by the
+        total time spent by each advice.
+        """
+
+        stream = sys.stderr if stream is None else stream
+        rows = spec.advice_summary
+        stream.write('advice profile (%d advices, slowest first):\n' % len(
+            rows))
+        stream.write('%10s %10s %6s  %-20s %s\n' % (
+            'total(s)', 'max(s)', 'calls', 'group', 'advice'))
+        for group, name, count, total, longest, outcomes in rows:
+            stream.write('%10.6f %10.6f %6d  %-20s %s [%s]\n' % (
+                total, longest, count, group, name, ','.join(outcomes)))
+
     def run(self, argparser=None, **kwargs):
         spec = self.kwargs_to_spec(**kwargs)
-        self.toolchain(spec)
+        if kwargs.get('watch'):
+            return self.watch(spec)
+        self.build(spec)
+        return spec
+
+    def build(self, spec):
+        try:
+            self.toolchain(spec)
+        finally:
+            if spec.get(ADVICE_PROFILE):
+                self.report_advice_profile(spec)
+
+    def spec_sourcepaths(self, spec):
+        """
+        Return the set of paths from all the sourcepath maps in the spec.
+        """
+
+        suffix = self.toolchain.sourcepath_suffix
+        return {
+            path
+            for key, value in spec.items()
+            if key.endswith(suffix) and isinstance(value, dict)
+            for path in value.values()
+            if isinstance(path, (str, type(u''))) and exists(path)
+        }
+
+    def watch(self, spec, watcher_factory=None):
+        """
+        Build the spec, then watch the sourcepaths for changes and then
+        incrementally rebuild the spec using the toolchain until
+        interrupted.  If the spec does not specify a build_dir, the
+        build workspace in the build_cache_dir will be used and kept
+        locked for the duration if specified, otherwise a temporary
+        directory will be created and used for the duration.
+        """
+
+        tempdir = None
+        workspace = None
+        if not spec.get(BUILD_DIR) and spec.get(BUILD_CACHE_DIR):
+            workspace = self.toolchain.setup_build_workspace(spec, hold=True)
+        if not spec.get(BUILD_DIR):
+            tempdir = realpath(mkdtemp())
+            spec[BUILD_DIR] = tempdir
+
+        built = []
+        spec.advise(SUCCESS, built.append, True)
+        try:
+            self.build(spec)
+            if not built:
+                logger.error('initial build failed; not watching for changes')
+                return spec
+
+            sourcepaths = self.spec_sourcepaths(spec)
+            watcher = (watcher_factory or make_watcher)(sourcepaths)
+            logger.info(
+                'watching %d sourcepaths using %s; interrupt to stop',
+                len(sourcepaths), type(watcher).__name__)
+            try:
+                while True:
+                    changed = watcher.wait()
+                    if not changed:
+                        continue
+                    logger.info(
+                        'rebuilding for %d changed sourcepaths', len(changed))
+                    for path in sorted(changed):
+                        logger.debug("changed: '%s'", path)
+                    try:
+                        self.toolchain.rebuild(spec, changed)
+                    except Exception as e:
+                        # keep on watching so the error may be fixed.
+                        logger.error(
+                            'rebuild failed: %s: %s', type(e).__name__, e)
+                        if self.debug:
+                            logger.error('showing traceback', exc_info=1)
+                    if workspace is not None:
+                        workspace.save()
+            except KeyboardInterrupt:
+                logger.info('watch terminated')
+            finally:
+                watcher.close()
+        finally:
+            if workspace is not None:
+                workspace.close()
+            if tempdir:
+                shutil.rmtree(tempdir, ignore_errors=True)
         return spec
 
 
@@ -1017,6 +1245,64 @@ class ArtifactBuildRuntime(BaseArtifactRegistryRuntime):
     """
 
 
+class ArtifactStoreRuntime(BaseRuntime):
+    """
+    inspect and prune the content-addressed artifact store
+    """
+
+    def init_argparser(self, argparser):
+        super(ArtifactStoreRuntime, self).init_argparser(argparser)
+        argparser.add_argument(
+            '--store', metavar=metavar('path'), default=None,
+            help="path to the artifact store; defaults to the value of the "
+                 "%s environment variable" % CALMJS_ARTIFACT_STORE)
+        argparser.add_argument(
+            '--prune', action='store_true',
+            help="evict the least recently used artifacts from the store "
+                 "until it is within the maximum size, or all artifacts if "
+                 "no maximum size is specified")
+        argparser.add_argument(
+            '--max-size', metavar=metavar('size'), default=None,
+            type=parse_size,
+            help="the maximum size of the store for --prune, in bytes, "
+                 "with an optional K, M or G suffix")
+        argparser.add_argument(
+            '--max-age', metavar=metavar('days'), default=None, type=float,
+            help="also evict the artifacts not used in the number of days "
+                 "for --prune")
+
+    def run(
+            self, argparser=None, store=None, prune=False, max_size=None,
+            max_age=None, **kwargs):
+        artifact_store = (
+            ArtifactStore(store) if store else ArtifactStore.from_environ())
+        if artifact_store is None:
+            logger.error(
+                "no artifact store specified; use --store or set the %s "
+                "environment variable", CALMJS_ARTIFACT_STORE)
+            return False
+
+        if prune:
+            if max_size is None:
+                # only evict by age if that is specified.
+                max_size = float('inf') if max_age is not None else (
+                    artifact_store.max_size or 0)
+            evicted = artifact_store.prune(
+                max_size=max_size,
+                max_age=None if max_age is None else max_age * 86400,
+            )
+            sys.stdout.write('evicted %d artifacts\n' % len(evicted))
+
+        entries = artifact_store.entries()
+        for fingerprint, size, last_used in entries:
+            sys.stdout.write('%s %12d %s\n' % (
+                fingerprint, size, time.strftime(
+                    '%Y-%m-%d %H:%M:%S', time.localtime(last_used))))
+        sys.stdout.write('%d artifacts, %d bytes in total\n' % (
+            len(entries), sum(entry[1] for entry in entries)))
+        return True
+
+
 class SourcePackageToolchainRuntime(ToolchainRuntime):
     """
     Include the argument parser setup using the standardized keywords
@@ -1238,8 +1524,53 @@ class PackageManagerRuntime(DriverRuntime):
         return action(**kwargs)
 
 
+class DaemonRuntime(BaseRuntime):
+    """
+    run a build daemon that keeps the calmjs runtime warm
+    """
+
+    def __init__(self, daemon_cls=Daemon, runtime_cls=None, *a, **kw):
+        self.daemon_cls = daemon_cls
+        # default is resolved at run time as CalmJSRuntime is defined
+        # by this module.
+        self.runtime_cls = runtime_cls
+        super(DaemonRuntime, self).__init__(*a, **kw)
+
+    def init_argparser(self, argparser):
+        super(DaemonRuntime, self).init_argparser(argparser)
+        argparser.add_argument(
+            '--socket', metavar=metavar('path'), default=None,
+            help="path of the Unix socket to listen on; defaults to the "
+                 "value of the %s environment variable, or a user specific "
+                 "path in the temporary directory" % CALMJS_DAEMON_SOCKET)
+        argparser.add_argument(
+            '--stop', action='store_true',
+            help="stop the daemon listening on the socket")
+
+    def run(self, argparser=None, socket=None, stop=False, **kwargs):
+        path = socket or default_socket_path()
+        if stop:
+            if not shutdown(path):
+                logger.error("no daemon is listening on '%s'", path)
+                return False
+            logger.info("daemon listening on '%s' stopped", path)
+            return True
+        runtime_cls = self.runtime_cls or CalmJSRuntime
+        daemon = self.daemon_cls(
+            partial(runtime_cls, working_set=self.working_set),
+            path=path, working_set=self.working_set,
+        )
+        logger.info(
+            "set the %s environment variable to '%s' to have calmjs "
+            "forward to this daemon", CALMJS_DAEMON_SOCKET, path)
+        daemon.serve()
+        return True
+
+
 artifact = ArtifactRuntime()
 artifact_build = ArtifactBuildRuntime()
+artifact_store = ArtifactStoreRuntime()
+daemon = DaemonRuntime()
 
 
 def main(args=None, runtime_cls=CalmJSRuntime):
@@ -1249,8 +1580,37 @@ def main(args=None, runtime_cls=CalmJSRuntime):
     args = norm_args(args)
     # Use the bootstrap runtime to set the global runtime attributes
     # (i.e. for logging and such).
-    bootstrap(args)
+    extras = bootstrap(args)
 
+    # forward the execution to the build daemon, if one is available;
+    # never for the daemon command itself.
+    if runtime_cls is CalmJSRuntime and extras[:1] != ['daemon']:
+        with pretty_logging(
+                logger='calmjs', level=bootstrap.log_level,
+                stream=sys.stderr):
+            code = forward(args)
+        if code is not None:
+            sys.exit(code)
+
+    # start tracing and profiling here to include the construction of
+    # the runtime; the profiling done by BaseRuntime.__call__ will then
+    # be skipped as it is nested within.
+    tracing = tracer.start(bootstrap.trace)
+    try:
+        with pretty_logging(
+                logger='calmjs.profiler', level=bootstrap.log_level,
+                stream=sys.stderr), memory_profile(
+                    bootstrap.profile_memory), cpu_profile(bootstrap.profile):
+            _main(args, runtime_cls, bootstrap)
+    finally:
+        if tracing:
+            with pretty_logging(
+                    logger='calmjs', level=bootstrap.log_level,
+                    stream=sys.stderr):
+                tracer.stop()
+
+
+def _main(args, runtime_cls, bootstrap):
     # all the minimum arguments acquired, bootstrap the execution.
     with warnings.catch_warnings(record=True) as records:
         # Note that this is a workaround for some versions of Python.
@@ -1260,7 +1620,7 @@ def main(args=None, runtime_cls=CalmJSRuntime):
         # log down the construction of the bootstrap class.
         with pretty_logging(
                 logger='', level=bootstrap.bootstrap_log_level,
-                stream=sys.stderr):
+                stream=sys.stderr), tracer.span('argparser', 'runtime'):
             runtime = runtime_cls()
             # access the argparser property to trigger its construction
             # inside this logger context, so that any messages passed to
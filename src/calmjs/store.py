@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+A content-addressed local store for artifacts.
+
+Artifacts are normally built into the metadata directory of the package
+that declared them, such that packages (or checkouts of the same
+package) that would produce byte-identical artifacts will have to build
+them independently.  The store provided here keeps the artifacts in a
+directory keyed by the fingerprint of the inputs that produced them
+(i.e. the builder, the toolchain and the contents of the sources), such
+that an artifact already in the store will be linked (or copied) into
+the export location instead of being built again.
+
+The store is enabled by setting the ``CALMJS_ARTIFACT_STORE`` environment
+variable to the path of the directory to be used; the maximum size of
+the store may be set using ``CALMJS_ARTIFACT_STORE_SIZE`` (e.g. ``500M``
+or ``2G``), with the least recently used artifacts evicted once that
+size is exceeded.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from logging import getLogger
+from os.path import basename
+from os.path import exists
+from os.path import isabs
+from os.path import isdir
+from os.path import isfile
+from os.path import join
+from os.path import relpath
+
+logger = getLogger(__name__)
+
+CALMJS_ARTIFACT_STORE = 'CALMJS_ARTIFACT_STORE'
+CALMJS_ARTIFACT_STORE_SIZE = 'CALMJS_ARTIFACT_STORE_SIZE'
+_size_units = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+_json_scalars = (bool, int, float, type(u''), str, type(None))
+# spec keys that hold the locations of the outputs and not the inputs.
+_fingerprint_excluded_keys = ('build_dir', 'export_target', 'working_dir')
+
+
+def parse_size(value):
+    """
+    Parse a size in bytes, with an optional K, M, G or T suffix (with an
+    optional trailing B) for the binary multiples.
+    """
+
+    text = str(value).strip().upper()
+    if text.endswith('B'):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in _size_units else ''
+    number = text[:len(text) - len(unit)].strip()
+    try:
+        return int(float(number) * _size_units[unit])
+    except ValueError:
+        raise ValueError('invalid size: %r' % (value,))
+
+
+def file_digest(path, algorithm='sha256'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_digest(path):
+    """
+    Return the digest of the contents of the file, or of the relative
+    paths and contents of all the files within the directory, at path;
+    None if it does not exist.
+    """
+
+    if isfile(path):
+        return file_digest(path)
+    if not isdir(path):
+        return None
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            filename = join(root, name)
+            digest.update(repr((
+                relpath(filename, path).replace(os.sep, '/'),
+                file_digest(filename),
+            )).encode('utf8'))
+    return digest.hexdigest()
+
+
+def spec_fingerprint(spec, *parts):
+    """
+    Return the fingerprint of the inputs declared by the spec, which are
+    the contents of the sources referenced by the sourcepath maps and
+    the other JSON compatible values, along with the additional JSON
+    compatible parts provided.  Absolute paths are reduced to their
+    basename, such that the same sources in different locations will
+    produce the same fingerprint.
+
+    Return None if the spec has no sourcepath maps, as the inputs would
+    then be unknown before the toolchain is executed.
+    """
+
+    sources = {}
+    values = {}
+    for key, value in spec.items():
+        if key in _fingerprint_excluded_keys:
+            continue
+        if key.endswith('_sourcepath') and isinstance(value, dict):
+            sources[key] = {
+                modname: source_digest(path)
+                for modname, path in value.items()
+            }
+        elif isinstance(value, _json_scalars):
+            if isinstance(value, (type(u''), str)) and isabs(value):
+                value = basename(value)
+            values[key] = value
+    if not sources:
+        return None
+    return hashlib.sha256(json.dumps(
+        [sources, values, parts], sort_keys=True, default=repr,
+    ).encode('utf8')).hexdigest()
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except (AttributeError, OSError):
+        shutil.copy2(source, target)
+
+
+class ArtifactStore(object):
+    """
+    A directory of artifacts keyed by the fingerprint of their inputs,
+    along with the metadata entry generated for them.
+    """
+
+    def __init__(self, root, max_size=None):
+        """
+        Arguments:
+
+        root
+            The directory for the store.
+        max_size
+            The maximum total size of the artifacts in the store, in
+            bytes; the least recently used artifacts will be evicted
+            once exceeded.  None for no limit.
+        """
+
+        self.root = root
+        self.max_size = max_size
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """
+        Return the store as configured by the environment variables, or
+        None if not configured.
+        """
+
+        environ = os.environ if environ is None else environ
+        root = environ.get(CALMJS_ARTIFACT_STORE)
+        if not root:
+            return None
+        max_size = environ.get(CALMJS_ARTIFACT_STORE_SIZE)
+        try:
+            max_size = parse_size(max_size) if max_size else None
+        except ValueError:
+            logger.warning(
+                "ignoring invalid %s value %r",
+                CALMJS_ARTIFACT_STORE_SIZE, max_size)
+            max_size = None
+        return cls(root, max_size=max_size)
+
+    def path_for(self, fingerprint):
+        return join(self.root, fingerprint[:2], fingerprint)
+
+    def get(self, fingerprint, target):
+        """
+        Link or copy the artifact for the fingerprint to target, and
+        return the metadata entry stored with it; None if the store does
+        not have the artifact.
+        """
+
+        path = self.path_for(fingerprint)
+        try:
+            with open(path + '.json') as fd:
+                metadata = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isfile(path):
+            return None
+        if exists(target):
+            os.unlink(target)
+        _link_or_copy(path, target)
+        # mark as recently used for the eviction.
+        os.utime(path + '.json', None)
+        logger.debug("retrieved '%s' from artifact store", fingerprint)
+        return metadata
+
+    def put(self, fingerprint, source, metadata):
+        """
+        Copy the artifact at source into the store with the metadata
+        entry for it, followed by the eviction of the least recently
+        used artifacts if the store is beyond its maximum size.
+        """
+
+        path = self.path_for(fingerprint)
+        directory = join(self.root, fingerprint[:2])
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # write to temporary files then rename, such that concurrent
+        # users of the store will never see any partial artifacts.
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        os.close(fd)
+        shutil.copyfile(source, tmp)
+        os.rename(tmp, path)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as stream:
+            json.dump(metadata, stream)
+        os.rename(tmp, path + '.json')
+        logger.debug("stored '%s' into artifact store", fingerprint)
+        if self.max_size is not None:
+            self.prune(self.max_size)
+
+    def entries(self):
+        """
+        Return a list of (fingerprint, size, last_used) for all the
+        artifacts in the store, ordered from the least recently used.
+        """
+
+        results = []
+        if not isdir(self.root):
+            return results
+        for prefix in os.listdir(self.root):
+            directory = join(self.root, prefix)
+            if len(prefix) != 2 or not isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith('.json'):
+                    continue
+                fingerprint = name[:-5]
+                try:
+                    size = os.stat(join(directory, fingerprint)).st_size
+                    last_used = os.stat(join(directory, name)).st_mtime
+                except OSError:
+                    continue
+                results.append((fingerprint, size, last_used))
+        results.sort(key=lambda entry: (entry[2], entry[0]))
+        return results
+
+    def remove(self, fingerprint):
+        path = self.path_for(fingerprint)
+        for target in (path + '.json', path):
+            try:
+                os.unlink(target)
+            except OSError:
+                pass
+
+    def prune(self, max_size=0, max_age=None):
+        """
+        Evict the least recently used artifacts until the total size is
+        at or below max_size, along with the artifacts that have not
+        been used for max_age seconds.  Return the list of evicted
+        fingerprints.
+        """
+
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        cutoff = None if max_age is None else time.time() - max_age
+        evicted = []
+        for fingerprint, size, last_used in entries:
+            if total <= max_size and (cutoff is None or last_used >= cutoff):
+                continue
+            self.remove(fingerprint)
+            total -= size
+            evicted.append(fingerprint)
+        if evicted:
+            logger.info(
+                "evicted %d artifacts from artifact store '%s'",
+                len(evicted), self.root)
+        return evicted
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for a remote build cache server, for testing.
+"""
+
+from __future__ import absolute_import
+
+import threading
+
+try:  # pragma: no cover
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *a):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        blob = self.server.blobs.get(self.path)
+        if blob is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(blob)))
+        self.end_headers()
+        self.wfile.write(blob)
+
+    def do_PUT(self):
+        self.server.requests.append(('PUT', self.path))
+        length = int(self.headers.get('Content-Length', 0))
+        blob = self.rfile.read(length)
+        if self.server.read_only:
+            self.send_error(403)
+            return
+        self.server.blobs[self.path] = blob
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class CacheServer(HTTPServer):
+    """
+    An in-memory blob server listening on localhost, which accepts GET
+    and PUT requests for any path; to be used as a context manager,
+    where the server will be running for the duration.
+    """
+
+    def __init__(self, read_only=False):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), CacheRequestHandler)
+        self.blobs = {}
+        self.requests = []
+        self.read_only = read_only
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d/cache/' % self.server_address
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
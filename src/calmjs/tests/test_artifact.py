@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import base64
+import bz2
+import gzip
+import hashlib
 import unittest
 import sys
 import os
@@ -25,6 +29,7 @@ from calmjs.artifact import ArtifactBuilder
 from calmjs.artifact import ArtifactRegistry
 from calmjs.artifact import extract_builder_result
 from calmjs.artifact import prepare_export_location
+from calmjs.artifact import process_export_target
 from calmjs.artifact import trace_toolchain
 from calmjs.artifact import verify_builder
 from calmjs.types.exceptions import ToolchainAbort
@@ -33,7 +38,9 @@ from calmjs.toolchain import Spec
 
 from calmjs.testing import utils
 from calmjs.testing import mocks
+from calmjs.testing.artifact import ArtifactToolchain
 from calmjs.testing.artifact import generic_builder
+from calmjs.testing.cache import CacheServer
 
 
 class IntegrationTestCase(unittest.TestCase):
@@ -142,6 +149,56 @@ class UtilsTestCase(unittest.TestCase):
             }
         }])
 
+    def test_process_export_target(self):
+        export_target = join(utils.mkdtemp(self), 'artifact.js')
+        content = b'var artifact = "artifact";\n' * 1000
+        with open(export_target, 'wb') as fd:
+            fd.write(content)
+
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            result = process_export_target(
+                export_target, compressions=('gz', 'bz2', 'nope'),
+                integrity_algorithms=('sha256',), chunk_size=100)
+        self.assertIn("unsupported compression 'nope'", s.getvalue())
+
+        self.assertEqual(len(content), result['size'])
+        self.assertEqual({'sha256': 'sha256-' + base64.b64encode(
+            hashlib.sha256(content).digest()).decode('ascii')},
+            result['integrity'])
+        self.assertEqual(['bz2', 'gz'], sorted(result['compressed']))
+        self.assertEqual(
+            'artifact.js.bz2', result['compressed']['bz2']['filename'])
+        with gzip.open(export_target + '.gz') as fd:
+            self.assertEqual(content, fd.read())
+        with bz2.BZ2File(export_target + '.bz2') as fd:
+            self.assertEqual(content, fd.read())
+        self.assertEqual(
+            os.path.getsize(export_target + '.gz'),
+            result['compressed']['gz']['size'])
+        self.assertLess(result['compressed']['gz']['size'], len(content))
+
+        # reproducible output
+        with open(export_target + '.gz', 'rb') as fd:
+            gz = fd.read()
+        process_export_target(export_target)
+        with open(export_target + '.gz', 'rb') as fd:
+            self.assertEqual(gz, fd.read())
+
+    def test_process_export_target_not_file(self):
+        tmpdir = utils.mkdtemp(self)
+        self.assertEqual({}, process_export_target(tmpdir))
+        self.assertEqual({}, process_export_target(join(tmpdir, 'no.js')))
+
+    def test_process_export_target_failure(self):
+        export_target = join(utils.mkdtemp(self), 'artifact.js')
+        with open(export_target, 'w') as fd:
+            fd.write('artifact')
+        # a directory in the way of the compressed sibling.
+        os.mkdir(export_target + '.gz')
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertEqual({}, process_export_target(export_target))
+        self.assertIn('failed to process export target', s.getvalue())
+
 
 class ArtifactRegistryTestCase(unittest.TestCase):
     """
@@ -580,9 +637,29 @@ class ArtifactRegistryTestCase(unittest.TestCase):
         with open(partial[0]) as fd:
             self.assertEqual(fd.read(), 'app')
 
+        # the artifacts are processed for compressed siblings and
+        # integrity values.
+        processed = {
+            'size': 3,
+            'integrity': {
+                'sha256':
+                    'sha256-oXLO3K5HR0thXFTVEKXYSo3qMDLpWFh0MLQTU4vj8zM=',
+                'sha384':
+                    'sha384-eHhHA5yRWyrA39S98cz2A2QMX97dgcouvSCGeivEhVGH4n/L'
+                    '3CzYW4PPvcsd5jL3',
+            },
+        }
+        for path in complete + partial:
+            self.assertTrue(exists(path + '.gz'))
+            with gzip.open(path + '.gz') as fd:
+                self.assertEqual(b'app', fd.read())
         self.assertEqual({
             'calmjs_artifacts': {
-                'artifact.js': {
+                'artifact.js': dict({
+                    'compressed': {'gz': {
+                        'filename': 'artifact.js.gz',
+                        'size': os.path.getsize(complete[0] + '.gz'),
+                    }},
                     'builder': 'calmjs_testing_dummy:complete',
                     'toolchain_bases': [
                         {'calmjs.testing.artifact:ArtifactToolchain': {
@@ -599,8 +676,12 @@ class ArtifactRegistryTestCase(unittest.TestCase):
                         }}
                     ],
                     'toolchain_bin': ['artifact', '0.0.0'],
-                },
-                'partial.js': {
+                }, **processed),
+                'partial.js': dict({
+                    'compressed': {'gz': {
+                        'filename': 'partial.js.gz',
+                        'size': os.path.getsize(partial[0] + '.gz'),
+                    }},
                     'builder': 'calmjs_testing_dummy:partial',
                     'toolchain_bases': [
                         {'calmjs.testing.artifact:ArtifactToolchain': {
@@ -616,7 +697,7 @@ class ArtifactRegistryTestCase(unittest.TestCase):
                         }}
                     ],
                     'toolchain_bin': ['artifact', '0.0.0'],
-                }
+                }, **processed)
             },
             'versions': [
                 'app 1.0',
@@ -653,6 +734,150 @@ class ArtifactRegistryTestCase(unittest.TestCase):
         builder = ArtifactBuilder('calmjs.artifacts')
         self.assertTrue(builder(['app']))
 
+    def test_build_artifacts_store(self):
+        linked = []
+        source_root = utils.mkdtemp(self)
+        with open(join(source_root, 'mod.js'), 'w') as fd:
+            fd.write('var mod = 1;')
+
+        class LinkTrackingToolchain(ArtifactToolchain):
+            def link(self, spec):
+                linked.append(spec['export_target'])
+                super(LinkTrackingToolchain, self).link(spec)
+
+        def builder(package_names, export_target):
+            return LinkTrackingToolchain(), Spec(
+                package_names=package_names,
+                export_target=export_target,
+                transpile_sourcepath={'mod': join(source_root, 'mod.js')},
+            )
+
+        mod = ModuleType('calmjs_testing_dummy')
+        mod.builder = builder
+        self.addCleanup(sys.modules.pop, 'calmjs_testing_dummy')
+        sys.modules['calmjs_testing_dummy'] = mod
+
+        store_root = utils.mkdtemp(self)
+        utils.stub_os_environ(self)
+        os.environ['CALMJS_ARTIFACT_STORE'] = store_root
+
+        def make_registry():
+            # a separate checkout of the same package.
+            working_dir = utils.mkdtemp(self)
+            utils.make_dummy_dist(self, (
+                ('entry_points.txt', '\n'.join([
+                    '[calmjs.artifacts]',
+                    'artifact.js = calmjs_testing_dummy:builder',
+                ])),
+            ), 'app', '1.0', working_dir=working_dir)
+            mock_ws = WorkingSet([working_dir])
+            utils.stub_item_attr_value(
+                self, dist, 'default_working_set', mock_ws)
+            return ArtifactRegistry('calmjs.artifacts', _working_set=mock_ws)
+
+        registry1 = make_registry()
+        registry1.process_package('app')
+        target1 = registry1.records[('app', 'artifact.js')]
+        self.assertEqual(1, len(registry1.store.entries()))
+        metadata1 = registry1.get_artifact_metadata('app')
+
+        registry2 = make_registry()
+        target2 = registry2.records[('app', 'artifact.js')]
+        self.assertNotEqual(target1, target2)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            registry2.process_package('app')
+        self.assertIn('retrieved from artifact store', s.getvalue())
+        # the toolchain was not executed for the second one.
+        self.assertEqual([target1], linked)
+        with open(target2) as fd:
+            self.assertEqual('app', fd.read())
+        self.assertTrue(exists(target2 + '.gz'))
+        self.assertEqual(metadata1, registry2.get_artifact_metadata('app'))
+
+        # changing the sources will result in a new build.
+        with open(join(source_root, 'mod.js'), 'w') as fd:
+            fd.write('var mod = 2;')
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            registry2.process_package('app')
+        self.assertNotIn('retrieved from artifact store', s.getvalue())
+        self.assertEqual([target1, target2], linked)
+        self.assertEqual(2, len(registry2.store.entries()))
+
+    def test_build_artifacts_build_cache(self):
+        linked = []
+        source_root = utils.mkdtemp(self)
+        with open(join(source_root, 'mod.js'), 'w') as fd:
+            fd.write('var mod = 1;')
+
+        class LinkTrackingToolchain(ArtifactToolchain):
+            def link(self, spec):
+                linked.append(spec['export_target'])
+                super(LinkTrackingToolchain, self).link(spec)
+
+        def builder(package_names, export_target):
+            return LinkTrackingToolchain(), Spec(
+                package_names=package_names,
+                export_target=export_target,
+                transpile_sourcepath={'mod': join(source_root, 'mod.js')},
+            )
+
+        mod = ModuleType('calmjs_testing_dummy')
+        mod.builder = builder
+        self.addCleanup(sys.modules.pop, 'calmjs_testing_dummy')
+        sys.modules['calmjs_testing_dummy'] = mod
+        utils.stub_os_environ(self)
+
+        def make_registry():
+            # a separate host building the same package.
+            working_dir = utils.mkdtemp(self)
+            utils.make_dummy_dist(self, (
+                ('entry_points.txt', '\n'.join([
+                    '[calmjs.artifacts]',
+                    'artifact.js = calmjs_testing_dummy:builder',
+                ])),
+            ), 'app', '1.0', working_dir=working_dir)
+            mock_ws = WorkingSet([working_dir])
+            utils.stub_item_attr_value(
+                self, dist, 'default_working_set', mock_ws)
+            return ArtifactRegistry('calmjs.artifacts', _working_set=mock_ws)
+
+        with CacheServer() as server:
+            os.environ['CALMJS_BUILD_CACHE'] = server.url
+            registry1 = make_registry()
+            self.assertIsNone(registry1.store)
+            registry1.process_package('app')
+            metadata1 = registry1.get_artifact_metadata('app')
+            # the artifact along with the transpiled module
+            self.assertEqual(2, len(server.blobs))
+
+            os.environ['CALMJS_BUILD_CACHE_MODE'] = 'read-only'
+            registry2 = make_registry()
+            target2 = registry2.records[('app', 'artifact.js')]
+            with pretty_logging(stream=mocks.StringIO()) as s:
+                registry2.process_package('app')
+
+        self.assertIn('retrieved from build cache', s.getvalue())
+        self.assertEqual(1, len(linked))
+        with open(target2) as fd:
+            self.assertEqual('app', fd.read())
+        self.assertEqual(metadata1, registry2.get_artifact_metadata('app'))
+        # nothing was written by the read-only registry.
+        self.assertEqual(2, len([
+            method for method, path in server.requests if method == 'PUT']))
+
+    def test_cache_artifact_missing_export_target(self):
+        from calmjs.cache import BuildCache
+        from calmjs.cache import FilesystemCacheBackend
+        registry = ArtifactRegistry(
+            'calmjs.artifacts', _working_set=mocks.WorkingSet({}))
+        root = join(utils.mkdtemp(self), 'cache')
+        registry.build_cache = BuildCache(FilesystemCacheBackend(root))
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            registry.cache_artifact(
+                'abcdef', join(root, 'missing.js'), {})
+        self.assertIn('failed to read artifact', s.getvalue())
+        self.assertFalse(exists(root))
+
 
 class ArtifactRegistryBuildFailureTestCase(unittest.TestCase):
     """
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import pickle
+import sys
 from os.path import join
 from os.path import normcase
 from os.path import pathsep
@@ -11,11 +13,13 @@ from pkg_resources import WorkingSet
 from pkg_resources import safe_name
 
 from calmjs import base
+from calmjs.trace import Tracer
 from calmjs.utils import pretty_logging
 from calmjs.testing import mocks
 from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import create_fake_bin
 from calmjs.testing.utils import make_dummy_dist
+from calmjs.testing.utils import stub_item_attr_value
 
 
 class DummyModuleRegistry(base.BaseModuleRegistry):
@@ -249,6 +253,161 @@ class BaseModuleRegistryTestCase(unittest.TestCase):
         record2 = registry.get_record('calmjs.testing.module1')
         self.assertIsNot(record1, record2)
 
+    def test_record_views(self):
+        from calmjs.testing import module1
+        from calmjs.testing import module2
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        registry = DummyModuleRegistry(__name__, _working_set=working_set)
+
+        view = registry.get_record_view('calmjs.testing.module1')
+        self.assertEqual(view, {'calmjs.testing.module1': module1})
+        with self.assertRaises(TypeError):
+            view['calmjs.testing.module1'] = None
+        self.assertEqual(registry.get_record_view('missing'), {})
+
+        view = registry.get_records_view_for_package('calmjs.testing')
+        self.assertEqual(dict(view), {
+            'calmjs.testing.module1': module1,
+            'calmjs.testing.module2': module2,
+        })
+        self.assertEqual(2, len(view))
+        self.assertIn('calmjs.testing.module2', view)
+        self.assertEqual(
+            view.copy(), registry.get_records_for_package('calmjs.testing'))
+        self.assertEqual(
+            dict(registry.get_records_view_for_package('calmjs')), {})
+
+    def test_record_views_overridden_get_record(self):
+        class OverriddenModuleRegistry(DummyModuleRegistry):
+            def get_record(self, name):
+                return {'overridden': name}
+
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        registry = OverriddenModuleRegistry(
+            __name__, _working_set=working_set)
+        self.assertEqual(registry.get_record_view('some.name'), {
+            'overridden': 'some.name'})
+        self.assertEqual(
+            dict(registry.get_records_view_for_package('calmjs.testing')),
+            {'overridden': 'calmjs.testing.module1'},
+        )
+
+    def test_chained_records_view(self):
+        view = base.ChainedRecordsView([{'a': 1, 'b': 1}, {'b': 2, 'c': 2}])
+        self.assertEqual(view['a'], 1)
+        self.assertEqual(view['b'], 2)
+        self.assertEqual(sorted(view), ['a', 'b', 'c'])
+        self.assertEqual(3, len(view))
+        self.assertNotIn('d', view)
+        with self.assertRaises(KeyError):
+            view['d']
+        self.assertEqual({'a': 1, 'b': 2, 'c': 2}, view.copy())
+        self.assertIn('ChainedRecordsView', repr(view))
+
+    def test_compact_record(self):
+        paths = {
+            'pkg/mod': join('root', 'site', 'pkg', 'mod.js'),
+            'pkg/sub/mod': join('root', 'site', 'pkg', 'sub', 'mod.js'),
+            'pkg/a': join('root', 'site', 'pkg', 'a.js'),
+        }
+        record = base.CompactRecord(paths)
+        self.assertEqual(join('root', 'site', 'pkg'), record._prefix)
+        self.assertEqual(paths, record)
+        self.assertEqual(paths, record.copy())
+        self.assertEqual(['pkg/a', 'pkg/mod', 'pkg/sub/mod'], list(record))
+        self.assertEqual(paths['pkg/sub/mod'], record['pkg/sub/mod'])
+        self.assertNotIn('pkg/b', record)
+        self.assertNotIn(1, record)
+        with self.assertRaises(TypeError):
+            record['pkg/a'] = None
+        self.assertEqual(record, pickle.loads(pickle.dumps(record)))
+        self.assertIn('CompactRecord', repr(record))
+
+        # values that are not strings sharing a directory are kept.
+        record = base.CompactRecord({'b': 2, 'a': 'a.js'})
+        self.assertIsNone(record._prefix)
+        self.assertEqual({'a': 'a.js', 'b': 2}, record.copy())
+        self.assertEqual({}, base.CompactRecord({}))
+
+    def test_compact_records_registered(self):
+        from calmjs.testing import module1
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]})
+        registry = DummyModuleRegistry(__name__, _working_set=working_set)
+        record = registry.records['calmjs.testing.module1']
+        # the dicts as produced are stored by default.
+        self.assertIs(type(record), dict)
+        with pretty_logging(stream=mocks.StringIO()):
+            registry._register_records_map(
+                registry.raw_entry_points[0],
+                {'calmjs.testing.module1': {'extra': 'extra.js'}},
+            )
+        self.assertIs(record, registry.records['calmjs.testing.module1'])
+        self.assertEqual('extra.js', record['extra'])
+
+        class CompactModuleRegistry(DummyModuleRegistry):
+            compact_records = True
+
+        registry = CompactModuleRegistry(__name__, _working_set=working_set)
+        record = registry.records['calmjs.testing.module1']
+        self.assertTrue(isinstance(record, base.CompactRecord))
+        view = registry.get_record_view('calmjs.testing.module1')
+
+        # declaring the module again replaces the stored record, which
+        # the existing views will reflect.
+        with pretty_logging(stream=mocks.StringIO()):
+            registry._register_records_map(
+                registry.raw_entry_points[0],
+                {'calmjs.testing.module1': {'extra': 'extra.js'}},
+            )
+        self.assertEqual({
+            'calmjs.testing.module1': module1,
+            'extra': 'extra.js',
+        }, view)
+        self.assertEqual(2, len(view))
+        self.assertEqual(dict(view), view.copy())
+        self.assertIn('RecordView', repr(view))
+
+    def test_memory_report(self):
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        registry = DummyModuleRegistry(__name__, _working_set=working_set)
+        report = registry.memory_report()
+        self.assertEqual(__name__, report['registry_name'])
+        self.assertEqual(2, report['records'])
+        self.assertEqual(
+            ['package_module_map', 'records', 'sourcepath_index'],
+            sorted(report['attributes']))
+        self.assertEqual(sum(report['attributes'].values()), report['bytes'])
+        self.assertTrue(all(
+            size > 0 for size in report['attributes'].values()))
+
+        registry.records.clear()
+        self.assertGreater(report['bytes'], registry.memory_report()['bytes'])
+        self.assertEqual(0, registry.memory_report()['records'])
+
+    def test_sizeof(self):
+        shared = 'x' * 100
+        single = base._sizeof([shared], set())
+        self.assertGreater(single, 100)
+        # shared objects are only counted once.
+        self.assertLess(
+            base._sizeof([shared, shared], set()), single + len(shared))
+        seen = set()
+        self.assertGreater(base._sizeof(shared, seen), 0)
+        self.assertEqual(0, base._sizeof(shared, seen))
+        # the contents of other objects are not counted.
+        self.assertEqual(
+            base._sizeof(base, set()), sys.getsizeof(base))
+
     def test_dupe_register(self):
         # returned records should clones.
         working_set = mocks.WorkingSet({__name__: [
@@ -309,6 +468,78 @@ class BaseExternalModuleRegistryTestCase(unittest.TestCase):
             'dummy/whatever/module-slim.js',
         ])
 
+        self.assertEqual(registry.get_record_view('module'), frozenset([
+            'dummy/whatever/module.js',
+            'dummy/whatever/module-slim.js',
+        ]))
+        self.assertIs(
+            registry.get_record_view('module'),
+            registry.get_record_view('module'),
+        )
+        self.assertEqual(registry.get_record_view('missing'), frozenset())
+        self.assertEqual(
+            registry.get_records_view_for_package('calmjs.testing'), (
+                'dummy/whatever/module.js',
+                'dummy/whatever/module-slim.js',
+            ))
+
+    def test_refresh(self):
+        tmpdir = mkdtemp(self)
+        processed = []
+
+        class TrackingRegistry(base.BaseExternalModuleRegistry):
+            def process_entry_point(self, entry_point):
+                processed.append(str(entry_point))
+                return [entry_point.name]
+
+        def make_dist(name, *entry_points):
+            dist = make_dummy_dist(self, ((
+                'entry_points.txt', '[calmjs.testing.refresh]\n' + ''.join(
+                    '%s\n' % entry_point for entry_point in entry_points)
+            ),), name, '1.0', working_dir=tmpdir)
+            # ensure the change is registered
+            st = os.stat(dist.egg_info)
+            os.utime(dist.egg_info, (
+                st.st_atime, st.st_mtime + len(processed)))
+            return dist
+
+        make_dist('pkg1', 'a/shared.js = shared', 'a/one.js = one')
+        pkg2 = make_dist('pkg2', 'b/shared.js = shared', 'b/two.js = two')
+        working_set = WorkingSet([tmpdir])
+        registry = TrackingRegistry(
+            'calmjs.testing.refresh', _working_set=working_set)
+        one = registry.records['one']
+
+        # only the records of the modules declared by the changed
+        # distribution are built again.
+        make_dist('pkg2', 'b/shared2.js = shared')
+        working_set.__init__([tmpdir])
+        del processed[:]
+        self.assertEqual({'pkg2'}, registry.refresh())
+        self.assertEqual([
+            'a/shared.js = shared',
+            'b/shared2.js = shared',
+        ], sorted(processed))
+        self.assertIs(one, registry.records['one'])
+        self.assertEqual(['one', 'shared'], sorted(registry.records))
+        self.assertEqual(
+            {'a/shared.js', 'b/shared2.js'}, registry.get_record('shared'))
+        self.assertEqual(
+            ['a/one.js', 'a/shared.js'],
+            sorted(registry.get_records_for_package('pkg1')))
+        self.assertEqual(
+            ['b/shared2.js'], registry.get_records_for_package('pkg2'))
+
+        # removal of the distribution
+        os.unlink(join(pkg2.egg_info, 'entry_points.txt'))
+        os.rmdir(pkg2.egg_info)
+        working_set.__init__([tmpdir])
+        del processed[:]
+        self.assertEqual({'pkg2'}, registry.refresh())
+        self.assertEqual(['a/shared.js = shared'], processed)
+        self.assertEqual({'a/shared.js'}, registry.get_record('shared'))
+        self.assertNotIn('pkg2', registry.package_module_map)
+
     def test_record_internal_normalization(self):
         make_dummy_dist(self, ((
             'entry_points.txt',
@@ -446,6 +677,28 @@ class BaseDriverClassTestCase(unittest.TestCase):
         driver = base.BaseDriver()
         self.assertEqual(driver.dumps({'a': 1}), '{\n    "a": 1\n}')
 
+    def test_exec_bytes_args_traced(self):
+        calls = []
+
+        def fork_exec(args, stdin, **kw):
+            calls.append(args)
+            return b'', b''
+
+        tracer = Tracer()
+        stub_item_attr_value(self, base, 'fork_exec', fork_exec)
+        stub_item_attr_value(self, base, 'tracer', tracer)
+        driver = base.BaseDriver()
+        driver._get_exec_binary = lambda kw: 'prog'
+        self.assertEqual((b'', b''), driver._exec('prog', args=[b'value']))
+        self.assertEqual([], tracer.events)
+
+        tracer.start(join(mkdtemp(self), 'trace.json'))
+        self.assertEqual((b'', b''), driver._exec('prog', args=[b'value']))
+        self.assertEqual([['prog', b'value']] * 2, calls)
+        self.assertEqual(1, len(tracer.events))
+        self.assertEqual('driver', tracer.events[0]['cat'])
+        self.assertIn('prog ', tracer.events[0]['args']['args'])
+
     def test_get_exec_binary_no_binary(self):
         with self.assertRaises(OSError):
             base._get_exec_binary('no_such_binary_hopefully', {})
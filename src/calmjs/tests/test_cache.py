@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import unittest
+from os.path import dirname
+from os.path import exists
+from os.path import join
+from os.path import relpath
+
+from calmjs.cache import BuildCache
+from calmjs.cache import FilesystemCacheBackend
+from calmjs.cache import HTTPCacheBackend
+from calmjs.cache import READ_ONLY
+from calmjs.cache import backend_for
+from calmjs.cache import fingerprint
+from calmjs.cache import pack
+from calmjs.cache import seal
+from calmjs.cache import unpack
+from calmjs.cache import verify
+from calmjs.toolchain import ES5MinifyToolchain
+from calmjs.toolchain import ES5Toolchain
+from calmjs.toolchain import NullToolchain
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.testing.cache import CacheServer
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+
+
+def write(path, content):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+def read(path):
+    with open(path) as fd:
+        return fd.read()
+
+
+class UtilsTestCase(unittest.TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint('a', 1), fingerprint('a', 1))
+        self.assertNotEqual(fingerprint('a', 1), fingerprint('a', 2))
+
+    def test_pack_unpack(self):
+        data = pack({'name': 'value'}, [b'abc', b'', b'\n\nxyz'])
+        self.assertEqual(
+            ({'name': 'value'}, [b'abc', b'', b'\n\nxyz']), unpack(data))
+        self.assertEqual(({}, []), unpack(pack({})))
+        with self.assertRaises(ValueError):
+            unpack(data[:-1])
+
+    def test_seal_verify(self):
+        blob = seal(b'data\nmore')
+        self.assertEqual(b'data\nmore', verify(blob))
+        with self.assertRaises(ValueError):
+            verify(blob[:-1])
+        with self.assertRaises(ValueError):
+            verify(b'data')
+
+    def test_backend_for(self):
+        self.assertTrue(isinstance(
+            backend_for('http://localhost/'), HTTPCacheBackend))
+        backend = backend_for('file:///tmp/cache')
+        self.assertTrue(isinstance(backend, FilesystemCacheBackend))
+        self.assertEqual('/tmp/cache', backend.root)
+
+
+class BackendTestCase(unittest.TestCase):
+
+    def test_filesystem(self):
+        backend = FilesystemCacheBackend(join(mkdtemp(self), 'cache'))
+        self.assertIsNone(backend.get('abcdef'))
+        backend.put('abcdef', b'blob')
+        self.assertEqual(b'blob', backend.get('abcdef'))
+        self.assertTrue(exists(join(backend.root, 'ab', 'abcdef')))
+
+    def test_http(self):
+        with CacheServer() as server:
+            backend = HTTPCacheBackend(server.url)
+            self.assertIsNone(backend.get('abcdef'))
+            backend.put('abcdef', b'blob')
+            self.assertEqual(b'blob', backend.get('abcdef'))
+        self.assertEqual([
+            ('GET', '/cache/abcdef'),
+            ('PUT', '/cache/abcdef'),
+            ('GET', '/cache/abcdef'),
+        ], server.requests)
+
+    def test_http_incomplete_read(self):
+        from calmjs import cache
+
+        class Response(object):
+            def read(self):
+                raise cache.HTTPException('incomplete read')
+
+            def close(self):
+                pass
+
+        stub_item_attr_value(
+            self, cache, 'urlopen', lambda *a, **kw: Response())
+        backend = HTTPCacheBackend('http://localhost/')
+        with self.assertRaises(IOError):
+            backend.get('abcdef')
+
+    def test_http_failures(self):
+        with CacheServer(read_only=True) as server:
+            backend = HTTPCacheBackend(server.url)
+            with self.assertRaises(IOError):
+                backend.put('abcdef', b'blob')
+        # server no longer running
+        with self.assertRaises(IOError):
+            backend.get('abcdef')
+
+
+class BuildCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = join(mkdtemp(self), 'cache')
+        self.cache = BuildCache(FilesystemCacheBackend(self.root))
+
+    def test_modes(self):
+        with self.assertRaises(ValueError):
+            BuildCache(None, mode='write-only')
+        self.assertTrue(self.cache.put('abcdef', b'data'))
+        self.assertEqual(b'data', self.cache.get('abcdef'))
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+        cache = BuildCache(self.cache.backend, mode=READ_ONLY)
+        self.assertFalse(cache.put('fedcba', b'data'))
+        self.assertIsNone(cache.get('fedcba'))
+        self.assertEqual(b'data', cache.get('abcdef'))
+
+    def test_from_environ(self):
+        self.assertIsNone(BuildCache.from_environ({}))
+        cache = BuildCache.from_environ({'CALMJS_BUILD_CACHE': self.root})
+        self.assertEqual('read-write', cache.mode)
+        cache = BuildCache.from_environ({
+            'CALMJS_BUILD_CACHE': 'http://localhost/',
+            'CALMJS_BUILD_CACHE_MODE': 'read-only',
+        })
+        self.assertTrue(isinstance(cache.backend, HTTPCacheBackend))
+        self.assertFalse(cache.writable)
+        with pretty_logging(stream=StringIO()) as s:
+            cache = BuildCache.from_environ({
+                'CALMJS_BUILD_CACHE': self.root,
+                'CALMJS_BUILD_CACHE_MODE': 'bogus',
+            })
+        self.assertEqual('read-write', cache.mode)
+        self.assertIn('invalid CALMJS_BUILD_CACHE_MODE', s.getvalue())
+
+    def test_corrupted_blob(self):
+        self.cache.put('abcdef', b'data')
+        path = join(self.root, 'ab', 'abcdef')
+        with open(path, 'rb') as fd:
+            blob = fd.read()
+        with open(path, 'wb') as fd:
+            fd.write(blob[:-1] + b'x')
+        with pretty_logging(stream=StringIO()) as s:
+            self.assertIsNone(self.cache.get('abcdef'))
+        self.assertIn("discarding blob 'abcdef'", s.getvalue())
+        self.assertIn('digest mismatch', s.getvalue())
+
+    def test_backend_failure(self):
+        with CacheServer() as server:
+            pass
+        cache = BuildCache(HTTPCacheBackend(server.url, timeout=5))
+        with pretty_logging(stream=StringIO()) as s:
+            self.assertIsNone(cache.get('abcdef'))
+            self.assertFalse(cache.put('abcdef', b'data'))
+        self.assertIn("failed to retrieve 'abcdef'", s.getvalue())
+        self.assertIn("failed to store 'abcdef'", s.getvalue())
+
+    def test_memoize(self):
+        calls = []
+        source = join(mkdtemp(self), 'mod.js')
+        write(source, 'var mod = 1;')
+
+        def processor(spec, entry):
+            calls.append(entry)
+            modname, source, target, modpath = entry
+            os.makedirs(join(spec['build_dir'], 'ns'))
+            write(join(spec['build_dir'], target), read(source))
+            write(join(spec['build_dir'], target + '.map'), '{}')
+            return {modname: modpath}, {modname: target}, [modname]
+
+        wrapped = self.cache.memoize('ns:Toolchain', 'transpile', processor)
+        entry = ('ns/mod', source, 'ns/mod.js', 'ns/mod')
+        expected = ({'ns/mod': 'ns/mod'}, {'ns/mod': 'ns/mod.js'}, ['ns/mod'])
+        spec1 = {'build_dir': mkdtemp(self)}
+        self.assertEqual(expected, wrapped(spec1, entry))
+        spec2 = {'build_dir': mkdtemp(self)}
+        self.assertEqual(expected, wrapped(spec2, entry))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(
+            'var mod = 1;', read(join(spec2['build_dir'], 'ns', 'mod.js')))
+        self.assertEqual(
+            '{}', read(join(spec2['build_dir'], 'ns', 'mod.js.map')))
+
+        # changed source, or different namespace, will be processed.
+        write(source, 'var mod = 2;')
+        wrapped({'build_dir': mkdtemp(self)}, entry)
+        self.assertEqual(2, len(calls))
+        self.cache.memoize('ns:Other', 'transpile', processor)(
+            {'build_dir': mkdtemp(self)}, entry)
+        self.assertEqual(3, len(calls))
+
+        # sources that do not exist are not cached
+        missing = ('ns/mod', join(self.root, 'nope.js'), 'ns/mod.js', 'x')
+        self.assertEqual('x', self.cache.memoize(
+            'ns', 'transpile', lambda spec, entry: entry[3])({}, missing))
+
+    def test_memoize_config(self):
+        source = join(mkdtemp(self), 'mod.js')
+        write(source, 'var mod = 1;')
+        calls = []
+
+        def processor(spec, entry):
+            calls.append(entry)
+            return {}, {}, []
+
+        entry = ('mod', source, 'mod.js', 'mod')
+        for config in ('a', 'b', 'a'):
+            self.cache.memoize('ns', 'transpile', processor, config=config)(
+                {'build_dir': mkdtemp(self)}, entry)
+        self.assertEqual(2, len(calls))
+
+    def test_memoize_reused(self):
+        source = join(mkdtemp(self), 'mod.js')
+        write(source, 'var mod = 1;')
+        reused = []
+
+        def processor(spec, entry):
+            modname, source, target, modpath = entry
+            write(join(spec['build_dir'], target), read(source))
+            return {modname: modpath}, {modname: target}, [modname]
+
+        wrapped = self.cache.memoize(
+            'ns', 'transpile', processor,
+            reused=lambda spec, entry, result: reused.append((entry, result)))
+        entry = ('mod', source, 'mod.js', 'mod')
+        wrapped({'build_dir': mkdtemp(self)}, entry)
+        self.assertEqual([], reused)
+        result = wrapped({'build_dir': mkdtemp(self)}, entry)
+        self.assertEqual([(entry, result)], reused)
+
+    def test_memoize_relocate_sourcemap(self):
+        source_root = mkdtemp(self)
+        source = join(source_root, 'src', 'mod.js')
+        os.mkdir(dirname(source))
+        write(source, 'var mod = 1;')
+
+        def processor(spec, entry):
+            modname, source, target, modpath = entry
+            path = join(spec['build_dir'], target)
+            if not exists(dirname(path)):
+                os.makedirs(dirname(path))
+            write(path, 'var mod = 1;')
+            write(path + '.map', json.dumps({
+                'version': 3,
+                'sources': [
+                    relpath(source, dirname(path)), source, 'other.js'],
+                'file': path,
+            }))
+            return {modname: modpath}, {modname: target}, [modname]
+
+        wrapped = self.cache.memoize('ns', 'transpile', processor)
+        entry = ('mod', source, 'ns/mod.js', 'mod')
+        wrapped({'build_dir': join(source_root, 'build')}, entry)
+        # a build directory at a different depth.
+        build_dir = join(source_root, 'src', 'deep', 'build')
+        os.makedirs(build_dir)
+        with pretty_logging(stream=StringIO()) as s:
+            wrapped({'build_dir': build_dir}, entry)
+        self.assertIn("restored the outputs for 'mod'", s.getvalue())
+        path = join(build_dir, 'ns', 'mod.js')
+        with open(path + '.map') as fd:
+            sourcemap = json.load(fd)
+        self.assertEqual(
+            ['../../../mod.js', source, 'other.js'], sourcemap['sources'])
+        self.assertEqual(path, sourcemap['file'])
+
+    def test_memoize_outside_build_dir(self):
+        source = join(mkdtemp(self), 'mod.js')
+        write(source, 'var mod = 1;')
+        calls = []
+
+        def processor(spec, entry):
+            calls.append(entry)
+            return {}, {}, []
+
+        wrapped = self.cache.memoize('ns', 'transpile', processor)
+        entry = ('mod', source, 'mod.js', 'mod')
+        # forge a cached result that would write outside build_dir
+        wrapped({'build_dir': mkdtemp(self)}, entry)
+        key = os.listdir(join(self.root, os.listdir(self.root)[0]))[0]
+        self.cache.put(key, pack({
+            'result': [{}, {}, []],
+            'files': ['../escaped.js'],
+        }, [b'escaped']))
+        build_dir = join(mkdtemp(self), 'build')
+        os.mkdir(build_dir)
+        with pretty_logging(stream=StringIO()) as s:
+            wrapped({'build_dir': build_dir}, entry)
+        self.assertIn('outside build_dir', s.getvalue())
+        self.assertEqual(2, len(calls))
+        self.assertFalse(exists(join(build_dir, '..', 'escaped.js')))
+
+
+class ToolchainBuildCacheTestCase(unittest.TestCase):
+
+    def test_toolchain_compile_cached(self):
+        source = join(mkdtemp(self), 'mod.js')
+        write(source, 'var mod = 1;\n')
+        with CacheServer() as server:
+            for i in range(2):
+                build_cache = BuildCache(HTTPCacheBackend(server.url))
+                spec = Spec(
+                    build_cache=build_cache,
+                    build_dir=mkdtemp(self),
+                    transpile_sourcepath={'ns/mod': source},
+                )
+                NullToolchain()(spec)
+                with open(join(spec['build_dir'], 'ns', 'mod.js')) as fd:
+                    self.assertEqual('var mod = 1;\n', fd.read())
+            # the second run was a cache hit
+            self.assertEqual((1, 0), (build_cache.hits, build_cache.misses))
+        self.assertEqual(
+            ['GET', 'PUT', 'GET'], [r[0] for r in server.requests])
+
+    def test_toolchain_compile_cached_transpiled_sizes(self):
+        source = join(mkdtemp(self), 'mod.js')
+        write(source, 'var mod = function() {\n};\n')
+        build_cache = BuildCache(FilesystemCacheBackend(mkdtemp(self)))
+        specs = []
+
+        class Toolchain(ES5Toolchain):
+            def assemble(self, spec):
+                pass
+
+            def link(self, spec):
+                pass
+
+        for i in range(2):
+            spec = Spec(
+                build_cache=build_cache,
+                build_dir=mkdtemp(self),
+                transpile_sourcepath={'mod': source},
+            )
+            Toolchain()(spec)
+            specs.append(spec)
+        cold, warm = specs
+        self.assertEqual((1, 1), (build_cache.hits, build_cache.misses))
+        self.assertIn('mod', cold['transpiled_sizes'])
+        self.assertEqual(cold['transpiled_sizes'], warm['transpiled_sizes'])
+        self.assertEqual(
+            cold['transpiled_sizes_total'], warm['transpiled_sizes_total'])
+
+    def test_toolchain_config_digest(self):
+        self.assertEqual(
+            ES5MinifyToolchain().config_digest(),
+            ES5MinifyToolchain().config_digest())
+        self.assertNotEqual(
+            ES5MinifyToolchain().config_digest(),
+            ES5MinifyToolchain(obfuscate=True).config_digest())
+        self.assertNotEqual(
+            NullToolchain().config_digest(),
+            ES5MinifyToolchain().config_digest())
+
+    def test_toolchain_config_digest_host_independent(self):
+        # attributes specific to the host are not included.
+        first = ES5MinifyToolchain(working_dir=mkdtemp(self))
+        second = ES5MinifyToolchain(working_dir=mkdtemp(self))
+        second.node_path = '/elsewhere/node_modules'
+        self.assertNotEqual(first.working_dir, second.working_dir)
+        self.assertEqual(first.config_digest(), second.config_digest())
+
+    def test_toolchain_build_cache_from_environ(self):
+        from calmjs.testing.utils import stub_os_environ
+        stub_os_environ(self)
+        root = join(mkdtemp(self), 'cache')
+        os.environ['CALMJS_BUILD_CACHE'] = root
+        os.environ['CALMJS_BUILD_CACHE_MODE'] = 'read-only'
+        spec = Spec()
+        NullToolchain()(spec)
+        self.assertEqual(root, spec['build_cache'].backend.root)
+        self.assertFalse(spec['build_cache'].writable)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from os.path import exists
+from os.path import join
+from os.path import realpath
+
+from calmjs.concat import CONCAT_MODULES
+from calmjs.concat import ConcatToolchain
+from calmjs.concat import LOADER
+from calmjs.concat import rebase_sourcemap
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+class RebaseSourcemapTestCase(unittest.TestCase):
+
+    def test_rebase_sourcemap(self):
+        sourcemap = {
+            'version': 3,
+            'sources': ['../../src/mod.js'],
+            'mappings': 'AAAA',
+        }
+        result = rebase_sourcemap(
+            sourcemap, join('root', 'build', 'ns', 'mod.js.map'),
+            join('root', 'dist'))
+        self.assertEqual(['../src/mod.js'], result['sources'])
+        self.assertEqual('AAAA', result['mappings'])
+        # original not modified
+        self.assertEqual(['../../src/mod.js'], sourcemap['sources'])
+
+    def test_rebase_sourcemap_source_root(self):
+        result = rebase_sourcemap({
+            'sourceRoot': '../src',
+            'sources': ['mod.js'],
+        }, join('root', 'build', 'mod.js.map'), 'root')
+        self.assertEqual(['src/mod.js'], result['sources'])
+        self.assertNotIn('sourceRoot', result)
+
+
+class ConcatToolchainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.toolchain = ConcatToolchain()
+        self.src_dir = realpath(mkdtemp(self))
+        self.dist_dir = realpath(mkdtemp(self))
+        self.sources = {}
+        for modname, code in (
+                ('app/main', 'var util = require("app/util");\n'
+                             'exports.value = util.double(21);\n'),
+                ('app/util', 'exports.double = function(x) {\n'
+                             '    return x * 2;\n};\n')):
+            path = join(self.src_dir, modname.replace('/', '_') + '.js')
+            with open(path, 'w') as fd:
+                fd.write(code)
+            self.sources[modname] = path
+        self.data = join(self.src_dir, 'data.json')
+        with open(self.data, 'w') as fd:
+            fd.write('{}')
+        self.vendor = join(self.src_dir, 'vendor.js')
+        with open(self.vendor, 'w') as fd:
+            fd.write('exports.name = "vendor";')
+
+    def make_spec(self, **kw):
+        return Spec(
+            export_target=join(self.dist_dir, 'bundle.js'),
+            transpile_sourcepath=self.sources,
+            bundle_sourcepath={
+                'vendor': self.vendor,
+                'data.json': self.data,
+            },
+            **kw
+        )
+
+    def test_prepare_no_export_target(self):
+        with self.assertRaises(ValueError):
+            self.toolchain.prepare(Spec())
+
+    def test_concat(self):
+        spec = self.make_spec()
+        with pretty_logging(logger='calmjs.concat', stream=StringIO()) as s:
+            self.toolchain(spec)
+        self.assertIn('concatenated 3 modules', s.getvalue())
+        self.assertEqual(
+            ['app/main', 'app/util', 'vendor'],
+            [modname for modname, path in spec[CONCAT_MODULES]])
+
+        with open(spec['export_target']) as fd:
+            result = fd.read()
+        self.assertTrue(result.startswith(LOADER))
+        self.assertIn(
+            '__calmjs_define__("app/util", '
+            'function(require, exports, module) {\n'
+            'exports.double = function(x) {\n', result)
+        self.assertIn('exports.name = "vendor";\n});\n', result)
+        self.assertNotIn('data.json', result)
+        self.assertNotIn('sourceMappingURL', result)
+        self.assertFalse(exists(spec['export_target'] + '.map'))
+
+    def test_concat_sourcemap(self):
+        spec = self.make_spec(generate_source_map=True)
+        self.toolchain(spec)
+
+        with open(spec['export_target']) as fd:
+            lines = fd.read().splitlines()
+        self.assertEqual('//# sourceMappingURL=bundle.js.map', lines[-1])
+        # the sourceMappingURL from the modules are removed.
+        self.assertEqual(1, len([
+            line for line in lines if 'sourceMappingURL' in line]))
+
+        with open(spec['export_target'] + '.map') as fd:
+            sourcemap = json.load(fd)
+        self.assertEqual(3, sourcemap['version'])
+        self.assertEqual('bundle.js', sourcemap['file'])
+        # only the transpiled modules have source maps.
+        sections = sourcemap['sections']
+        self.assertEqual(2, len(sections))
+        for section, modname in zip(sections, ['app/main', 'app/util']):
+            line = section['offset']['line']
+            self.assertEqual(0, section['offset']['column'])
+            # the offset points to the first line of the module, which
+            # immediately follows the definition.
+            self.assertIn(json.dumps(modname), lines[line - 1])
+            self.assertEqual(1, len(section['map']['sources']))
+            self.assertEqual(
+                realpath(self.sources[modname]),
+                realpath(join(self.dist_dir, section['map']['sources'][0])))
+        self.assertEqual(
+            'exports.double = function(x) {',
+            lines[sections[1]['offset']['line']])
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+from os.path import exists
+from os.path import join
+
+from pkg_resources import WorkingSet
+
+from calmjs import daemon
+from calmjs import runtime
+from calmjs.base import BaseModuleRegistry
+from calmjs.registry import Registry
+from calmjs.runtime import BaseRuntime
+from calmjs.utils import pretty_logging
+from calmjs.testing import mocks
+from calmjs.testing.utils import make_dummy_dist
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+from calmjs.testing.utils import stub_os_environ
+from calmjs.testing.utils import stub_stdouts
+
+
+class EchoRuntime(BaseRuntime):
+    """
+    echo the words and the current working directory
+    """
+
+    instances = 0
+
+    def __init__(self, *a, **kw):
+        EchoRuntime.instances += 1
+        super(EchoRuntime, self).__init__(*a, **kw)
+
+    def init_argparser(self, argparser):
+        super(EchoRuntime, self).init_argparser(argparser)
+        argparser.add_argument('words', nargs='*')
+
+    def run(self, argparser=None, words=(), **kwargs):
+        sys.stdout.write('%s\n' % ' '.join(words))
+        sys.stdout.write('cwd=%s\n' % os.getcwd())
+        sys.stdout.write('env=%s\n' % os.environ.get('CALMJS_DAEMON_TEST'))
+        sys.stderr.write('stderr output\n')
+        if 'raise' in words:
+            raise ValueError('raised')
+        return 'fail' not in words
+
+
+def touch_dir(path, offset):
+    # advance the modification time by offset seconds, as the
+    # resolution of the timestamps on the filesystem may be too
+    # coarse for the changes done within the test to register.
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + offset))
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def test_working_set_fingerprint(self):
+        tmpdir = mkdtemp(self)
+        make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'example.package', '1.0', working_dir=tmpdir)
+        working_set = WorkingSet([tmpdir])
+        first = daemon.working_set_fingerprint(working_set)
+        self.assertEqual(first, daemon.working_set_fingerprint(working_set))
+
+        # a new distribution, when picked up by a new working set.
+        make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'example.other', '1.0', working_dir=tmpdir)
+        touch_dir(tmpdir, 10)
+        # the entry was modified even if the working set is not updated
+        second = daemon.working_set_fingerprint(working_set)
+        self.assertNotEqual(first, second)
+        third = daemon.working_set_fingerprint(WorkingSet([tmpdir]))
+        self.assertNotEqual(second, third)
+
+    def test_sources_fingerprint(self):
+        tmpdir = mkdtemp(self)
+        source = join(tmpdir, 'module.js')
+        with open(source, 'w') as fd:
+            fd.write('var module = {};\n')
+        root = Registry(
+            'calmjs.registry', _working_set=mocks.WorkingSet({}))
+        registry = BaseModuleRegistry(
+            'test.module', _working_set=mocks.WorkingSet({}))
+        registry.records['example'] = {'example/module': source}
+        # no module registries
+        empty = daemon.sources_fingerprint(root)
+        root.records['test.module'] = registry
+        root.records['other'] = object()
+        first = daemon.sources_fingerprint(root)
+        self.assertNotEqual(empty, first)
+        self.assertEqual(first, daemon.sources_fingerprint(root))
+        touch_dir(tmpdir, 10)
+        self.assertNotEqual(first, daemon.sources_fingerprint(root))
+
+
+class DaemonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stub_os_environ(self)
+        self.daemon = daemon.Daemon(
+            EchoRuntime, path=join(mkdtemp(self), 'daemon.sock'),
+            working_set=mocks.WorkingSet({}))
+        stub_item_attr_value(
+            self, daemon, 'working_set_fingerprint', lambda ws: 'ws')
+        stub_item_attr_value(
+            self, daemon, 'sources_fingerprint', lambda: 'src')
+
+    def test_default_socket_path(self):
+        os.environ.pop(daemon.CALMJS_DAEMON_SOCKET, None)
+        self.assertTrue(daemon.default_socket_path().endswith('.sock'))
+        os.environ[daemon.CALMJS_DAEMON_SOCKET] = '/tmp/calmjs.sock'
+        self.assertEqual('/tmp/calmjs.sock', daemon.default_socket_path())
+
+    def test_execute(self):
+        tmpdir = mkdtemp(self)
+        cwd = os.getcwd()
+        original_stdout = sys.stdout
+        result = self.daemon.execute(
+            ['hello', 'world'], cwd=tmpdir,
+            environ={'CALMJS_DAEMON_TEST': 'value'})
+        self.assertEqual(0, result['code'])
+        words, cwd_line, env_line = result['stdout'].splitlines()
+        self.assertEqual('hello world', words)
+        self.assertEqual(
+            os.path.realpath(tmpdir), os.path.realpath(cwd_line[4:]))
+        self.assertEqual('env=value', env_line)
+        self.assertIn('stderr output', result['stderr'])
+        # everything restored
+        self.assertEqual(cwd, os.getcwd())
+        self.assertIs(original_stdout, sys.stdout)
+        self.assertNotIn('CALMJS_DAEMON_TEST', os.environ)
+
+    def test_execute_failures(self):
+        self.assertEqual(1, self.daemon.execute(['fail'])['code'])
+        result = self.daemon.execute(['raise'])
+        self.assertEqual(1, result['code'])
+        self.assertIn('ValueError: raised', result['stderr'])
+        # argparse exiting
+        result = self.daemon.execute(['--no-such-flag'])
+        self.assertEqual(2, result['code'])
+        result = self.daemon.execute(
+            [], cwd=join(mkdtemp(self), 'missing'))
+        self.assertEqual(2, result['code'])
+        self.assertIn('cannot change directory', result['stderr'])
+
+    def test_runtime_reused(self):
+        EchoRuntime.instances = 0
+        self.daemon.handle({'args': ['a']})
+        self.daemon.handle({'args': ['b']})
+        self.assertEqual(1, EchoRuntime.instances)
+
+    def test_handle_invalid(self):
+        self.assertEqual(2, self.daemon.handle(None)['code'])
+        self.assertEqual(2, self.daemon.handle({'args': 'a'})['code'])
+        self.assertEqual(2, self.daemon.handle({'args': [1]})['code'])
+
+    def test_refresh(self):
+        resets = []
+        self.daemon.reset = lambda: resets.append(True)
+        self.assertFalse(self.daemon.refresh())
+        self.assertFalse(self.daemon.refresh())
+        stub_item_attr_value(
+            self, daemon, 'sources_fingerprint', lambda: 'changed')
+        with pretty_logging(logger='calmjs.daemon', stream=mocks.StringIO()):
+            self.assertTrue(self.daemon.refresh())
+        self.assertEqual(1, len(resets))
+        self.assertFalse(self.daemon.refresh())
+
+    def test_refresh_working_set_changed(self):
+        calls = []
+        self.daemon.reset = lambda: calls.append('reset')
+        self.daemon.update = lambda: calls.append('update')
+        self.assertFalse(self.daemon.refresh())
+        stub_item_attr_value(
+            self, daemon, 'working_set_fingerprint', lambda ws: 'changed')
+        with pretty_logging(logger='calmjs.daemon', stream=mocks.StringIO()):
+            self.assertTrue(self.daemon.refresh())
+        self.assertEqual(['update'], calls)
+        self.assertFalse(self.daemon.refresh())
+
+    def test_update(self):
+        from calmjs import registry
+        refreshed = []
+        root = Registry('calmjs.registry', _working_set=mocks.WorkingSet({}))
+        root.refresh = lambda: refreshed.append(True) or set()
+        stub_item_attr_value(self, registry, '_inst', root)
+        self.daemon.runtime
+        self.daemon.update()
+        self.assertIsNone(self.daemon._runtime)
+        self.assertIs(root, registry._inst)
+        self.assertEqual([True], refreshed)
+
+    def test_reset(self):
+        from calmjs import registry
+        stub_item_attr_value(self, registry, '_inst', registry._inst)
+        original = registry._inst
+        self.daemon.runtime
+        self.daemon.reset()
+        self.assertIsNone(self.daemon._runtime)
+        self.assertIsNot(original, registry._inst)
+
+    @unittest.skipIf(daemon._AF_UNIX is None, 'no unix socket support')
+    def test_serve_bind_umask(self):
+        def get_umask():
+            umask = os.umask(0o022)
+            os.umask(umask)
+            return umask
+
+        umasks = []
+
+        class BindFailSocket(object):
+            def __init__(self, *a):
+                pass
+
+            def bind(self, path):
+                umasks.append(get_umask())
+                raise OSError('bind failed')
+
+            def close(self):
+                pass
+
+        original = get_umask()
+        stub_item_attr_value(self, daemon.socket, 'socket', BindFailSocket)
+        with self.assertRaises(OSError):
+            self.daemon.serve()
+        # the socket was created inaccessible to other users, with the
+        # original umask restored.
+        self.assertEqual([0o077], umasks)
+        self.assertEqual(original, get_umask())
+
+    @unittest.skipIf(daemon._AF_UNIX is None, 'no unix socket support')
+    def test_forward_connection_dropped(self):
+        path = self.daemon.path
+        server = socket.socket(daemon._AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(path)
+        server.listen(1)
+        requests = []
+
+        def drop():
+            # read the request, then close without a response.
+            connection, _ = server.accept()
+            requests.append(daemon.recv_message(connection))
+            connection.close()
+
+        thread = threading.Thread(target=drop)
+        thread.daemon = True
+        thread.start()
+
+        executed = []
+        stub_item_attr_value(
+            self, runtime, '_main', lambda *a: executed.append(a))
+        stub_stdouts(self)
+        os.environ[daemon.CALMJS_DAEMON_SOCKET] = path
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(['npm', '--view', 'calmjs'])
+        thread.join(5)
+        self.assertEqual(1, e.exception.code)
+        self.assertEqual(['npm', '--view', 'calmjs'], requests[0]['args'])
+        # as the request was sent, it is never executed locally.
+        self.assertEqual([], executed)
+        self.assertIn(
+            "no valid response from the daemon at '%s' "
+            "(connection closed)" % path, sys.stderr.getvalue())
+
+    @unittest.skipIf(daemon._AF_UNIX is None, 'no unix socket support')
+    def test_serve_forward_shutdown(self):
+        path = self.daemon.path
+        self.assertIsNone(daemon.forward(['hello'], path=path))
+        self.assertFalse(daemon.ping(path))
+
+        thread = threading.Thread(target=self.daemon.serve)
+        thread.daemon = True
+        thread.start()
+        for _ in range(100):
+            if daemon.ping(path):
+                break
+            time.sleep(0.05)
+        else:  # pragma: no cover
+            self.fail('daemon did not start')
+
+        # only one daemon per socket.
+        with self.assertRaises(OSError):
+            daemon.Daemon(EchoRuntime, path=path).serve()
+
+        stdout, stderr = mocks.StringIO(), mocks.StringIO()
+        code = daemon.forward(
+            ['hello', 'daemon'], path=path, stdout=stdout, stderr=stderr)
+        self.assertEqual(0, code)
+        self.assertIn('hello daemon', stdout.getvalue())
+        self.assertIn('stderr output', stderr.getvalue())
+        self.assertEqual(1, daemon.forward(
+            ['fail'], path=path, stdout=stdout, stderr=stderr))
+
+        self.assertTrue(daemon.shutdown(path))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(exists(path))
+        self.assertFalse(daemon.shutdown(path))
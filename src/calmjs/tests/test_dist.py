@@ -22,6 +22,7 @@ from calmjs.testing.mocks import MockProvider
 from calmjs.testing.mocks import StringIO
 from calmjs.testing.utils import make_dummy_dist
 from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
 from calmjs.testing.utils import stub_stdouts
 
 skip_integration = os.environ.get('CALMJS_SKIP_INTEGRATION')
@@ -211,6 +212,49 @@ class DistTestCase(unittest.TestCase):
         calmjs_dist.write_line_list('field', ei, self.pkgname, self.pkgname)
         self.assertEqual(ei.called[self.pkgname], None)
 
+    def test_write_module_index(self):
+        self.dist.entry_points = {
+            'calmjs.module': [
+                'calmjs.testing.module1 = calmjs.testing.module1',
+                'calmjs.testing.missing = calmjs.testing.missing',
+            ],
+            'console_scripts': [
+                'calmjs = calmjs.runtime:main',
+            ],
+        }
+        ei = Mock_egg_info(self.dist)
+        ei.initialize_options()
+
+        def get(registry_name):
+            raise AssertionError('registries must not be populated')
+
+        stub_item_attr_value(self, calmjs_dist, 'get', get)
+        with pretty_logging(stream=StringIO()) as stream:
+            calmjs_dist.write_module_index(
+                ei, self.pkgname, self.pkgname)
+        self.assertIn('calmjs.testing.missing not found', stream.getvalue())
+        self.assertEqual(json.loads(ei.called[self.pkgname]), {
+            'calmjs.module': {
+                'calmjs.testing.module1 = calmjs.testing.module1': {
+                    'calmjs.testing.module1': {
+                        'calmjs/testing/module1/hello':
+                            'calmjs/testing/module1/hello.js',
+                    },
+                },
+            },
+        })
+
+    def test_write_module_index_delete(self):
+        self.dist.entry_points = {
+            'console_scripts': [
+                'calmjs = calmjs.runtime:main',
+            ],
+        }
+        ei = Mock_egg_info(self.dist)
+        ei.initialize_options()
+        calmjs_dist.write_module_index(ei, self.pkgname, self.pkgname)
+        self.assertEqual(ei.called[self.pkgname], None)
+
     def test_find_pkg_dist(self):
         # Only really testing that this returns an actual distribution
         result = calmjs_dist.find_pkg_dist('setuptools')
@@ -689,6 +733,173 @@ class DistTestCase(unittest.TestCase):
             for d in calmjs_dist.find_packages_parents_requirements_dists(
                 ['lib2', 'lib1'], working_set=working_set)])
 
+    def test_resolution_cache(self):
+        lib = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([])),
+        ), 'lib', '1.0.0')
+        app = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([
+                'lib>=1.0.0',
+            ])),
+        ), 'app', '2.0')
+        working_set = pkg_resources.WorkingSet()
+        working_set.add(lib, self._calmjs_testing_tmpdir)
+        working_set.add(app, self._calmjs_testing_tmpdir)
+
+        cache = calmjs_dist.ResolutionCache()
+        requirements = [pkg_resources.Requirement.parse('app')]
+        first = cache.resolve(working_set, requirements)
+        self.assertEqual(['app', 'lib'], [d.project_name for d in first])
+        self.assertEqual({'hits': 0, 'misses': 1}, cache.stats())
+
+        # mutating the returned value will not affect the cache
+        first.pop()
+        second = cache.resolve(working_set, requirements)
+        self.assertEqual(['app', 'lib'], [d.project_name for d in second])
+        self.assertEqual({'hits': 1, 'misses': 1}, cache.stats())
+
+        # a different working set is tracked separately.
+        other_set = pkg_resources.WorkingSet()
+        other_set.add(lib, self._calmjs_testing_tmpdir)
+        cache.resolve(other_set, [pkg_resources.Requirement.parse('lib')])
+        self.assertEqual({'hits': 1, 'misses': 2}, cache.stats())
+
+        # explicit invalidation
+        cache.invalidate(working_set)
+        cache.resolve(working_set, requirements)
+        self.assertEqual({'hits': 1, 'misses': 3}, cache.stats())
+        cache.resolve(working_set, requirements)
+        cache.resolve(other_set, [pkg_resources.Requirement.parse('lib')])
+        self.assertEqual({'hits': 3, 'misses': 3}, cache.stats())
+        cache.invalidate()
+        cache.resolve(other_set, [pkg_resources.Requirement.parse('lib')])
+        self.assertEqual({'hits': 3, 'misses': 4}, cache.stats())
+
+    def test_resolution_cache_working_set_generation(self):
+        lib1 = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([])),
+        ), 'lib', '1.0.0')
+        app = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([
+                'lib>=1.0.0',
+            ])),
+        ), 'app', '2.0')
+        working_set = pkg_resources.WorkingSet()
+        working_set.add(lib1, self._calmjs_testing_tmpdir)
+        working_set.add(app, self._calmjs_testing_tmpdir)
+
+        cache = calmjs_dist.ResolutionCache()
+        requirements = [pkg_resources.Requirement.parse('app')]
+        self.assertEqual(['2.0', '1.0.0'], [
+            d.version for d in cache.resolve(working_set, requirements)])
+
+        # replacing the distribution will produce a new generation
+        lib2 = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([])),
+        ), 'lib', '2.0.0', working_dir=mkdtemp(self))
+        working_set.add(lib2, lib2.location, replace=True)
+        self.assertEqual(['2.0', '2.0.0'], [
+            d.version for d in cache.resolve(working_set, requirements)])
+        self.assertEqual({'hits': 0, 'misses': 2}, cache.stats())
+
+    def test_resolution_cache_unsupported_working_set(self):
+        class WorkingSet(object):
+            __slots__ = ()
+
+            def resolve(self, requirements):
+                return ['resolved']
+
+        cache = calmjs_dist.ResolutionCache()
+        self.assertEqual(['resolved'], cache.resolve(WorkingSet(), []))
+        self.assertEqual(['resolved'], cache.resolve(WorkingSet(), []))
+        self.assertEqual({'hits': 0, 'misses': 2}, cache.stats())
+
+    def test_find_packages_requirements_dists_cached(self):
+        lib = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([])),
+        ), 'lib', '1.0.0')
+        working_set = pkg_resources.WorkingSet()
+        working_set.add(lib, self._calmjs_testing_tmpdir)
+        stats = calmjs_dist.resolution_cache.stats()
+        for i in range(3):
+            self.assertEqual(['lib'], [
+                d.project_name
+                for d in calmjs_dist.find_packages_requirements_dists(
+                    ['lib'], working_set=working_set)])
+        self.assertEqual(
+            calmjs_dist.resolution_cache.stats()['hits'], stats['hits'] + 2)
+
+    def test_metadata_cache(self):
+        lib = make_dummy_dist(self, (
+            ('requires.txt', '\n'.join([])),
+            ('data.json', json.dumps({'dependencies': {'jquery': '~1.8.3'}})),
+            ('lines.txt', 'first\nsecond\n'),
+        ), 'lib', '1.0.0')
+
+        cache = calmjs_dist.MetadataCache()
+        read = calmjs_dist._read_dist_egginfo_json
+        first = cache.read(lib, 'data.json', read)
+        self.assertEqual({'dependencies': {'jquery': '~1.8.3'}}, first)
+        self.assertEqual({'hits': 0, 'misses': 1}, cache.stats())
+
+        # modification of the returned value will not affect the cache
+        first['dependencies']['underscore'] = '1.8.3'
+        second = cache.read(lib, 'data.json', read)
+        self.assertEqual({'dependencies': {'jquery': '~1.8.3'}}, second)
+        self.assertEqual({'hits': 1, 'misses': 1}, cache.stats())
+
+        lines = cache.read(
+            lib, 'lines.txt', calmjs_dist._read_dist_line_list, list)
+        self.assertEqual(['first', 'second'], lines)
+        lines.append('third')
+        self.assertEqual(['first', 'second'], cache.read(
+            lib, 'lines.txt', calmjs_dist._read_dist_line_list, list))
+        self.assertEqual({'hits': 2, 'misses': 2}, cache.stats())
+
+        # missing files are not cached.
+        self.assertIsNone(cache.read(lib, 'missing.json', read))
+        self.assertIsNone(cache.read(lib, 'missing.json', read))
+        self.assertEqual({'hits': 2, 'misses': 4}, cache.stats())
+
+        cache.invalidate(lib)
+        cache.read(lib, 'data.json', read)
+        self.assertEqual({'hits': 2, 'misses': 5}, cache.stats())
+        cache.invalidate()
+        cache.read(lib, 'data.json', read)
+        self.assertEqual({'hits': 2, 'misses': 6}, cache.stats())
+
+    def test_metadata_cache_file_modified(self):
+        lib = make_dummy_dist(self, (
+            ('data.json', json.dumps({'version': 1})),
+        ), 'lib', '1.0.0')
+        target = join(lib.egg_info, 'data.json')
+        cache = calmjs_dist.MetadataCache()
+        read = calmjs_dist._read_dist_egginfo_json
+        self.assertEqual({'version': 1}, cache.read(lib, 'data.json', read))
+
+        with open(target, 'w') as fd:
+            fd.write(json.dumps({'version': 2}))
+        # ensure the modification time differs for coarse filesystems.
+        stat = os.stat(target)
+        os.utime(target, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual({'version': 2}, cache.read(lib, 'data.json', read))
+        self.assertEqual({'hits': 0, 'misses': 2}, cache.stats())
+
+    def test_metadata_cache_mock_provider_not_cached(self):
+        mock_provider = MockProvider({
+            'data.json': json.dumps({'version': 1}),
+        })
+        mock_dist = pkg_resources.Distribution(
+            metadata=mock_provider, project_name='dummydist', version='0.0.0')
+        cache = calmjs_dist.MetadataCache()
+        read = calmjs_dist._read_dist_egginfo_json
+        self.assertEqual({'version': 1}, cache.read(
+            mock_dist, 'data.json', read))
+        mock_provider._metadata['data.json'] = json.dumps({'version': 2})
+        self.assertEqual({'version': 2}, cache.read(
+            mock_dist, 'data.json', read))
+        self.assertEqual({'hits': 0, 'misses': 2}, cache.stats())
+
     # While it really is for node/npm, the declaration is almost generic
     # enough that the particular method should be used here.
     def test_node_modules_registry_flattening(self):
@@ -753,6 +964,15 @@ class DistTestCase(unittest.TestCase):
         })
         self.assertEqual(results['something_else'], {'parent': 'lib'})
 
+    def test_get_records_view_for_package_fallback(self):
+        class LegacyRegistry(object):
+            def get_records_for_package(self, package_name):
+                return {'legacy': package_name}
+
+        registry = LegacyRegistry()
+        get_records = calmjs_dist._get_records_view_for_package(registry)
+        self.assertEqual({'legacy': 'pkg'}, get_records('pkg'))
+
     def test_module_registry_dependencies_failure_no_reg(self):
         self.assertEqual(calmjs_dist.flatten_module_registry_dependencies(
             ['calmjs'], registry_name='calmjs.no_reg',), {})
@@ -698,6 +698,11 @@ class ModuleLoaderRegistryTestCase(unittest.TestCase):
         self.assertEqual({
             'calmjs': ['calmjs.testing.module4'],
         }, loader_registry.package_module_map)
+        self.assertIn('package_loader_map', loader_registry.memory_report()[
+            'attributes'])
+        self.assertTrue(isinstance(
+            loader_registry.records['calmjs.testing.module4'],
+            calmjs.base.CompactRecord))
 
         self.assertEqual(
             ['css', 'empty', 'json'],
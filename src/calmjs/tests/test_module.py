@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
 import unittest
+from os.path import join
+from pkg_resources import DEVELOP_DIST
 from pkg_resources import Distribution
 from pkg_resources import EntryPoint
+from pkg_resources import WorkingSet
 
 import calmjs.base
+import calmjs.dist
 from calmjs.base import BaseModuleRegistry
 from calmjs.registry import Registry
 from calmjs.registry import get
@@ -58,6 +66,331 @@ class ModuleRegistryTestCase(unittest.TestCase):
         key = 'calmjs.testing.module1.hello'
         self.assertEqual(sorted(module1.keys()), [key])
 
+    def test_module_registry_compact_records(self):
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+            'calmjs.testing.module3 = calmjs.testing.module3',
+        ]}, dist=Distribution(project_name='calmjs.testing', version='0.0'))
+
+        class PlainModuleRegistry(ModuleRegistry):
+            compact_records = False
+
+        with pretty_logging(stream=mocks.StringIO()):
+            registry = ModuleRegistry(__name__, _working_set=working_set)
+            plain = PlainModuleRegistry(__name__, _working_set=working_set)
+        self.assertTrue(isinstance(
+            registry.records['calmjs.testing.module1'],
+            calmjs.base.CompactRecord))
+        self.assertEqual(
+            plain.get_record('calmjs.testing.module3'),
+            registry.get_record('calmjs.testing.module3'))
+
+        report = registry.memory_report()
+        plain_report = plain.memory_report()
+        self.assertEqual(3, report['records'])
+        self.assertEqual(plain_report['records'], report['records'])
+        self.assertLess(report['bytes'], plain_report['bytes'])
+
+    def test_module_registry_lookup_sourcepath(self):
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]}, dist=Distribution(project_name='calmjs.testing', version='0.0'))
+        with pretty_logging(stream=mocks.StringIO()):
+            self.registry = ModuleRegistry(
+                __name__, _working_set=working_set)
+            # an entry point without a distribution.
+            self.registry.register_entry_points([EntryPoint.parse(
+                'calmjs.testing.module2 = calmjs.testing.module2',
+            )])
+        hello = self.registry.get_record('calmjs.testing.module1')[
+            'calmjs/testing/module1/hello']
+        self.assertEqual((
+            'calmjs/testing/module1/hello', 'calmjs.testing.module1',
+            'calmjs.testing',
+        ), self.registry.lookup_sourcepath(hello))
+        # paths are normalized
+        self.assertEqual(
+            'calmjs/testing/module1/hello',
+            self.registry.lookup_sourcepath(join(
+                os.path.dirname(hello), os.pardir, 'module1', 'hello.js',
+            )).modname)
+        helper = self.registry.get_record('calmjs.testing.module2')[
+            'calmjs/testing/module2/helper']
+        self.assertEqual((
+            'calmjs/testing/module2/helper', 'calmjs.testing.module2', None,
+        ), self.registry.lookup_sourcepath(helper))
+        self.assertIsNone(self.registry.lookup_sourcepath(
+            join(os.path.dirname(hello), 'no_such_file.js')))
+
+    def test_module_registry_lookup_sourcepath_overridden(self):
+        class OverrideModuleRegistry(ModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                return {'shared': {
+                    'shared/mod': join(entry_point.name, 'mod.js'),
+                    entry_point.name: join(entry_point.name, 'own.js'),
+                }}
+
+        registry = OverrideModuleRegistry(__name__)
+        with pretty_logging(stream=mocks.StringIO()):
+            registry.register_entry_points([EntryPoint.parse(
+                '%s = calmjs.testing.module1' % name,
+                dist=Distribution(project_name=name),
+            ) for name in ('first', 'second')])
+        self.assertIsNone(registry.lookup_sourcepath(join('first', 'mod.js')))
+        self.assertEqual(
+            ('shared/mod', 'shared', 'second'),
+            registry.lookup_sourcepath(join('second', 'mod.js')))
+        self.assertEqual(
+            ('first', 'shared', 'first'),
+            registry.lookup_sourcepath(join('first', 'own.js')))
+
+    def test_module_registry_refresh(self):
+        tmpdir = utils.mkdtemp(self)
+        mapped = []
+
+        class TrackingModuleRegistry(ModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                mapped.append(str(entry_point))
+                return {entry_point.name: {
+                    entry_point.name + '/mod': join(
+                        tmpdir, entry_point.name, 'mod.js'),
+                }}
+
+        def make_dist(name, *modules):
+            dist = utils.make_dummy_dist(self, ((
+                'entry_points.txt', '[calmjs.testing.refresh]\n' + ''.join(
+                    '%s = calmjs.testing.%s\n' % (module, module)
+                    for module in modules)
+            ),), name, '1.0', working_dir=tmpdir)
+            # ensure the change is registered
+            st = os.stat(dist.egg_info)
+            os.utime(dist.egg_info, (st.st_atime, st.st_mtime + len(mapped)))
+
+        make_dist('pkg1', 'module1')
+        make_dist('pkg2', 'module2')
+        working_set = WorkingSet([tmpdir])
+        with pretty_logging(stream=mocks.StringIO()):
+            registry = TrackingModuleRegistry(
+                'calmjs.testing.refresh', _working_set=working_set)
+        self.assertEqual(2, len(mapped))
+        module1 = registry.records['module1']
+        self.assertEqual(set(), registry.refresh())
+        self.assertEqual(0, registry.generation)
+
+        # only the changed and the new distributions are registered.
+        make_dist('pkg2', 'module2', 'module3')
+        make_dist('pkg3', 'module4')
+        working_set.__init__([tmpdir])
+        del mapped[:]
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertEqual({'pkg2', 'pkg3'}, registry.refresh())
+        self.assertEqual(1, registry.generation)
+        self.assertEqual([
+            'module2 = calmjs.testing.module2',
+            'module3 = calmjs.testing.module3',
+            'module4 = calmjs.testing.module4',
+        ], sorted(mapped))
+        self.assertIs(module1, registry.records['module1'])
+        self.assertEqual(
+            ['module1', 'module2', 'module3', 'module4'],
+            sorted(registry.records))
+        self.assertEqual(['module2', 'module3'], sorted(
+            registry.package_module_map['pkg2']))
+        self.assertEqual(('module4/mod', 'module4', 'pkg3'),
+                         registry.lookup_sourcepath(
+                             join(tmpdir, 'module4', 'mod.js')))
+
+        # a module also declared by an unchanged distribution will have
+        # every entry point registered again.
+        make_dist('pkg3', 'module1')
+        working_set.__init__([tmpdir])
+        del mapped[:]
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertEqual({'pkg3'}, registry.refresh())
+        # once for pkg3, then again for all of them.
+        self.assertEqual(5, len(mapped))
+        self.assertEqual(
+            ['module1', 'module2', 'module3'], sorted(registry.records))
+        self.assertIsNone(registry.lookup_sourcepath(
+            join(tmpdir, 'module4', 'mod.js')))
+
+    def test_module_registry_parallel_registration(self):
+        # the earlier entry points finish last.
+        delays = {'first': 4, 'second': 3, 'third': 1}
+
+        class SlowModuleRegistry(ModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                time.sleep(0.01 * delays.get(entry_point.name, 0))
+                if entry_point.name == 'broken':
+                    raise ValueError('broken mapper')
+                result = ModuleRegistry._map_entry_point_module(
+                    self, entry_point, module)
+                result[module.__name__]['shared'] = entry_point.name
+                return result
+
+        def make_entry_points():
+            return [
+                EntryPoint.parse(text, dist=Distribution(project_name=name))
+                for name, text in (
+                    ('pkg1', 'first = calmjs.testing.module1'),
+                    ('pkg2', 'second = calmjs.testing.module2'),
+                    ('pkg3', 'missing = calmjs.testing.no_such_module'),
+                    ('pkg2', 'broken = calmjs.testing.module3'),
+                    ('pkg3', 'third = calmjs.testing.module1'),
+                    ('pkg1', 'fourth = calmjs.testing.module2'),
+                )
+            ]
+
+        results = []
+        for workers in (0, 4):
+            registry = SlowModuleRegistry(__name__)
+            registry.registration_workers = workers
+            with pretty_logging(stream=mocks.StringIO()) as s:
+                registry.register_entry_points(make_entry_points())
+            self.assertIn(
+                'ImportError: calmjs.testing.no_such_module not found',
+                s.getvalue())
+            self.assertIn("'broken = calmjs.testing.module3'", s.getvalue())
+            results.append((
+                list(registry.records.items()),
+                dict(registry.package_module_map.items()),
+            ))
+
+        self.assertEqual(results[0], results[1])
+        records, package_module_map = results[1]
+        self.assertEqual(
+            ['calmjs.testing.module1', 'calmjs.testing.module2'],
+            [name for name, record in records])
+        # the later declarations are applied on top.
+        self.assertEqual('third', records[0][1]['shared'])
+        self.assertEqual('fourth', records[1][1]['shared'])
+        self.assertEqual({
+            'pkg1': ['calmjs.testing.module1', 'calmjs.testing.module2'],
+            'pkg2': ['calmjs.testing.module2'],
+            'pkg3': ['calmjs.testing.module1'],
+        }, package_module_map)
+
+    def test_module_registry_registration_workers(self):
+        utils.stub_os_environ(self)
+        os.environ.pop('CALMJS_REGISTRY_WORKERS', None)
+        self.assertEqual(0, self.registry.get_registration_workers())
+        os.environ['CALMJS_REGISTRY_WORKERS'] = '8'
+        self.assertEqual(8, self.registry.get_registration_workers())
+        os.environ['CALMJS_REGISTRY_WORKERS'] = 'many'
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertEqual(0, self.registry.get_registration_workers())
+        self.assertIn('invalid CALMJS_REGISTRY_WORKERS', s.getvalue())
+
+    def test_module_registry_index_entry_point(self):
+        entry_point = EntryPoint.parse(
+            'calmjs.testing.module1 = calmjs.testing.module1')
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertEqual(self.registry.index_entry_point(entry_point), {
+                'calmjs.testing.module1': {
+                    'calmjs/testing/module1/hello':
+                        'calmjs/testing/module1/hello.js',
+                },
+            })
+
+    def make_indexed_dist(self, precedence=None):
+        tmpdir = utils.mkdtemp(self)
+        os.makedirs(join(tmpdir, 'indexed', 'pkg'))
+        with open(join(tmpdir, 'indexed', 'pkg', 'mod.js'), 'w') as fd:
+            fd.write('"use strict";\n')
+        dist = utils.make_dummy_dist(self, ((
+            'calmjs_module_index.json', json.dumps({
+                __name__: {
+                    'indexed.pkg = indexed.pkg': {
+                        'indexed.pkg': {
+                            'indexed/pkg/mod': 'indexed/pkg/mod.js',
+                        },
+                    },
+                },
+            })),
+        ), 'indexed', '1.0', working_dir=tmpdir)
+        if precedence is not None:
+            dist.precedence = precedence
+        return dist
+
+    def test_module_registry_read_index(self):
+        dist = self.make_indexed_dist()
+        entry_point = EntryPoint.parse('indexed.pkg = indexed.pkg', dist=dist)
+        # as the module is not importable, the records can only be
+        # sourced from the index.
+        with pretty_logging(stream=mocks.StringIO()):
+            self.registry.register_entry_points([entry_point])
+        self.assertEqual(self.registry.get_record('indexed.pkg'), {
+            'indexed/pkg/mod': join(dist.location, 'indexed', 'pkg', 'mod.js'),
+        })
+        self.assertEqual(
+            ['indexed.pkg'], self.registry.package_module_map['indexed'])
+
+    def test_module_registry_read_index_shared(self):
+        dist = self.make_indexed_dist()
+        entry_point = EntryPoint.parse('indexed.pkg = indexed.pkg', dist=dist)
+        index = calmjs.dist.read_dist_module_index(dist)
+        # the cached index is not copied for every entry point.
+        self.assertIs(index, calmjs.dist.read_dist_module_index(dist))
+        records_map = self.registry.read_entry_point_index(entry_point)
+        records_map['indexed.pkg']['indexed/pkg/mod'] = 'changed.js'
+        self.assertEqual(
+            join(dist.location, 'indexed', 'pkg', 'mod.js'),
+            self.registry.read_entry_point_index(entry_point)[
+                'indexed.pkg']['indexed/pkg/mod'])
+        self.assertEqual('indexed/pkg/mod.js', index[__name__][
+            'indexed.pkg = indexed.pkg']['indexed.pkg']['indexed/pkg/mod'])
+
+    def test_module_registry_read_index_other_entry_point(self):
+        dist = self.make_indexed_dist()
+        entry_point = EntryPoint.parse('indexed.pkg = indexed', dist=dist)
+        self.assertIsNone(self.registry.read_entry_point_index(entry_point))
+
+    def test_module_registry_read_index_develop_dist(self):
+        dist = self.make_indexed_dist(precedence=DEVELOP_DIST)
+        entry_point = EntryPoint.parse('indexed.pkg = indexed.pkg', dist=dist)
+        self.assertIsNone(self.registry.read_entry_point_index(entry_point))
+        with pretty_logging(stream=mocks.StringIO()) as stream:
+            self.registry.register_entry_points([entry_point])
+        self.assertIn('indexed.pkg not found', stream.getvalue())
+        self.assertEqual(self.registry.get_record('indexed.pkg'), {})
+
+    def test_module_registry_read_index_missing_files(self):
+        dist = self.make_indexed_dist()
+        os.rename(
+            join(dist.location, 'indexed'), join(dist.location, 'moved'))
+        entry_point = EntryPoint.parse('indexed.pkg = indexed.pkg', dist=dist)
+        with pretty_logging(stream=mocks.StringIO()) as stream:
+            self.assertIsNone(
+                self.registry.read_entry_point_index(entry_point))
+        self.assertIn('ignoring index', stream.getvalue())
+
+    def test_module_registry_overridden_entry_point_module(self):
+        modules = []
+
+        class HookedModuleRegistry(ModuleRegistry):
+            def _register_entry_point_module(self, entry_point, module):
+                modules.append(module.__name__)
+                super(HookedModuleRegistry, self)._register_entry_point_module(
+                    entry_point, module)
+
+        registry = HookedModuleRegistry(__name__)
+        dist = self.make_indexed_dist()
+        with pretty_logging(stream=mocks.StringIO()) as stream:
+            registry.register_entry_points([
+                EntryPoint.parse('indexed.pkg = indexed.pkg', dist=dist),
+                EntryPoint.parse(
+                    'calmjs.testing.module1 = calmjs.testing.module1'),
+            ])
+        # the index is bypassed, so that the hook is provided with the
+        # imported module for every entry point.
+        self.assertIn('indexed.pkg not found', stream.getvalue())
+        self.assertEqual(['calmjs.testing.module1'], modules)
+        self.assertEqual(registry.get_record('indexed.pkg'), {})
+        self.assertIn(
+            'calmjs/testing/module1/hello',
+            registry.get_record('calmjs.testing.module1'))
+
 
 class IntegratedModuleRegistryTestCase(unittest.TestCase):
     """
@@ -154,6 +487,38 @@ class LineageResolutionTestCase(unittest.TestCase):
             child,
         ], list(resolve_child_module_registries_lineage(child)))
 
+    def test_child_module_registry_concurrent_refresh(self):
+        working_set = mocks.WorkingSet({})
+        root = BaseModuleRegistry('root.module', _working_set=working_set)
+        refreshed = []
+
+        class SlowChildModuleRegistry(ChildModuleRegistry):
+            def _refresh(self, changed):
+                refreshed.append(changed)
+                # give every other thread the chance to arrive.
+                time.sleep(0.05)
+                super(SlowChildModuleRegistry, self)._refresh(changed)
+
+        child = SlowChildModuleRegistry(
+            'root.module.child', _parent=root, _working_set=working_set)
+        root.generation += 1
+        barrier = threading.Event()
+
+        def worker():
+            barrier.wait()
+            child.refresh()
+
+        threads = [threading.Thread(target=worker) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        barrier.set()
+        for thread in threads:
+            thread.join()
+
+        # the records are only registered again once.
+        self.assertEqual([set()], refreshed)
+        self.assertEqual(1, child.generation)
+
     def test_resolve_child_module_registries_lineage_two_layers(self):
         working_set = mocks.WorkingSet({})
         root = BaseModuleRegistry(
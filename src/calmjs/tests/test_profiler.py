@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import pstats
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs import profiler
+from calmjs.utils import pretty_logging
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def work():
+    return [str(i) for i in range(1000)]
+
+
+class CpuProfileTestCase(unittest.TestCase):
+
+    def test_no_path(self):
+        stream = StringIO()
+        with profiler.cpu_profile(None, stream=stream):
+            work()
+        self.assertEqual('', stream.getvalue())
+
+    def test_profile(self):
+        target = join(mkdtemp(self), 'calmjs.prof')
+        stream = StringIO()
+        with pretty_logging(logger='calmjs.profiler', stream=StringIO()) as s:
+            with profiler.cpu_profile(target, stream=stream, limit=5):
+                work()
+        self.assertIn("wrote profile statistics to '%s'" % target,
+                      s.getvalue())
+        self.assertIn('cumulative', stream.getvalue())
+        self.assertIn('work', stream.getvalue())
+        stats = pstats.Stats(target, stream=StringIO())
+        self.assertTrue(any(
+            name == 'work' for _, _, name in stats.stats))
+
+    def test_profile_nested(self):
+        target = join(mkdtemp(self), 'calmjs.prof')
+        outer = StringIO()
+        inner = StringIO()
+        with pretty_logging(logger='calmjs.profiler', stream=StringIO()):
+            with profiler.cpu_profile(target, stream=outer, limit=5):
+                with profiler.cpu_profile(target, stream=inner):
+                    work()
+        # only the outermost profile for the path is done.
+        self.assertEqual('', inner.getvalue())
+        self.assertIn('work', outer.getvalue())
+        self.assertEqual(set(), profiler._active)
+
+    def test_profile_write_failure(self):
+        target = join(mkdtemp(self), 'missing', 'calmjs.prof')
+        stream = StringIO()
+        with pretty_logging(logger='calmjs.profiler', stream=StringIO()) as s:
+            with self.assertRaises(ValueError):
+                with profiler.cpu_profile(target, stream=stream):
+                    raise ValueError('failure')
+        self.assertIn("failed to write profile to '%s'" % target,
+                      s.getvalue())
+        # summary still produced.
+        self.assertIn('cumulative', stream.getvalue())
+        self.assertFalse(exists(target))
+
+
+@unittest.skipIf(profiler.tracemalloc is None, 'tracemalloc not available')
+class MemoryProfileTestCase(unittest.TestCase):
+
+    def test_no_path(self):
+        stream = StringIO()
+        with profiler.memory_profile(None, stream=stream):
+            work()
+        self.assertEqual('', stream.getvalue())
+        self.assertFalse(profiler.tracemalloc.is_tracing())
+
+    def test_profile(self):
+        target = join(mkdtemp(self), 'calmjs.snapshot')
+        stream = StringIO()
+        with pretty_logging(logger='calmjs.profiler', stream=StringIO()) as s:
+            with profiler.memory_profile(target, stream=stream, limit=3):
+                result = work()
+        self.assertEqual(1000, len(result))
+        self.assertIn("wrote memory snapshot to '%s'" % target, s.getvalue())
+        lines = stream.getvalue().splitlines()
+        self.assertEqual('top 3 memory allocation differences:', lines[0])
+        self.assertTrue(1 < len(lines) <= 4)
+        self.assertFalse(profiler.tracemalloc.is_tracing())
+        snapshot = profiler.tracemalloc.Snapshot.load(target)
+        self.assertTrue(snapshot.traces)
+
+    def test_profile_already_tracing(self):
+        target = join(mkdtemp(self), 'calmjs.snapshot')
+        profiler.tracemalloc.start()
+        self.addCleanup(profiler.tracemalloc.stop)
+        with profiler.memory_profile(target, stream=StringIO()):
+            work()
+        # tracing started elsewhere is left alone.
+        self.assertTrue(profiler.tracemalloc.is_tracing())
+        self.assertTrue(exists(target))
+
+    def test_profile_nested(self):
+        target = join(mkdtemp(self), 'calmjs.snapshot')
+        outer = StringIO()
+        inner = StringIO()
+        with pretty_logging(logger='calmjs.profiler', stream=StringIO()):
+            with profiler.memory_profile(target, stream=outer):
+                with profiler.memory_profile(target, stream=inner):
+                    work()
+        self.assertEqual('', inner.getvalue())
+        self.assertIn('memory allocation differences', outer.getvalue())
+        self.assertFalse(profiler.tracemalloc.is_tracing())
+        self.assertEqual(set(), profiler._active)
+
+    def test_profile_write_failure(self):
+        target = join(mkdtemp(self), 'missing', 'calmjs.snapshot')
+        stream = StringIO()
+        with pretty_logging(logger='calmjs.profiler', stream=StringIO()) as s:
+            with profiler.memory_profile(target, stream=stream):
+                work()
+        self.assertIn(
+            "failed to write memory snapshot to '%s'" % target, s.getvalue())
+        self.assertIn('memory allocation differences', stream.getvalue())
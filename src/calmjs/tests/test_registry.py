@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+import time
 import unittest
 
 import pkg_resources
@@ -10,6 +14,7 @@ from calmjs.utils import pretty_logging
 
 from calmjs.testing import mocks
 from calmjs.testing.utils import make_dummy_dist
+from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import stub_item_attr_value
 
 
@@ -106,6 +111,34 @@ class RegistryTestCase(unittest.TestCase):
             stream.getvalue(),
         )
 
+    def test_memory_report(self):
+        from calmjs.module import ModuleRegistry
+        working_set = mocks.WorkingSet({'calmjs.registry': [
+            'calmjs.registry = calmjs.registry:Registry',
+            'calmjs.module = calmjs.module:ModuleRegistry',
+        ], 'calmjs.module': [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]})
+        stub_item_attr_value(self, calmjs.base, 'working_set', working_set)
+        with pretty_logging(stream=mocks.StringIO()):
+            registry = calmjs.registry.Registry(
+                'calmjs.registry', _working_set=working_set)
+            registry.get('calmjs.registry')
+            module_registry = registry.get('calmjs.module')
+        registry.records['other'] = object()
+        self.assertTrue(isinstance(module_registry, ModuleRegistry))
+
+        report = registry.memory_report()
+        self.assertEqual(3, report['records'])
+        self.assertEqual(['calmjs.module'], list(report['registries']))
+        module_report = report['registries']['calmjs.module']
+        self.assertEqual(1, module_report['records'])
+        self.assertEqual(
+            module_report['bytes'], module_registry.memory_report()['bytes'])
+        self.assertEqual(
+            report['bytes'], sum(report['attributes'].values()) +
+            module_report['bytes'])
+
 
 class RegistryIntegrationTestCase(unittest.TestCase):
     """
@@ -171,6 +204,69 @@ class RegistryIntegrationTestCase(unittest.TestCase):
         self.assertTrue(isinstance(
             registry.get_record('custom'), CustomModuleRegistry))
 
+    def test_registry_get_record_class(self):
+        working_set = mocks.WorkingSet({'calmjs.registry': [
+            'custom = calmjs.testing.module3.module:CustomModuleRegistry',
+            'failure = calmjs.testing.no_such_module:NoClass',
+        ]})
+        registry = calmjs.registry.Registry(
+            'calmjs.registry', _working_set=working_set)
+        from calmjs.testing.module3.module import CustomModuleRegistry
+        self.assertIs(
+            CustomModuleRegistry, registry.get_record_class('custom'))
+        # the class is not constructed.
+        self.assertEqual(len(registry.records), 0)
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertIsNone(registry.get_record_class('failure'))
+            self.assertIsNone(registry.get_record_class('missing'))
+
+    def test_registry_concurrent_get(self):
+        working_set = mocks.WorkingSet({'calmjs.registry': [
+            'custom = calmjs.testing.module3.module:CustomModuleRegistry',
+            'failure = calmjs.testing.no_such_module:NoClass',
+        ]})
+        registry = calmjs.registry.Registry(
+            'calmjs.registry', _working_set=working_set)
+        entry_point = registry._entry_points['custom']
+        constructed = []
+
+        class SlowRegistry(BaseRegistry):
+            def __init__(self, name):
+                constructed.append(name)
+                # give every other thread the chance to arrive.
+                time.sleep(0.05)
+                super(SlowRegistry, self).__init__(name, _working_set=None)
+
+        class SlowEntryPoint(object):
+            dist = entry_point.dist
+
+            def load(self):
+                return SlowRegistry
+
+        registry._entry_points['custom'] = SlowEntryPoint()
+        barrier = threading.Event()
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(registry.get('custom'))
+            results.append(registry.get('failure'))
+
+        threads = [threading.Thread(target=worker) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        with pretty_logging(stream=mocks.StringIO()):
+            barrier.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(['custom'], constructed)
+        self.assertEqual(32, len(results))
+        customs = [r for r in results if r is not None]
+        self.assertEqual(16, len(customs))
+        self.assertTrue(all(r is customs[0] for r in customs))
+        self.assertNotIn('failure', registry.records)
+
     def test_registry_reserved(self):
         make_dummy_dist(self, ((
             'entry_points.txt',
@@ -233,3 +329,163 @@ class RegistryIntegrationTestCase(unittest.TestCase):
             "registry 'calmjs.r2' for 'calmjs.registry' is already registered",
             log
         )
+
+
+class RegistryRefreshTestCase(unittest.TestCase):
+    """
+    Test the refresh of the root registry and the registries it has
+    constructed.
+    """
+
+    def make_dist(self, name, *registries):
+        dist = make_dummy_dist(self, ((
+            'entry_points.txt', '[calmjs.registry]\n' + ''.join(
+                '%s = calmjs.module:ModuleRegistry\n' % registry
+                for registry in registries)
+        ),), name, '1.0', working_dir=self.tmpdir)
+        st = os.stat(dist.egg_info)
+        self.offset += 10
+        os.utime(dist.egg_info, (st.st_atime, st.st_mtime + self.offset))
+
+    def setUp(self):
+        self.tmpdir = mkdtemp(self)
+        self.offset = 0
+        self.make_dist('pkg1', 'calmjs.testing.r1')
+        self.make_dist('pkg2', 'calmjs.testing.r2')
+        self.working_set = pkg_resources.WorkingSet([self.tmpdir])
+        self.registry = calmjs.registry.Registry(
+            'calmjs.registry', reserved=None, _working_set=self.working_set)
+
+    def test_refresh_unchanged(self):
+        r1 = self.registry.get('calmjs.testing.r1')
+        self.assertEqual(set(), self.registry.refresh())
+        self.assertIs(r1, self.registry.get('calmjs.testing.r1'))
+        self.assertEqual(0, self.registry.generation)
+
+    def test_refresh_changed(self):
+        r1 = self.registry.get('calmjs.testing.r1')
+        r2 = self.registry.get('calmjs.testing.r2')
+        self.make_dist('pkg2', 'calmjs.testing.r2', 'calmjs.testing.r3')
+        self.working_set.__init__([self.tmpdir])
+        with pretty_logging(stream=mocks.StringIO()) as stream:
+            self.assertEqual({'pkg2'}, self.registry.refresh())
+        self.assertIn(
+            "dropping registry 'calmjs.testing.r2'", stream.getvalue())
+        self.assertEqual(1, self.registry.generation)
+        self.assertIs(r1, self.registry.get('calmjs.testing.r1'))
+        self.assertIsNot(r2, self.registry.get('calmjs.testing.r2'))
+        self.assertIsNotNone(self.registry.get('calmjs.testing.r3'))
+
+    def test_refresh_concurrent_get(self):
+        r1 = self.registry.get('calmjs.testing.r1')
+        self.make_dist('pkg2', 'calmjs.testing.r2', 'calmjs.testing.r3')
+        self.working_set.__init__([self.tmpdir])
+        original = self.registry._init
+        rebuilding = threading.Event()
+
+        def _init():
+            original()
+            # the records are still being rebuilt at this point.
+            rebuilding.set()
+            time.sleep(0.05)
+
+        self.registry._init = _init
+        results = []
+
+        def worker():
+            rebuilding.wait()
+            results.append(self.registry.get('calmjs.testing.r1'))
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertEqual({'pkg2'}, self.registry.refresh())
+            thread.join()
+        # the lookup waited for the refresh, which kept the registry.
+        self.assertEqual([r1], results)
+        self.assertIs(r1, self.registry.get('calmjs.testing.r1'))
+
+    def test_refresh_dependents(self):
+        r1 = self.registry.get('calmjs.testing.r1')
+        r2 = self.registry.get('calmjs.testing.r2')
+        child = BaseRegistry('calmjs.testing.r2.child', _working_set=None)
+        child.parent = r2
+        broken = BaseRegistry('calmjs.testing.broken', _working_set=None)
+
+        def refresh():
+            raise ValueError('cannot refresh')
+
+        broken.refresh = refresh
+        self.registry.records['calmjs.testing.r2.child'] = child
+        self.registry.records['calmjs.testing.broken'] = broken
+        self.make_dist('pkg2')
+        self.working_set.__init__([self.tmpdir])
+        with pretty_logging(stream=mocks.StringIO()) as stream:
+            self.assertEqual({'pkg2'}, self.registry.refresh())
+        self.assertIn(
+            "dropping registry 'calmjs.testing.r2.child' as its parent was "
+            "dropped", stream.getvalue())
+        self.assertIn(
+            "failed to refresh registry 'calmjs.testing.broken'",
+            stream.getvalue())
+        self.assertEqual(
+            {'calmjs.testing.r1': r1}, dict(self.registry.records))
+        self.assertIsNone(self.registry.get('calmjs.testing.r2'))
+
+    def test_working_set_fingerprint(self):
+        first = calmjs.registry.working_set_fingerprint(self.working_set)
+        self.assertEqual(
+            first, calmjs.registry.working_set_fingerprint(self.working_set))
+        self.make_dist('pkg1', 'calmjs.testing.r1')
+        self.assertNotEqual(
+            first, calmjs.registry.working_set_fingerprint(self.working_set))
+
+    def test_refresh_working_set(self):
+        import site
+        runtime_dir = mkdtemp(self)
+        path_dir = mkdtemp(self)
+        site_dir = mkdtemp(self)
+        make_dummy_dist(self, (
+            ('PKG-INFO', ''),), 'runtime', '1.0', working_dir=runtime_dir)
+        make_dummy_dist(self, (
+            ('PKG-INFO', ''),), 'onpath', '1.0', working_dir=path_dir)
+        callback = object()
+        self.working_set.add_entry(runtime_dir)
+        self.working_set.callbacks.append(callback)
+        sitedirs = []
+        stub_item_attr_value(self, sys, 'path', [self.tmpdir, path_dir])
+        stub_item_attr_value(
+            self, site, 'getsitepackages', lambda: [self.tmpdir, site_dir])
+        stub_item_attr_value(self, site, 'addsitedir', sitedirs.append)
+        self.make_dist('pkg3')
+
+        calmjs.registry.refresh_working_set(self.working_set)
+        # only the site directory not already processed is added.
+        self.assertEqual([site_dir], sitedirs)
+        self.assertEqual(
+            [self.tmpdir, runtime_dir, path_dir], self.working_set.entries)
+        self.assertEqual(
+            ['onpath', 'pkg1', 'pkg2', 'pkg3', 'runtime'],
+            sorted(dist.project_name for dist in self.working_set))
+        self.assertEqual([callback], self.working_set.callbacks)
+
+    def test_module_refresh(self):
+        refreshed = []
+        stub_item_attr_value(
+            self, calmjs.registry, 'working_set', self.working_set)
+        stub_item_attr_value(self, calmjs.registry, '_inst', self.registry)
+        stub_item_attr_value(self, calmjs.registry, '_fingerprint', None)
+        stub_item_attr_value(
+            self, calmjs.registry, 'refresh_working_set',
+            lambda ws: refreshed.append(ws) or ws.__init__([self.tmpdir]))
+
+        self.assertEqual(set(), calmjs.registry.refresh())
+        self.assertEqual(1, len(refreshed))
+        # unchanged working set is not rebuilt.
+        self.assertEqual(set(), calmjs.registry.refresh())
+        self.assertEqual(1, len(refreshed))
+        self.make_dist('pkg1')
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertEqual({'pkg1'}, calmjs.registry.refresh())
+        self.assertEqual(2, len(refreshed))
+        self.assertIsNone(self.registry.get('calmjs.testing.r1'))
@@ -2,12 +2,14 @@
 import unittest
 import json
 import os
+import pstats
 import sys
 import warnings
 from argparse import ArgumentParser
 from inspect import currentframe
 from os.path import join
 from os.path import exists
+from os.path import realpath
 from logging import DEBUG
 from logging import INFO
 from logging import WARNING
@@ -19,6 +21,7 @@ from calmjs import argparse as calmjs_argparse
 from calmjs import cli
 from calmjs import dist
 from calmjs import exc
+from calmjs import profiler
 from calmjs import runtime
 from calmjs import toolchain
 from calmjs.utils import pretty_logging
@@ -81,6 +84,22 @@ default_cmd = DefaultCommandRuntime(working_set=mocks.WorkingSet({
 }))
 
 
+class FakeWatcher(object):
+
+    def __init__(self, paths, changes=()):
+        self.paths = paths
+        self.changes = list(changes)
+        self.closed = False
+
+    def wait(self):
+        if not self.changes:
+            raise KeyboardInterrupt()
+        return self.changes.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
 class BaseRuntimeTestCase(unittest.TestCase):
 
     def tearDown(self):
@@ -264,6 +283,80 @@ class BaseRuntimeTestCase(unittest.TestCase):
         self.assertNotIn('broken', out)
         self.assertIn('broken', err)
 
+    def test_main_trace(self):
+        stub_stdouts(self)
+        stub_os_environ(self)
+        target = join(mkdtemp(self), 'trace.json')
+        os.environ['CALMJS_TRACE'] = target
+        working_set = mocks.WorkingSet({'calmjs.runtime': []})
+        with self.assertRaises(SystemExit):
+            runtime.main(
+                [], runtime_cls=lambda: runtime.Runtime(
+                    working_set=working_set))
+        with open(target) as fd:
+            events = json.load(fd)['traceEvents']
+        self.assertEqual(['argparser', 'calmjs.runtime:Runtime'], [
+            e['name'] for e in events if e.get('cat') == 'runtime'])
+
+    def test_main_profile(self):
+        stub_stdouts(self)
+        target = join(mkdtemp(self), 'calmjs.prof')
+        working_set = mocks.WorkingSet({'calmjs.runtime': []})
+        with self.assertRaises(SystemExit):
+            runtime.main(
+                ['--profile', target], runtime_cls=lambda: runtime.Runtime(
+                    working_set=working_set))
+        # profiled once, including the construction of the argparser.
+        self.assertEqual(1, sys.stderr.getvalue().count(
+            'Ordered by: cumulative'))
+        stats = pstats.Stats(target, stream=mocks.StringIO())
+        self.assertTrue(any(
+            name == 'init_argparser' for _, _, name in stats.stats))
+
+    def test_main_forward_daemon(self):
+        stub_stdouts(self)
+        forwarded = []
+
+        def forward(args):
+            forwarded.append(args)
+            return 3
+
+        stub_item_attr_value(self, runtime, 'forward', forward)
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(['-v', 'npm', '--view', 'calmjs'])
+        self.assertEqual(3, e.exception.code)
+        self.assertEqual([['-v', 'npm', '--view', 'calmjs']], forwarded)
+
+    def test_main_forward_daemon_unavailable(self):
+        stub_stdouts(self)
+        forwarded = []
+
+        def forward(args):
+            forwarded.append(args)
+
+        stub_item_attr_value(self, runtime, 'forward', forward)
+        # executed locally instead.
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(['-V'])
+        self.assertEqual(0, e.exception.code)
+        self.assertEqual([['-V']], forwarded)
+        self.assertIn('calmjs', sys.stdout.getvalue())
+
+    def test_main_forward_daemon_skipped(self):
+        stub_stdouts(self)
+        forwarded = []
+        stub_item_attr_value(self, runtime, 'forward', forwarded.append)
+        # a custom runtime class is never forwarded
+        working_set = mocks.WorkingSet({'calmjs.runtime': []})
+        with self.assertRaises(SystemExit):
+            runtime.main([], runtime_cls=lambda: runtime.Runtime(
+                working_set=working_set))
+        # nor is the daemon command itself
+        with self.assertRaises(SystemExit):
+            runtime.main(['-q', 'daemon', '--stop', '--socket', join(
+                mkdtemp(self), 'missing.sock')])
+        self.assertEqual([], forwarded)
+
     def test_runtime_entry_point_preparse_warning(self):
         # see next test for the condition for warning to appear.
         stub_stdouts(self)
@@ -410,6 +503,169 @@ class ToolchainRuntimeTestCase(unittest.TestCase):
         self.assertIn('build_dir', result)
         self.assertEqual(result['link'], 'linked')
 
+    def test_advice_profile(self):
+        stub_stdouts(self)
+        tc = toolchain.NullToolchain()
+        rt = runtime.ToolchainRuntime(tc)
+        result = rt(['--export-target=dummy', '--advice-profile'])
+        self.assertTrue(result[toolchain.ADVICE_PROFILE])
+        self.assertIn(
+            'advice profile (', sys.stderr.getvalue())
+        self.assertIn(
+            'check_export_target_exists [ok]', sys.stderr.getvalue())
+
+    def test_advice_profile_not_enabled(self):
+        stub_stdouts(self)
+        tc = toolchain.NullToolchain()
+        rt = runtime.ToolchainRuntime(tc)
+        result = rt(['--export-target=dummy'])
+        self.assertFalse(result[toolchain.ADVICE_PROFILE])
+        self.assertNotIn('advice profile', sys.stderr.getvalue())
+        # the trace is still recorded on the spec.
+        self.assertTrue(result.advice_trace)
+
+    def test_trace(self):
+        stub_stdouts(self)
+        target = join(mkdtemp(self), 'trace.json')
+        tc = toolchain.NullToolchain()
+        rt = runtime.ToolchainRuntime(tc)
+        rt(['--trace', target, '--export-target=dummy'])
+        with open(target) as fd:
+            events = json.load(fd)['traceEvents']
+        names = {(e.get('cat'), e['name']) for e in events}
+        self.assertIn(('runtime', 'calmjs.runtime:ToolchainRuntime'), names)
+        self.assertIn(('toolchain', 'calmjs.toolchain:NullToolchain'), names)
+        self.assertIn(('toolchain', 'compile'), names)
+        self.assertIn(('advice_group', 'setup'), names)
+        self.assertIn(('advice_group', 'cleanup'), names)
+        self.assertIn(('compile_entry', 'transpile'), names)
+        self.assertTrue(any(
+            cat == 'advice' and name.endswith('check_export_target_exists')
+            for cat, name in names
+        ))
+
+    def test_profile(self):
+        stub_stdouts(self)
+        tmpdir = mkdtemp(self)
+        cpu_target = join(tmpdir, 'calmjs.prof')
+        memory_target = join(tmpdir, 'calmjs.snapshot')
+        tc = toolchain.NullToolchain()
+        rt = runtime.ToolchainRuntime(tc)
+        rt([
+            '--profile', cpu_target, '--profile-memory', memory_target,
+            '--export-target=dummy',
+        ])
+        self.assertTrue(exists(cpu_target))
+        err = sys.stderr.getvalue()
+        self.assertIn('cumulative', err)
+        if profiler.tracemalloc is not None:
+            self.assertTrue(exists(memory_target))
+            self.assertIn('memory allocation differences', err)
+
+    def setup_watch(self, changes=()):
+        tmpdir = mkdtemp(self)
+        source = join(tmpdir, 'a.js')
+        with open(source, 'w') as fd:
+            fd.write('var a = 1;')
+        spec = toolchain.Spec(
+            export_target=join(tmpdir, 'export.js'),
+            transpile_sourcepath={'a': source},
+        )
+        watchers = []
+
+        def watcher_factory(paths):
+            watchers.append(FakeWatcher(paths, changes))
+            return watchers[-1]
+
+        return spec, source, watchers, watcher_factory
+
+    def test_watch(self):
+        spec, source, watchers, watcher_factory = self.setup_watch([
+            {'/some/source.js'}, set(), {'/other/source.js'},
+        ])
+        tc = toolchain.NullToolchain()
+        rebuilds = []
+
+        def rebuild(spec, changed):
+            rebuilds.append((spec['build_dir'], exists(spec['build_dir'])))
+            if '/other/source.js' in changed:
+                raise ValueError('broken source')
+
+        tc.rebuild = rebuild
+        rt = runtime.ToolchainRuntime(tc)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            rt.watch(spec, watcher_factory=watcher_factory)
+
+        self.assertEqual('linked', spec['link'])
+        self.assertEqual(1, len(watchers))
+        self.assertEqual({source}, watchers[0].paths)
+        self.assertTrue(watchers[0].closed)
+        self.assertEqual(2, len(rebuilds))
+        self.assertEqual([True, True], [e for _, e in rebuilds])
+        # the temporary build directory was removed afterwards.
+        self.assertFalse(exists(spec['build_dir']))
+        log = s.getvalue()
+        self.assertIn('watching 1 sourcepaths using FakeWatcher', log)
+        self.assertIn('rebuild failed: ValueError: broken source', log)
+        self.assertIn('watch terminated', log)
+
+    def test_watch_build_cache_dir(self):
+        spec, source, watchers, watcher_factory = self.setup_watch([
+            {'/some/source.js'}])
+        cache_dir = mkdtemp(self)
+        spec['build_cache_dir'] = cache_dir
+        tc = toolchain.NullToolchain()
+        locked = []
+        tc.rebuild = lambda spec, changed: locked.append(
+            spec['build_workspace'].locked)
+        rt = runtime.ToolchainRuntime(tc)
+        with pretty_logging(stream=mocks.StringIO()):
+            rt.watch(spec, watcher_factory=watcher_factory)
+        # the workspace was kept locked for the rebuilds, and released
+        # once the watch terminated.
+        self.assertEqual([True], locked)
+        self.assertTrue(spec['build_dir'].startswith(realpath(cache_dir)))
+        self.assertTrue(exists(join(spec['build_dir'], 'a.js')))
+        self.assertFalse(spec['build_workspace'].locked)
+
+    def test_watch_build_dir_kept(self):
+        spec, source, watchers, watcher_factory = self.setup_watch()
+        build_dir = mkdtemp(self)
+        spec['build_dir'] = build_dir
+        rt = runtime.ToolchainRuntime(toolchain.NullToolchain())
+        with pretty_logging(stream=mocks.StringIO()):
+            rt.watch(spec, watcher_factory=watcher_factory)
+        self.assertTrue(exists(join(build_dir, 'a.js')))
+
+    def test_watch_initial_build_failure(self):
+        spec, source, watchers, watcher_factory = self.setup_watch()
+
+        def cancel():
+            raise toolchain.ToolchainCancel('cancelled')
+
+        spec.advise(toolchain.SETUP, cancel)
+        rt = runtime.ToolchainRuntime(toolchain.NullToolchain())
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            rt.watch(spec, watcher_factory=watcher_factory)
+        self.assertEqual([], watchers)
+        self.assertIn('initial build failed', s.getvalue())
+
+    def test_watch_flag(self):
+        stub_stdouts(self)
+        watchers = []
+
+        def make_watcher(paths):
+            watchers.append(FakeWatcher(paths))
+            return watchers[-1]
+
+        stub_item_attr_value(self, runtime, 'make_watcher', make_watcher)
+        target = join(mkdtemp(self), 'export.js')
+        rt = runtime.ToolchainRuntime(toolchain.NullToolchain())
+        spec = rt(['--watch', '--export-target', target])
+        self.assertEqual('linked', spec['link'])
+        self.assertEqual(1, len(watchers))
+        self.assertTrue(watchers[0].closed)
+
     def test_prompt_export_target_export_target_undefined(self):
         stub_stdouts(self)
         spec = toolchain.Spec()
@@ -1384,6 +1640,46 @@ class ArtifactRuntimeTestCase(unittest.TestCase):
         # since no artifacts were built, it will be non-zero
         self.assertNotEqual(e.exception.args[0], 0)
 
+    def test_artifact_store_runtime(self):
+        from calmjs.store import ArtifactStore
+        stub_stdouts(self)
+        stub_os_environ(self)
+        os.environ.pop('CALMJS_ARTIFACT_STORE', None)
+        rt = runtime.ArtifactStoreRuntime()
+        with pretty_logging(
+                logger='calmjs.runtime', stream=mocks.StringIO()) as s:
+            self.assertFalse(rt([]))
+        self.assertIn('no artifact store specified', s.getvalue())
+
+        root = mkdtemp(self)
+        source = join(root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('x' * 10)
+        store = ArtifactStore(join(root, 'store'))
+        store.put('aa01', source, {})
+        store.put('bb02', source, {})
+
+        os.environ['CALMJS_ARTIFACT_STORE'] = store.root
+        self.assertTrue(rt([]))
+        output = sys.stdout.getvalue()
+        self.assertIn('aa01', output)
+        self.assertIn('bb02', output)
+        self.assertIn('2 artifacts, 20 bytes in total', output)
+
+        stub_stdouts(self)
+        self.assertTrue(rt(['--prune', '--max-size', '15']))
+        self.assertIn('evicted 1 artifacts', sys.stdout.getvalue())
+        self.assertIn('1 artifacts, 10 bytes in total', sys.stdout.getvalue())
+
+        # nothing is old enough
+        stub_stdouts(self)
+        self.assertTrue(rt(['--store', store.root, '--prune', '--max-age=1']))
+        self.assertIn('evicted 0 artifacts', sys.stdout.getvalue())
+
+        stub_stdouts(self)
+        self.assertTrue(rt(['--store', store.root, '--prune']))
+        self.assertIn('0 artifacts, 0 bytes in total', sys.stdout.getvalue())
+
 
 class PackageManagerRuntimeTestCase(unittest.TestCase):
     """
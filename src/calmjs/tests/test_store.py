@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs.store import ArtifactStore
+from calmjs.store import parse_size
+from calmjs.store import source_digest
+from calmjs.store import spec_fingerprint
+from calmjs.utils import pretty_logging
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(path, content):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+class UtilsTestCase(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(100, parse_size('100'))
+        self.assertEqual(100, parse_size(100))
+        self.assertEqual(2048, parse_size('2K'))
+        self.assertEqual(512 * 1024 * 1024, parse_size('512MB'))
+        self.assertEqual(1536 * 1024 * 1024, parse_size('1.5g'))
+        with self.assertRaises(ValueError):
+            parse_size('lots')
+
+    def test_source_digest(self):
+        root = mkdtemp(self)
+        self.assertIsNone(source_digest(join(root, 'missing')))
+        os.mkdir(join(root, 'a'))
+        os.mkdir(join(root, 'b'))
+        write(join(root, 'a', 'file.js'), 'content')
+        write(join(root, 'b', 'file.js'), 'content')
+        # same contents in different locations have the same digest.
+        self.assertEqual(
+            source_digest(join(root, 'a')), source_digest(join(root, 'b')))
+        self.assertEqual(
+            source_digest(join(root, 'a', 'file.js')),
+            source_digest(join(root, 'b', 'file.js')))
+        write(join(root, 'b', 'other.js'), '')
+        self.assertNotEqual(
+            source_digest(join(root, 'a')), source_digest(join(root, 'b')))
+
+    def test_spec_fingerprint(self):
+        root1 = mkdtemp(self)
+        root2 = mkdtemp(self)
+        for root in (root1, root2):
+            write(join(root, 'mod.js'), 'var mod = 1;')
+
+        def spec(root, **kw):
+            result = dict(
+                transpile_sourcepath={'mod': join(root, 'mod.js')},
+                export_target=join(root, 'out.js'),
+                build_dir=root,
+                generate_source_map=False,
+                toolchain_bin_path=join(root, 'bin', 'tool'),
+            )
+            result.update(kw)
+            return result
+
+        # the same sources from different checkouts
+        self.assertEqual(
+            spec_fingerprint(spec(root1), 'builder'),
+            spec_fingerprint(spec(root2), 'builder'))
+        self.assertNotEqual(
+            spec_fingerprint(spec(root1), 'builder'),
+            spec_fingerprint(spec(root2), 'other'))
+        self.assertNotEqual(
+            spec_fingerprint(spec(root1)),
+            spec_fingerprint(spec(root1, generate_source_map=True)))
+
+        write(join(root2, 'mod.js'), 'var mod = 2;')
+        self.assertNotEqual(
+            spec_fingerprint(spec(root1)), spec_fingerprint(spec(root2)))
+
+        # no sources, no fingerprint
+        self.assertIsNone(spec_fingerprint({'export_target': 'out.js'}))
+
+
+class ArtifactStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = join(mkdtemp(self), 'store')
+        self.work = mkdtemp(self)
+        self.store = ArtifactStore(self.root)
+
+    def put(self, fingerprint, content, store=None):
+        source = join(self.work, fingerprint + '.js')
+        write(source, content)
+        (store or self.store).put(
+            fingerprint, source, {'out.js': {'fingerprint': fingerprint}})
+
+    def test_from_environ(self):
+        self.assertIsNone(ArtifactStore.from_environ({}))
+        store = ArtifactStore.from_environ({
+            'CALMJS_ARTIFACT_STORE': self.root,
+            'CALMJS_ARTIFACT_STORE_SIZE': '1M',
+        })
+        self.assertEqual(self.root, store.root)
+        self.assertEqual(1 << 20, store.max_size)
+
+        with pretty_logging(stream=StringIO()) as s:
+            store = ArtifactStore.from_environ({
+                'CALMJS_ARTIFACT_STORE': self.root,
+                'CALMJS_ARTIFACT_STORE_SIZE': 'huge',
+            })
+        self.assertIsNone(store.max_size)
+        self.assertIn('invalid CALMJS_ARTIFACT_STORE_SIZE', s.getvalue())
+
+    def test_get_put(self):
+        target = join(self.work, 'target.js')
+        self.assertIsNone(self.store.get('abcdef', target))
+        self.assertFalse(exists(target))
+
+        self.put('abcdef', 'artifact')
+        self.assertTrue(exists(join(self.root, 'ab', 'abcdef')))
+        # an existing target will be replaced.
+        write(target, 'old')
+        self.assertEqual(
+            {'out.js': {'fingerprint': 'abcdef'}},
+            self.store.get('abcdef', target))
+        with open(target) as fd:
+            self.assertEqual('artifact', fd.read())
+        self.assertEqual([('abcdef', 8)], [
+            entry[:2] for entry in self.store.entries()])
+
+    def test_get_incomplete(self):
+        self.put('abcdef', 'artifact')
+        os.unlink(join(self.root, 'ab', 'abcdef'))
+        self.assertIsNone(self.store.get('abcdef', join(self.work, 't.js')))
+        write(join(self.root, 'ab', 'abcdef'), 'artifact')
+        write(join(self.root, 'ab', 'abcdef.json'), '{')
+        self.assertIsNone(self.store.get('abcdef', join(self.work, 't.js')))
+
+    def test_entries_order_and_prune(self):
+        now = time.time()
+        for i, fingerprint in enumerate(('aa01', 'bb02', 'cc03')):
+            self.put(fingerprint, 'x' * 10)
+            stamp = now - 3600 * (3 - i)
+            os.utime(
+                join(self.root, fingerprint[:2], fingerprint + '.json'),
+                (stamp, stamp))
+        # using the oldest one makes it the most recent.
+        self.store.get('aa01', join(self.work, 'target.js'))
+        self.assertEqual(['bb02', 'cc03', 'aa01'], [
+            entry[0] for entry in self.store.entries()])
+
+        self.assertEqual([], self.store.prune(max_size=30))
+        self.assertEqual(['bb02'], self.store.prune(max_size=25))
+        self.assertEqual(
+            ['cc03'], self.store.prune(max_size=100, max_age=1800))
+        self.assertEqual(['aa01'], [
+            entry[0] for entry in self.store.entries()])
+        self.assertEqual(['aa01'], self.store.prune())
+        self.assertEqual([], self.store.entries())
+
+    def test_put_evicts(self):
+        store = ArtifactStore(self.root, max_size=25)
+        self.put('aa01', 'x' * 10, store=store)
+        self.put('bb02', 'x' * 10, store=store)
+        self.put('cc03', 'x' * 10, store=store)
+        self.assertEqual(2, len(store.entries()))
+        with open(join(self.root, 'cc', 'cc03.json')) as fd:
+            self.assertEqual(
+                {'out.js': {'fingerprint': 'cc03'}}, json.load(fd))
+
+    def test_entries_ignore_unrelated(self):
+        self.assertEqual([], self.store.entries())
+        os.makedirs(join(self.root, 'unrelated'))
+        write(join(self.root, 'file'), '')
+        self.put('abcdef', 'artifact')
+        self.assertEqual(1, len(self.store.entries()))
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+import shutil
 import unittest
 import logging
 import json
@@ -9,7 +11,9 @@ from functools import partial
 from inspect import currentframe
 from os import makedirs
 from os.path import basename
+from os.path import dirname
 from os.path import exists
+from os.path import isdir
 from os.path import join
 from os.path import pardir
 from os.path import realpath
@@ -36,6 +40,7 @@ from calmjs.toolchain import Spec
 from calmjs.toolchain import Toolchain
 from calmjs.toolchain import NullToolchain
 from calmjs.toolchain import ES5Toolchain
+from calmjs.toolchain import ES5MinifyToolchain
 from calmjs.toolchain import ToolchainSpecCompileEntry
 from calmjs.toolchain import dict_setget
 from calmjs.toolchain import dict_setget_dict
@@ -393,6 +398,29 @@ class DeprecationTestCase(unittest.TestCase):
             "'test_sourcepath' in calmjs-3.0.0;", s.getvalue()
         )
 
+    def test_memoized_remap_warns_every_access(self):
+        spec = Spec(test_sourcepath='/')
+        with pretty_logging(stream=StringIO()):
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                for i in range(3):
+                    self.assertEqual(spec['test_source_map'], '/')
+
+        self.assertEqual(len(w), 3)
+        self.assertEqual(
+            Spec._deprecated_keys['test_source_map'], 'test_sourcepath')
+
+    def test_memoized_remap_bounded(self):
+        self.addCleanup(Spec._deprecated_keys.clear)
+        Spec._deprecated_keys.clear()
+        spec = Spec()
+        for i in range(Spec._deprecated_keys_limit + 1):
+            spec.get('key_%d' % i)
+        self.assertEqual(len(Spec._deprecated_keys), 1)
+        self.assertEqual(Spec._deprecated_keys[
+            'key_%d' % Spec._deprecated_keys_limit
+        ], 'key_%d' % Spec._deprecated_keys_limit)
+
     def test_generate_source_map(self):
         # this is an actual attribute
         with pretty_logging(stream=StringIO()) as s:
@@ -473,6 +501,93 @@ class SpecTestCase(unittest.TestCase):
         # if a better implementation is done...
         self.assertIn("'spec': {...}", repr(spec))
 
+    def test_spec_snapshot_restore(self):
+        registry = get('calmjs.loader_plugin')
+        spec = Spec(
+            build_dir='/tmp/build',
+            transpile_sourcepath={'mod': '/src/mod.js'},
+            calmjs_loaderplugin_registry=registry,
+            callback=lambda: None,
+        )
+        spec.advise(SETUP, dict)
+        with pretty_logging(stream=StringIO()) as s:
+            snapshot = spec.snapshot()
+        self.assertIn("['callback'] dropped from snapshot", s.getvalue())
+        self.assertTrue(isinstance(snapshot, bytes))
+
+        restored = Spec.restore(snapshot)
+        self.assertTrue(isinstance(restored, Spec))
+        self.assertEqual({
+            'build_dir': '/tmp/build',
+            'transpile_sourcepath': {'mod': '/src/mod.js'},
+            'calmjs_loaderplugin_registry': registry,
+        }, restored)
+        self.assertIs(registry, restored['calmjs_loaderplugin_registry'])
+        self.assertEqual({}, restored._advices)
+        # the restored values are copies.
+        restored['transpile_sourcepath']['other'] = '/src/other.js'
+        self.assertEqual({'mod': '/src/mod.js'}, spec['transpile_sourcepath'])
+
+    def test_spec_restore_missing_registry(self):
+        registry = LoaderPluginRegistry(
+            'calmjs.testing.no_such_registry', _working_set=WorkingSet({}))
+        snapshot = Spec(calmjs_loaderplugin_registry=registry).snapshot()
+        with pretty_logging(stream=StringIO()) as s:
+            restored = Spec.restore(snapshot)
+        self.assertEqual({}, restored)
+        self.assertIn(
+            "registry 'calmjs.testing.no_such_registry' is unavailable",
+            s.getvalue())
+
+    def test_spec_merge_updates(self):
+        spec = Spec(
+            transpiled_modpaths={'base': 'base'},
+            export_module_names=['base'],
+            count=0,
+        )
+        snapshot = spec.snapshot()
+
+        def work(names):
+            worker = Spec.restore(snapshot)
+            for name in names:
+                worker['transpiled_modpaths'][name] = name
+                worker['export_module_names'].append(name)
+            worker['count'] = len(names)
+            worker['last'] = names[-1]
+            return worker.snapshot_updates(snapshot)
+
+        updates = [work(['a', 'b']), work(['c'])]
+        spec.merge_updates(updates)
+        self.assertEqual({
+            'transpiled_modpaths': {'base': 'base', 'a': 'a', 'b': 'b',
+                                    'c': 'c'},
+            'export_module_names': ['base', 'a', 'b', 'c'],
+            'count': 1,
+            'last': 'c',
+        }, spec)
+
+        # unchanged values produce no updates
+        self.assertEqual(
+            {}, Spec.restore(Spec.restore(snapshot).snapshot_updates(
+                snapshot)))
+
+    def test_spec_merge_updates_replaced(self):
+        spec = Spec(
+            transpiled_modpaths={'a': 'a'},
+            export_module_names=['a', 'b'],
+        )
+        snapshot = spec.snapshot()
+        worker = Spec.restore(snapshot)
+        worker['export_module_names'][0] = 'A'
+        worker['transpiled_modpaths']['a'] = 'A'
+        with pretty_logging(stream=StringIO()) as s:
+            spec.merge_updates([worker.snapshot_updates(snapshot)])
+        self.assertEqual(['A', 'b'], spec['export_module_names'])
+        self.assertEqual({'a': 'A'}, spec['transpiled_modpaths'])
+        self.assertIn(
+            "merging spec key 'transpiled_modpaths' replaced 'a' with 'A' "
+            "(was 'a')", s.getvalue())
+
 
 class SpecAdviceTestCase(unittest.TestCase):
     """
@@ -602,6 +717,142 @@ class SpecAdviceTestCase(unittest.TestCase):
         self.assertIn('Traceback for original advice', s.getvalue())
         self.assertIn('line 17, in create_spec_advise_fault', s.getvalue())
 
+    @unittest.skipIf(currentframe() is None, 'stack frame not supported')
+    def test_spec_advise_debug_2_lazy_stack(self):
+        spec = Spec(debug=2)
+        with pretty_logging(stream=StringIO()):
+            create_spec_advise_fault(spec, 'broken')
+
+        # only the cheap stack entries are recorded.
+        entries, = spec._frames.values()
+        self.assertTrue(all(isinstance(e, tuple) for e in entries))
+        self.assertEqual(
+            ('create_spec_advise_fault', 'apply_spec_advise_fault'),
+            (entries[-2][2], entries[-1][2]),
+        )
+        self.assertEqual(17, entries[-2][1])
+        formatted = calmjs_toolchain._format_stack_entries(entries[-2:])
+        self.assertIn('line 17, in create_spec_advise_fault', formatted)
+        self.assertIn(
+            'apply_spec_advise_fault(spec, advice_name)', formatted)
+
+    def test_spec_advice_trace(self):
+        spec = Spec()
+
+        def ok():
+            pass
+
+        def cancel():
+            raise AdviceCancel('cancel')
+
+        def abort():
+            raise AdviceAbort('abort')
+
+        def error():
+            raise Exception('error')
+
+        for f in (error, abort, cancel, ok):
+            spec.advise('group', f)
+        spec.advise('other', ok)
+        with pretty_logging(stream=StringIO()):
+            spec.handle('group')
+            spec.handle('other')
+
+        trace = spec.advice_trace
+        self.assertEqual([(
+            entry.group, entry.name.split('.')[-1], entry.outcome)
+            for entry in trace
+        ], [
+            ('group', 'ok', 'ok'),
+            ('group', 'cancel', 'cancel'),
+            ('group', 'abort', 'abort'),
+            ('group', 'error', 'error'),
+            ('other', 'ok', 'ok'),
+        ])
+        self.assertTrue(all(entry.duration >= 0 for entry in trace))
+        # the returned trace is a copy
+        trace.pop()
+        self.assertEqual(5, len(spec.advice_trace))
+        self.assertEqual({
+            ('group', 'ok', 1, ('ok',)),
+            ('group', 'cancel', 1, ('cancel',)),
+            ('group', 'abort', 1, ('abort',)),
+            ('group', 'error', 1, ('error',)),
+            ('other', 'ok', 1, ('ok',)),
+        }, set(
+            (group, name.split('.')[-1], count, outcomes)
+            for group, name, count, total, longest, outcomes in
+            spec.advice_summary
+        ))
+
+    def test_spec_advice_trace_limit(self):
+        class LimitedSpec(Spec):
+            advice_trace_limit = 4
+
+        spec = LimitedSpec()
+
+        def ok():
+            pass
+
+        def error():
+            raise Exception('error')
+
+        # advices are invoked in the reverse order of declaration.
+        for i in range(9):
+            spec.advise('group', ok)
+        spec.advise('group', error)
+        with pretty_logging(stream=StringIO()):
+            spec.handle('group')
+
+        # only the most recent entries are retained in the trace, while
+        # the summary covers every advice invoked.
+        self.assertEqual(4, len(spec.advice_trace))
+        self.assertEqual(['ok'] * 4, [
+            entry.outcome for entry in spec.advice_trace])
+        summary = {
+            name.split('.')[-1]: (count, outcomes)
+            for group, name, count, total, longest, outcomes in
+            spec.advice_summary
+        }
+        self.assertEqual({
+            'ok': (9, ('ok',)),
+            'error': (1, ('error',)),
+        }, summary)
+
+    def test_spec_advice_trace_toolchain_abort(self):
+        spec = Spec()
+
+        def abort():
+            raise ToolchainAbort('abort')
+
+        spec.advise('group', abort)
+        with pretty_logging(stream=StringIO()):
+            with self.assertRaises(ToolchainAbort):
+                spec.handle('group')
+        self.assertEqual(['abort'], [
+            entry.outcome for entry in spec.advice_trace])
+
+    def test_summarize_advice_trace(self):
+        AdviceTrace = calmjs_toolchain.AdviceTrace
+        self.assertEqual(calmjs_toolchain.summarize_advice_trace([
+            AdviceTrace('setup', 'mod:fast', 0.5, 'ok'),
+            AdviceTrace('cleanup', 'mod:slow', 1.5, 'ok'),
+            AdviceTrace('setup', 'mod:fast', 1.0, 'error'),
+            AdviceTrace('setup', 'mod:fast', 0.25, 'ok'),
+        ]), [
+            ('setup', 'mod:fast', 3, 1.75, 1.0, ('ok', 'error')),
+            ('cleanup', 'mod:slow', 1, 1.5, 1.5, ('ok',)),
+        ])
+
+    def test_advice_name(self):
+        self.assertEqual(
+            'calmjs.toolchain:null_transpiler',
+            calmjs_toolchain._advice_name(calmjs_toolchain.null_transpiler))
+        self.assertEqual(
+            'calmjs.toolchain:null_transpiler',
+            calmjs_toolchain._advice_name(
+                partial(calmjs_toolchain.null_transpiler, None)))
+
     # infinite loop protection checks.
 
     @unittest.skipIf(currentframe() is None, 'stack frame not supported')
@@ -1603,6 +1854,99 @@ class ToolchainTestCase(unittest.TestCase):
         self.assertTrue(exists(join(build_dir, target3)))
         self.assertTrue(exists(join(build_dir, target4)))
 
+    def test_toolchain_compile_bundle_entry_directory_sync(self):
+        build_dir = mkdtemp(self)
+        src_dir = mkdtemp(self)
+        with open(join(src_dir, 'data.txt'), 'w') as fd:
+            fd.write('data')
+        with open(join(src_dir, 'removed.txt'), 'w') as fd:
+            fd.write('removed')
+
+        spec = {'build_dir': build_dir}
+        entry = ('assets', src_dir, 'assets', 'assets')
+        self.toolchain.compile_bundle_entry(spec, entry)
+        self.assertTrue(exists(join(build_dir, 'assets', 'removed.txt')))
+
+        # bundling again into the existing directory is possible, with
+        # the changes synchronized.
+        os.unlink(join(src_dir, 'removed.txt'))
+        with pretty_logging(
+                logger='calmjs.toolchain', stream=StringIO()) as s:
+            self.assertEqual(
+                ({'assets': 'assets'}, {'assets': 'assets'}, []),
+                self.toolchain.compile_bundle_entry(spec, entry),
+            )
+        self.assertIn('0 files copied (0 bytes), 1 deleted, 1 unchanged',
+                      s.getvalue())
+        self.assertFalse(exists(join(build_dir, 'assets', 'removed.txt')))
+
+    def test_toolchain_prepare_build_targets(self):
+        build_dir = realpath(mkdtemp(self))
+        spec = Spec(build_dir=build_dir)
+        self.toolchain.prepare_build_targets(spec, [
+            ('mod1', 'mod1.js', 'mod1.js', 'mod1'),
+            ('mod2', 'mod2.js', join('ns', 'mod2.js'), 'mod2'),
+            ('mod3', 'mod3.js', join('ns', 'sub', 'mod3.js'), 'mod3'),
+            ('mod4', 'mod4.js', join('ns', 'sub', 'mod4.js'), 'mod4'),
+            ('mod5', 'mod5.js', join('..', 'outside', 'mod5.js'), 'mod5'),
+        ])
+        self.assertTrue(isdir(join(build_dir, 'ns', 'sub')))
+        # directories outside of build_dir are never created.
+        self.assertFalse(exists(join(dirname(build_dir), 'outside')))
+
+        # the targets inside the prepared directories are no longer
+        # resolved or checked for individually.
+        calls = []
+
+        def realpath_(path):
+            calls.append(path)
+            return realpath(path)
+
+        stub_item_attr_value(
+            self, calmjs_toolchain, 'realpath', realpath_)
+        stub_item_attr_value(self, calmjs_toolchain, 'exists', realpath_)
+        self.assertEqual(
+            join(build_dir, 'ns', 'sub', 'mod3.js'),
+            self.toolchain._generate_transpile_target(
+                spec, join('ns', 'sub', 'mod3.js')))
+        self.assertEqual([], calls)
+
+        # the ones outside still fail as they did before.
+        with self.assertRaises(ValueError):
+            self.toolchain._generate_transpile_target(
+                spec, join('..', 'outside', 'mod5.js'))
+
+    @unittest.skipIf(not hasattr(os, 'symlink'), 'symlink not supported')
+    def test_toolchain_validate_build_target_link(self):
+        build_dir = realpath(mkdtemp(self))
+        outside = mkdtemp(self)
+        spec = Spec(build_dir=build_dir)
+        self.toolchain._generate_transpile_target(spec, 'mod1.js')
+        os.symlink(join(outside, 'mod2.js'), join(build_dir, 'mod2.js'))
+        # a link inside a validated directory is still resolved.
+        with self.assertRaises(ValueError):
+            self.toolchain._generate_transpile_target(spec, 'mod2.js')
+
+    def test_toolchain_build_target_cache_reset(self):
+        build_dir = realpath(mkdtemp(self))
+        spec = Spec(build_dir=build_dir)
+        target = self.toolchain._generate_transpile_target(
+            spec, join('ns', 'mod.js'))
+        self.assertTrue(isdir(dirname(target)))
+        shutil.rmtree(dirname(target))
+        # a new run will not trust the directories from the previous
+        # run.
+        self.toolchain._reset_build_target_cache()
+        self.toolchain._generate_transpile_target(spec, join('ns', 'mod.js'))
+        self.assertTrue(isdir(dirname(target)))
+
+        # nor will a spec with a different build_dir.
+        other_dir = realpath(mkdtemp(self))
+        target = self.toolchain._generate_transpile_target(
+            Spec(build_dir=other_dir), join('ns', 'mod.js'))
+        self.assertEqual(join(other_dir, 'ns', 'mod.js'), target)
+        self.assertTrue(isdir(dirname(target)))
+
     def test_toolchain_setup_advice_abort_does_cleanup(self):
         spec = Spec()
 
@@ -2253,6 +2597,170 @@ class NullToolchainTestCase(unittest.TestCase):
 
         self._check_toolchain_advice(interrupt, False)
 
+    def setup_rebuild(self, advices=()):
+        tmpdir = mkdtemp(self)
+        build_dir = join(tmpdir, 'build')
+        os.mkdir(build_dir)
+        sources = {}
+        for name in ('a', 'b'):
+            sources[name] = join(tmpdir, name + '.js')
+            with open(sources[name], 'w') as fd:
+                fd.write('var %s = 1;\n' % name)
+        bundled = join(tmpdir, 'data.txt')
+        with open(bundled, 'w') as fd:
+            fd.write('data')
+        spec = Spec(
+            build_dir=build_dir, export_target=join(tmpdir, 'export.js'),
+            transpile_sourcepath=dict(sources),
+            bundle_sourcepath={'data.txt': bundled},
+        )
+        for name, f in advices:
+            spec.advise(name, f, name)
+        self.toolchain(spec)
+        return spec, sources, bundled
+
+    def test_rebuild_changed(self):
+        spec, sources, bundled = self.setup_rebuild()
+        calls = []
+        self.toolchain.assemble = calls.append
+        self.toolchain.link = calls.append
+
+        with open(sources['a'], 'w') as fd:
+            fd.write('var a = 2;\n')
+        with pretty_logging(stream=StringIO()) as s:
+            self.assertEqual(['a.js'], self.toolchain.rebuild(
+                spec, [sources['a']]))
+        self.assertIn('1 compiled outputs changed; relinking', s.getvalue())
+        self.assertEqual([spec, spec], calls)
+        with open(join(spec['build_dir'], 'a.js')) as fd:
+            self.assertEqual('var a = 2;\n', fd.read())
+        self.assertEqual({'a': 'a', 'b': 'b'}, spec['transpiled_modpaths'])
+        self.assertEqual(['a', 'b', 'data.txt'], sorted(
+            spec['export_module_names']))
+
+    def test_rebuild_link_advices(self):
+        advised = []
+        spec, sources, bundled = self.setup_rebuild([
+            (BEFORE_LINK, advised.append),
+            (AFTER_LINK, advised.append),
+            (AFTER_COMPILE, advised.append),
+        ])
+        self.assertEqual([AFTER_COMPILE, BEFORE_LINK, AFTER_LINK], advised)
+        del advised[:]
+
+        with open(sources['a'], 'w') as fd:
+            fd.write('var a = 2;\n')
+        with pretty_logging(stream=StringIO()) as s:
+            self.toolchain.rebuild(spec, [sources['a']])
+            self.toolchain.rebuild(spec, [sources['a']])
+            with open(sources['a'], 'w') as fd:
+                fd.write('var a = 3;\n')
+            self.toolchain.rebuild(spec, [sources['a']])
+        # the link advices were invoked for each of the relinks, with
+        # the unchanged rebuild skipped.
+        self.assertEqual([BEFORE_LINK, AFTER_LINK] * 2, advised)
+        self.assertNotIn('has been called', s.getvalue())
+
+    def test_rebuild_unchanged_output(self):
+        spec, sources, bundled = self.setup_rebuild()
+        calls = []
+        self.toolchain.assemble = calls.append
+        self.toolchain.link = calls.append
+        original = self.toolchain.compile_transpile_entry
+        compiled = []
+
+        def compile_transpile_entry(spec, entry):
+            compiled.append(entry[0])
+            return original(spec, entry)
+
+        self.toolchain.compile_transpile_entry = compile_transpile_entry
+        # touched, but with the same content; also the unrelated path.
+        with open(sources['b'], 'w') as fd:
+            fd.write('var b = 1;\n')
+        with pretty_logging(stream=StringIO()) as s:
+            self.assertEqual([], self.toolchain.rebuild(
+                spec, [sources['b'], '/no/such/source.js']))
+        self.assertIn('compiled outputs unchanged', s.getvalue())
+        self.assertEqual(['b'], compiled)
+        self.assertEqual([], calls)
+
+    def test_build_cache_dir(self):
+        tmpdir = mkdtemp(self)
+        cache_dir = join(tmpdir, 'cache')
+        os.mkdir(cache_dir)
+        sources = {}
+        for name in ('a', 'b'):
+            sources[name] = join(tmpdir, name + '.js')
+            with open(sources[name], 'w') as fd:
+                fd.write('var %s = 1;\n' % name)
+
+        original = self.toolchain.compile_transpile_entry
+        compiled = []
+
+        def compile_transpile_entry(spec, entry):
+            compiled.append(entry[0])
+            return original(spec, entry)
+
+        self.toolchain.compile_transpile_entry = compile_transpile_entry
+
+        def build(sourcepaths):
+            spec = Spec(
+                build_cache_dir=cache_dir,
+                export_target=join(tmpdir, 'export.js'),
+                transpile_sourcepath=sourcepaths,
+            )
+            with pretty_logging(stream=StringIO()):
+                self.toolchain(spec)
+            return spec
+
+        spec = build(dict(sources))
+        build_dir = spec['build_dir']
+        self.assertTrue(build_dir.startswith(realpath(cache_dir)))
+        self.assertTrue(exists(join(build_dir, 'b.js')))
+        self.assertEqual(['a', 'b'], sorted(compiled))
+        self.assertFalse(spec['build_workspace'].locked)
+
+        # b removed, a unchanged
+        spec = build({'a': sources['a']})
+        self.assertEqual(build_dir, spec['build_dir'])
+        self.assertEqual(['a', 'b'], sorted(compiled))
+        self.assertEqual({'a': 'a'}, spec['transpiled_modpaths'])
+        self.assertEqual(['a'], spec['export_module_names'])
+        self.assertTrue(exists(join(build_dir, 'a.js')))
+        self.assertFalse(exists(join(build_dir, 'b.js')))
+
+        # a different export target uses a different workspace.
+        spec = Spec(
+            build_cache_dir=cache_dir,
+            export_target=join(tmpdir, 'other.js'),
+        )
+        self.toolchain(spec)
+        self.assertNotEqual(build_dir, spec['build_dir'])
+
+    def test_build_cache_dir_locked(self):
+        tmpdir = mkdtemp(self)
+        spec = Spec(build_cache_dir=tmpdir, export_target='export.js')
+        self.toolchain.setup_build_workspace(spec)
+        locked = spec['build_workspace']
+        self.addCleanup(locked.release)
+
+        spec = Spec(build_cache_dir=tmpdir, export_target='export.js')
+        with pretty_logging(stream=StringIO()) as s:
+            self.toolchain(spec)
+        self.assertIn('is in use by another build', s.getvalue())
+        self.assertNotIn('build_workspace', spec)
+        # the temporary build directory was removed
+        self.assertFalse(exists(spec['build_dir']))
+
+    def test_recompile_bundled(self):
+        spec, sources, bundled = self.setup_rebuild()
+        with open(bundled, 'w') as fd:
+            fd.write('new data')
+        self.assertEqual(['data.txt'], self.toolchain.recompile(
+            spec, [bundled]))
+        with open(join(spec['build_dir'], 'data.txt')) as fd:
+            self.assertEqual('new data', fd.read())
+
 
 class ES5ToolchainTestCase(unittest.TestCase):
     """
@@ -2309,3 +2817,126 @@ class ES5ToolchainTestCase(unittest.TestCase):
         self.assertEqual(len(result['sources']), 1)
         self.assertEqual(basename(result['sources'][0]), 'source.js')
         self.assertEqual(result['file'], target)
+
+    def test_transpiler_sizes(self):
+        tmpdir = mkdtemp(self)
+        js_code = 'var dummy = function() {\n};\n'
+        source = join(tmpdir, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write(js_code)
+
+        spec = Spec(build_dir=tmpdir)
+        self.toolchain.transpile_modname_source_target(
+            spec, 'dummy', source, 'target.js')
+        self.toolchain.transpile_modname_source_target(
+            spec, 'other', source, 'other.js')
+        self.assertEqual({
+            'dummy': (len(js_code), len(js_code)),
+            'other': (len(js_code), len(js_code)),
+        }, spec['transpiled_sizes'])
+        self.assertEqual(
+            (len(js_code) * 2, len(js_code) * 2),
+            spec['transpiled_sizes_total'])
+
+        # transpiling again will not be counted twice
+        with open(source, 'w') as fd:
+            fd.write('var dummy;\n')
+        self.toolchain.transpile_modname_source_target(
+            spec, 'dummy', source, 'target.js')
+        self.assertEqual((11, 11), spec['transpiled_sizes']['dummy'])
+        self.assertEqual(
+            (len(js_code) + 11, len(js_code) + 11),
+            spec['transpiled_sizes_total'])
+
+
+class ES5MinifyToolchainTestCase(unittest.TestCase):
+    """
+    The minifying ES5 toolchain test case.
+    """
+
+    js_code = (
+        'var dummy = function(argument) {\n'
+        '    var value = argument + 1;\n'
+        '    return value;\n'
+        '};\n'
+    )
+
+    def setUp(self):
+        self.build_dir = mkdtemp(self)
+        self.source = join(mkdtemp(self), 'source.js')
+        with open(self.source, 'w') as fd:
+            fd.write(self.js_code)
+
+    def test_transpiler_minify(self):
+        toolchain = ES5MinifyToolchain()
+        spec = Spec(build_dir=self.build_dir, generate_source_map=True)
+        toolchain.transpile_modname_source_target(
+            spec, 'dummy', self.source, 'target.js')
+
+        with open(join(self.build_dir, 'target.js')) as fd:
+            result = fd.read()
+        self.assertTrue(result.startswith(
+            'var dummy=function(argument){var value=argument+1;'
+            'return value;};'))
+        with open(join(self.build_dir, 'target.js.map')) as fd:
+            sourcemap = json.load(fd)
+        self.assertEqual(basename(sourcemap['sources'][0]), 'source.js')
+
+        source_size, target_size = spec['transpiled_sizes']['dummy']
+        self.assertEqual(len(self.js_code), source_size)
+        self.assertEqual(len(result), target_size)
+
+    def test_transpiler_minify_obfuscate(self):
+        toolchain = ES5MinifyToolchain(obfuscate=True)
+        spec = Spec(build_dir=self.build_dir)
+        toolchain.transpile_modname_source_target(
+            spec, 'dummy', self.source, 'target.js')
+
+        with open(join(self.build_dir, 'target.js')) as fd:
+            result = fd.read()
+        self.assertEqual(
+            'var dummy=function(b){var a=b+1;return a;};', result)
+
+    def test_compile_sizes_logged(self):
+        toolchain = ES5MinifyToolchain()
+        spec = Spec(
+            build_dir=self.build_dir,
+            transpile_sourcepath={'dummy': self.source},
+        )
+        with pretty_logging(
+                logger='calmjs.toolchain', stream=StringIO()) as s:
+            toolchain.compile(spec)
+        self.assertIn(
+            'minified 1 modules from %d bytes to %d bytes' % (
+                spec['transpiled_sizes_total']), s.getvalue())
+
+    def test_build_workspace_reused(self):
+        cache_dir = mkdtemp(self)
+        export_target = join(mkdtemp(self), 'export.js')
+
+        def compile_spec(toolchain, **kw):
+            spec = Spec(
+                build_cache_dir=cache_dir,
+                export_target=export_target,
+                transpile_sourcepath={'dummy': self.source},
+                **kw
+            )
+            toolchain.setup_build_workspace(spec)
+            toolchain.compile(spec)
+            spec['build_workspace'].success()
+            spec['build_workspace'].close()
+            return spec
+
+        spec1 = compile_spec(ES5MinifyToolchain())
+        spec2 = compile_spec(ES5MinifyToolchain())
+        self.assertEqual(spec1['build_dir'], spec2['build_dir'])
+        self.assertEqual(1, spec2['build_workspace'].reused)
+        # the sizes are recorded for the reused entries.
+        self.assertEqual(
+            spec1['transpiled_sizes'], spec2['transpiled_sizes'])
+
+        # different configurations use different workspaces.
+        spec3 = compile_spec(ES5MinifyToolchain(obfuscate=True))
+        self.assertNotEqual(spec1['build_dir'], spec3['build_dir'])
+        spec4 = compile_spec(ES5MinifyToolchain(), generate_source_map=True)
+        self.assertNotEqual(spec1['build_dir'], spec4['build_dir'])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import unittest
+from os.path import join
+
+from calmjs import trace
+from calmjs.utils import pretty_logging
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_os_environ
+
+
+class TracerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stub_os_environ(self)
+        os.environ.pop(trace.CALMJS_TRACE, None)
+        self.tracer = trace.Tracer()
+
+    def test_disabled(self):
+        self.assertFalse(self.tracer.start())
+        self.assertIs(self.tracer.span('name'), trace._null_span)
+        with self.tracer.span('name'):
+            pass
+        self.tracer.complete('name', 'cat', 0, 1)
+        self.assertEqual([], self.tracer.events)
+        # stopping a tracer that has not started is a no-op
+        self.tracer.stop()
+
+    def test_span_and_write(self):
+        target = join(mkdtemp(self), 'trace.json')
+        self.assertTrue(self.tracer.start(target))
+        # already started.
+        self.assertFalse(self.tracer.start(target))
+        with self.tracer.span('outer', 'test', value=1):
+            with self.tracer.span('inner', 'test', obj=object()):
+                pass
+        with self.assertRaises(ValueError):
+            with self.tracer.span('failure', 'test'):
+                raise ValueError('failure')
+
+        with pretty_logging(stream=StringIO()) as stream:
+            self.tracer.stop()
+        self.assertIn("wrote 3 trace events to '%s'" % target, (
+            stream.getvalue()))
+        self.assertFalse(self.tracer.enabled)
+
+        with open(target) as fd:
+            result = json.load(fd)
+        events = result['traceEvents']
+        self.assertEqual('M', events[0]['ph'])
+        self.assertEqual(
+            ['outer', 'inner', 'failure'], [e['name'] for e in events[1:]])
+        outer, inner, failure = events[1:]
+        self.assertEqual('X', outer['ph'])
+        self.assertEqual('test', outer['cat'])
+        self.assertEqual({'value': 1}, outer['args'])
+        self.assertIn('<object object', inner['args']['obj'])
+        self.assertEqual({'error': 'ValueError'}, failure['args'])
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(
+            outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+
+    def test_start_environ(self):
+        target = join(mkdtemp(self), 'trace.json')
+        os.environ[trace.CALMJS_TRACE] = target
+        self.assertTrue(self.tracer.start())
+        self.assertEqual(target, self.tracer.path)
+
+    def test_write_failure(self):
+        target = join(mkdtemp(self), 'no_such_dir', 'trace.json')
+        self.tracer.start(target)
+        with pretty_logging(stream=StringIO()) as stream:
+            self.tracer.stop()
+        self.assertIn("failed to write trace to '%s'" % target, (
+            stream.getvalue()))
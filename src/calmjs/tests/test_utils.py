@@ -4,6 +4,7 @@ import errno
 import io
 import logging
 import os
+from os.path import exists
 from os.path import join
 from os.path import pathsep
 import sys
@@ -17,6 +18,7 @@ from calmjs.utils import finalize_env
 from calmjs.utils import fork_exec
 from calmjs.utils import pretty_logging
 from calmjs.utils import raise_os_error
+from calmjs.utils import sync_directory
 
 from calmjs.testing.mocks import StringIO
 from calmjs.testing.utils import mkdtemp
@@ -217,3 +219,94 @@ class LoggingTestCase(unittest.TestCase):
         self.assertIs(fd, stream)
         self.assertIn(u'hello', stream.getvalue())
         self.assertEqual(len(logger.handlers), 0)
+
+
+def write(path, content):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+class SyncDirectoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.source = mkdtemp(self)
+        self.target = join(mkdtemp(self), 'target')
+        write(join(self.source, 'a.txt'), 'aaaa')
+        os.mkdir(join(self.source, 'sub'))
+        write(join(self.source, 'sub', 'b.txt'), 'bb')
+
+    def test_initial_and_unchanged(self):
+        result = sync_directory(self.source, self.target)
+        self.assertEqual((2, 0, 0, 6), result)
+        with open(join(self.target, 'sub', 'b.txt')) as fd:
+            self.assertEqual('bb', fd.read())
+        self.assertEqual((0, 0, 2, 0), sync_directory(
+            self.source, self.target))
+
+    def test_changed_and_deleted(self):
+        sync_directory(self.source, self.target)
+        write(join(self.source, 'a.txt'), 'aaaaa')
+        os.unlink(join(self.source, 'sub', 'b.txt'))
+        os.mkdir(join(self.source, 'new'))
+        write(join(self.source, 'new', 'c.txt'), 'c')
+        # extraneous files and directories in target
+        write(join(self.target, 'extra.txt'), 'extra')
+        os.mkdir(join(self.target, 'extra'))
+        write(join(self.target, 'extra', 'd.txt'), 'd')
+
+        result = sync_directory(self.source, self.target)
+        self.assertEqual((2, 3, 0, 6), result)
+        self.assertEqual(['a.txt', 'new', 'sub'], sorted(os.listdir(
+            self.target)))
+        self.assertEqual([], os.listdir(join(self.target, 'sub')))
+
+    def test_type_changes(self):
+        write(self.target, 'a file')
+        os.mkdir(join(self.source, 'was_file'))
+        self.assertEqual((2, 1, 0, 6), sync_directory(
+            self.source, self.target))
+        # a directory in the target where the source is a file, and the
+        # other way around.
+        os.rmdir(join(self.source, 'was_file'))
+        write(join(self.source, 'was_file'), 'now a file')
+        os.unlink(join(self.source, 'a.txt'))
+        os.mkdir(join(self.source, 'a.txt'))
+        result = sync_directory(self.source, self.target)
+        self.assertEqual(1, result.copied)
+        self.assertEqual(2, result.deleted)
+        self.assertTrue(os.path.isdir(join(self.target, 'a.txt')))
+        with open(join(self.target, 'was_file')) as fd:
+            self.assertEqual('now a file', fd.read())
+
+    def test_checksum(self):
+        sync_directory(self.source, self.target)
+        # same size and modification time, but different contents.
+        stat = os.stat(join(self.target, 'a.txt'))
+        write(join(self.target, 'a.txt'), 'zzzz')
+        os.utime(join(self.target, 'a.txt'), (stat.st_atime, stat.st_mtime))
+        self.assertEqual(0, sync_directory(
+            self.source, self.target).copied)
+        self.assertEqual(1, sync_directory(
+            self.source, self.target, checksum=True).copied)
+        with open(join(self.target, 'a.txt')) as fd:
+            self.assertEqual('aaaa', fd.read())
+
+    @unittest.skipIf(not hasattr(os, 'symlink'), 'symlink not available')
+    def test_symlinked_directory(self):
+        linked = mkdtemp(self)
+        write(join(linked, 'c.txt'), 'ccc')
+        os.symlink(linked, join(self.source, 'linked'))
+        # a link back to the source is not followed.
+        os.symlink(self.source, join(self.source, 'sub', 'cycle'))
+        result = sync_directory(self.source, self.target)
+        self.assertEqual((3, 0, 0, 9), result)
+        with open(join(self.target, 'linked', 'c.txt')) as fd:
+            self.assertEqual('ccc', fd.read())
+        self.assertFalse(exists(join(self.target, 'sub', 'cycle')))
+        self.assertEqual((0, 0, 3, 0), sync_directory(
+            self.source, self.target))
+
+    def test_missing_source(self):
+        self.assertEqual((0, 0, 0, 0), sync_directory(
+            join(self.source, 'missing'), self.target))
+        self.assertFalse(exists(self.target))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from os.path import join
+
+from calmjs import watch
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+
+
+def write(path, content):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+class WatcherTestCase(unittest.TestCase):
+
+    def test_base(self):
+        watcher = watch.Watcher(['a'])
+        with self.assertRaises(NotImplementedError):
+            watcher.wait()
+        watcher.close()
+
+    def test_debounce(self):
+        polls = [{'a'}, {'b'}, set(), {'c'}, set()]
+        watcher = watch.Watcher(['a', 'b', 'c'])
+        watcher._poll = lambda timeout: polls.pop(0)
+        self.assertEqual({'a', 'b'}, watcher.wait())
+        self.assertEqual({'c'}, watcher.wait())
+
+
+class PollingWatcherTestCase(unittest.TestCase):
+
+    def test_changes(self):
+        tmpdir = mkdtemp(self)
+        source = join(tmpdir, 'source.js')
+        other = join(tmpdir, 'other.js')
+        write(source, 'var a = 1;')
+        write(other, 'var b = 1;')
+        watcher = watch.PollingWatcher(
+            [source, other], debounce=0.01, interval=0.01)
+        self.assertEqual(set(), watcher.wait(0.02))
+
+        write(source, 'var a = 22;')
+        self.assertEqual({source}, watcher.wait(0.02))
+        self.assertEqual(set(), watcher.wait(0.02))
+
+        os.unlink(other)
+        self.assertEqual({other}, watcher.wait(0.02))
+        watcher.close()
+
+    def test_changes_within_directory(self):
+        tmpdir = mkdtemp(self)
+        nested = join(tmpdir, 'nested', 'deeper')
+        os.makedirs(nested)
+        source = join(nested, 'source.js')
+        write(source, 'var a = 1;')
+        watcher = watch.PollingWatcher(
+            [tmpdir], debounce=0.01, interval=0.01)
+        self.assertEqual(set(), watcher.wait(0.02))
+
+        # same size, with the modification time forced forward such
+        # that the change will be detected regardless of resolution.
+        write(source, 'var a = 2;')
+        st = os.stat(source)
+        os.utime(source, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual({tmpdir}, watcher.wait(0.02))
+        self.assertEqual(set(), watcher.wait(0.02))
+
+        write(join(nested, 'new.js'), 'var b = 1;')
+        self.assertEqual({tmpdir}, watcher.wait(0.02))
+        watcher.close()
+
+
+@unittest.skipIf(watch.inotify_libc() is None, 'inotify not available')
+class InotifyWatcherTestCase(unittest.TestCase):
+
+    def test_changes(self):
+        tmpdir = mkdtemp(self)
+        source = join(tmpdir, 'source.js')
+        unwatched = join(tmpdir, 'unwatched.js')
+        subdir = join(tmpdir, 'sub')
+        os.mkdir(subdir)
+        write(source, 'var a = 1;')
+        watcher = watch.InotifyWatcher([source, subdir], debounce=0.01)
+        self.addCleanup(watcher.close)
+        self.assertEqual(set(), watcher.wait(0.01))
+
+        write(unwatched, 'var b = 1;')
+        self.assertEqual(set(), watcher.wait(0.05))
+
+        write(source, 'var a = 2;')
+        self.assertEqual({source}, watcher.wait(0.05))
+
+        # replacement through a rename, along with a burst of changes.
+        write(source + '.tmp', 'var a = 3;')
+        os.rename(source + '.tmp', source)
+        write(join(subdir, 'new.js'), 'var c = 1;')
+        self.assertEqual({source, subdir}, watcher.wait(0.05))
+
+    def test_changes_within_directory(self):
+        tmpdir = mkdtemp(self)
+        nested = join(tmpdir, 'nested')
+        os.mkdir(nested)
+        watcher = watch.InotifyWatcher([tmpdir], debounce=0.01)
+        self.addCleanup(watcher.close)
+
+        write(join(nested, 'source.js'), 'var a = 1;')
+        self.assertEqual({tmpdir}, watcher.wait(0.05))
+
+        # directories created afterwards are also watched.
+        created = join(nested, 'created')
+        os.mkdir(created)
+        self.assertEqual({tmpdir}, watcher.wait(0.05))
+        write(join(created, 'new.js'), 'var b = 1;')
+        self.assertEqual({tmpdir}, watcher.wait(0.05))
+
+    def test_missing_directory(self):
+        tmpdir = mkdtemp(self)
+        with self.assertRaises(OSError):
+            watch.InotifyWatcher([join(tmpdir, 'missing', 'source.js')])
+
+    def test_make_watcher(self):
+        watcher = watch.make_watcher([])
+        self.addCleanup(watcher.close)
+        self.assertTrue(isinstance(watcher, watch.InotifyWatcher))
+
+
+class MakeWatcherTestCase(unittest.TestCase):
+
+    def test_fallback_no_inotify(self):
+        stub_item_attr_value(self, watch, 'inotify_libc', lambda: None)
+        self.assertTrue(isinstance(
+            watch.make_watcher([]), watch.PollingWatcher))
+        with self.assertRaises(OSError):
+            watch.InotifyWatcher([])
+
+    def test_fallback_inotify_failure(self):
+        class FakeLibc(object):
+            def inotify_init1(self, flags):
+                return -1
+
+        stub_item_attr_value(self, watch, 'inotify_libc', FakeLibc)
+        self.assertTrue(isinstance(
+            watch.make_watcher([]), watch.PollingWatcher))
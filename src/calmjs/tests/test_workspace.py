@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs import workspace
+from calmjs.utils import sync_directory
+from calmjs.utils import pretty_logging
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(path, content):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+class HelpersTestCase(unittest.TestCase):
+
+    def test_workspace_key(self):
+        self.assertEqual(
+            workspace.workspace_key('a', ['b']),
+            workspace.workspace_key('a', ['b']))
+        self.assertNotEqual(
+            workspace.workspace_key('a', ['b']),
+            workspace.workspace_key('a', ['c']))
+
+    def test_source_stamp(self):
+        tmpdir = mkdtemp(self)
+        self.assertIsNone(workspace.source_stamp(join(tmpdir, 'missing')))
+        source = join(tmpdir, 'source.js')
+        write(source, 'var a;')
+        stamp = workspace.source_stamp(source)
+        self.assertEqual(6, stamp[1])
+        write(source, 'var ab;')
+        self.assertNotEqual(stamp, workspace.source_stamp(source))
+
+        dir_stamp = workspace.source_stamp(tmpdir)
+        self.assertEqual(3, len(dir_stamp))
+        write(join(tmpdir, 'other.js'), 'var b;')
+        self.assertNotEqual(dir_stamp, workspace.source_stamp(tmpdir))
+
+
+class BuildWorkspaceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        self.workspace = workspace.BuildWorkspace(self.root, 'key')
+
+    def test_acquire_release(self):
+        self.assertTrue(self.workspace.acquire())
+        self.assertTrue(exists(self.workspace.build_dir))
+        other = workspace.BuildWorkspace(self.root, 'key')
+        # locked by this (alive) process.
+        self.assertFalse(other.acquire())
+        self.workspace.release()
+        self.assertFalse(self.workspace.locked)
+        self.assertTrue(other.acquire())
+        other.release()
+        # releasing twice is harmless.
+        other.release()
+
+    def test_acquire_stale_lock(self):
+        os.makedirs(self.workspace.build_dir)
+        write(self.workspace.lock_path, 'not a pid')
+        self.assertTrue(self.workspace.acquire())
+        with open(self.workspace.lock_path) as fd:
+            self.assertEqual(str(os.getpid()), fd.read().strip())
+        self.workspace.release()
+
+    def test_acquire_exclusive_fallback(self):
+        from calmjs.testing.utils import stub_item_attr_value
+        stub_item_attr_value(self, workspace, 'fcntl', None)
+        os.makedirs(self.workspace.build_dir)
+        # held by a live process.
+        write(self.workspace.lock_path, '%d' % os.getpid())
+        self.assertFalse(self.workspace.acquire())
+
+        # a stale lock is moved aside and removed.
+        write(self.workspace.lock_path, 'not a pid')
+        with pretty_logging(stream=StringIO()) as s:
+            self.assertTrue(self.workspace.acquire())
+        self.assertIn('removed stale lock', s.getvalue())
+        self.assertEqual(['lock'], [
+            name for name in os.listdir(self.workspace.path)
+            if name.startswith('lock')])
+        self.workspace.release()
+        self.assertFalse(exists(self.workspace.lock_path))
+
+    def test_acquire_exclusive_fallback_replaced(self):
+        # the stale lock was replaced by another build before it could
+        # be moved aside, so the lock of that build is restored.
+        from calmjs.testing.utils import stub_item_attr_value
+        stub_item_attr_value(self, workspace, 'fcntl', None)
+        os.makedirs(self.workspace.build_dir)
+        write(self.workspace.lock_path, '0')
+        pids = iter([0, os.getpid()])
+        self.workspace._read_lock_pid = lambda path: next(pids)
+        self.assertFalse(self.workspace.acquire())
+        self.assertTrue(exists(self.workspace.lock_path))
+        self.assertFalse(self.workspace.locked)
+
+    def test_memoize_prune_save(self):
+        self.assertTrue(self.workspace.acquire())
+        build_dir = self.workspace.build_dir
+        tmpdir = mkdtemp(self)
+        source = join(tmpdir, 'a.js')
+        removed = join(tmpdir, 'b.js')
+        write(source, 'var a;')
+        write(removed, 'var b;')
+        calls = []
+
+        def processor(spec, entry):
+            modname, source, target, modpath = entry
+            calls.append(modname)
+            with open(source) as src, open(join(build_dir, target), 'w') as t:
+                t.write(src.read())
+            write(join(build_dir, target + '.map'), '{}')
+            return {modname: modpath}, {modname: target}, [modname]
+
+        memoized = self.workspace.memoize('transpile', processor)
+        for modname, path in (('a', source), ('b', removed)):
+            memoized({}, (modname, path, modname + '.js', modname))
+        self.workspace.success()
+        self.workspace.close()
+        self.assertEqual(['a', 'b'], calls)
+        self.assertFalse(self.workspace.locked)
+
+        # the next run.
+        run = workspace.BuildWorkspace(self.root, 'key')
+        self.assertTrue(run.acquire())
+        memoized = run.memoize('transpile', processor)
+        self.assertEqual(({'a': 'a'}, {'a': 'a.js'}, ['a']), memoized(
+            {}, ('a', source, 'a.js', 'a')))
+        self.assertEqual(['a', 'b'], calls)
+        self.assertEqual(1, run.reused)
+
+        write(source, 'var a = 1;')
+        memoized({}, ('a', source, 'a.js', 'a'))
+        self.assertEqual(['a', 'b', 'a'], calls)
+
+        with pretty_logging(stream=StringIO()) as s:
+            self.assertEqual(['b.js'], run.prune(['a.js']))
+        self.assertIn('removed 1 stale targets', s.getvalue())
+        self.assertFalse(exists(join(build_dir, 'b.js')))
+        self.assertFalse(exists(join(build_dir, 'b.js.map')))
+        self.assertTrue(exists(join(build_dir, 'a.js')))
+        run.success()
+        run.close()
+
+        with open(run.manifest_path) as fd:
+            manifest = json.load(fd)
+        self.assertEqual(['a'], [
+            record['entry'][0] for record in manifest['records']])
+
+    def test_memoize_directory(self):
+        self.assertTrue(self.workspace.acquire())
+        build_dir = self.workspace.build_dir
+        source = mkdtemp(self)
+        write(join(source, 'file.txt'), 'data')
+
+        def processor(spec, entry):
+            calls.append(entry[0])
+            sync_directory(entry[1], join(build_dir, entry[2]))
+            return {entry[0]: entry[3]}, {entry[0]: entry[2]}, []
+
+        calls = []
+
+        memoized = self.workspace.memoize('bundle', processor)
+        memoized({}, ('data', source, 'data', 'data'))
+        self.workspace.success()
+        self.workspace.close()
+
+        run = workspace.BuildWorkspace(self.root, 'key')
+        self.assertTrue(run.acquire())
+        memoized = run.memoize('bundle', processor)
+        # unchanged
+        memoized({}, ('data', source, 'data', 'data'))
+        self.assertEqual(1, run.reused)
+        self.assertEqual(['data'], calls)
+        # changed
+        write(join(source, 'new.txt'), 'new')
+        memoized({}, ('data', source, 'data', 'data'))
+        self.assertEqual(['data', 'data'], calls)
+        self.assertTrue(exists(join(build_dir, 'data', 'new.txt')))
+        run.close()
+
+    def test_save_failed_run_retains_previous(self):
+        self.assertTrue(self.workspace.acquire())
+        self.workspace.previous = {('transpile', 'a'): {
+            'process': 'transpile', 'entry': ['a'], 'stamp': [0, 0],
+            'result': [{}, {'a': 'a.js'}, []],
+        }}
+        self.workspace.close()
+        run = workspace.BuildWorkspace(self.root, 'key')
+        run.acquire()
+        self.assertEqual([('transpile', 'a')], list(run.previous))
+        run.release()
+
+    def test_load_invalid_manifest(self):
+        os.makedirs(self.workspace.build_dir)
+        write(self.workspace.manifest_path, '{"version": 0}')
+        self.assertTrue(self.workspace.acquire())
+        self.assertEqual({}, self.workspace.previous)
+        self.workspace.release()
+        write(self.workspace.manifest_path, 'not json')
+        self.assertTrue(self.workspace.acquire())
+        self.assertEqual({}, self.workspace.previous)
+        self.workspace.release()
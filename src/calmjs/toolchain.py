@@ -62,34 +62,44 @@ from __future__ import unicode_literals
 
 import codecs
 import errno
+import hashlib
+import linecache
 import logging
+import pickle
 import re
 import shutil
 import sys
 import warnings
+from collections import deque
 from collections import namedtuple
+from collections import OrderedDict
 from functools import partial
 from inspect import currentframe
-from traceback import format_stack
+from traceback import format_list
 from os import mkdir
 from os import makedirs
 from os.path import basename
 from os.path import join
 from os.path import dirname
 from os.path import exists
+from os.path import getsize
 from os.path import isfile
 from os.path import isdir
+from os.path import islink
 from os.path import normpath
 from os.path import realpath
 from tempfile import mkdtemp
+from timeit import default_timer
 
 from pkg_resources import Requirement
+from pkg_resources import get_distribution
 from pkg_resources import working_set as default_working_set
 
 from calmjs.parse.io import read
 from calmjs.parse.io import write
 from calmjs.parse.parsers.es5 import parse
 from calmjs.parse.unparsers.base import BaseUnparser
+from calmjs.parse.unparsers.es5 import minify_printer
 from calmjs.parse.unparsers.es5 import pretty_printer
 from calmjs.parse.sourcemap import encode_sourcemap
 
@@ -97,7 +107,10 @@ from calmjs.base import BaseDriver
 from calmjs.base import BaseRegistry
 from calmjs.base import BaseLoaderPluginRegistry
 from calmjs.base import PackageKeyMapping
+from calmjs.cache import BuildCache
+from calmjs.cache import fingerprint
 from calmjs.registry import get as get_registry
+from calmjs.trace import tracer
 from calmjs.exc import AdviceAbort
 from calmjs.exc import AdviceCancel
 from calmjs.exc import ValueSkip
@@ -105,7 +118,10 @@ from calmjs.exc import ToolchainAbort
 from calmjs.exc import ToolchainCancel
 from calmjs.utils import raise_os_error
 from calmjs.utils import pdb_set_trace
+from calmjs.utils import sync_directory
 from calmjs.vlqsm import SourceWriter
+from calmjs.workspace import BuildWorkspace
+from calmjs.workspace import workspace_key
 
 logger = logging.getLogger(__name__)
 
@@ -121,6 +137,8 @@ __all__ = [
 
     'toolchain_spec_compile_entries', 'ToolchainSpecCompileEntry',
 
+    'AdviceTrace', 'summarize_advice_trace',
+
     'CALMJS_TOOLCHAIN_ADVICE',
 
     'SETUP', 'CLEANUP', 'SUCCESS',
@@ -129,7 +147,8 @@ __all__ = [
     'AFTER_ASSEMBLE', 'BEFORE_ASSEMBLE', 'AFTER_COMPILE', 'BEFORE_COMPILE',
     'AFTER_PREPARE', 'BEFORE_PREPARE', 'AFTER_TEST', 'BEFORE_TEST',
 
-    'ADVICE_PACKAGES', 'ARTIFACT_PATHS', 'BUILD_DIR',
+    'ADVICE_PACKAGES', 'ADVICE_PROFILE', 'ARTIFACT_PATHS', 'BUILD_DIR',
+    'BUILD_CACHE', 'BUILD_CACHE_DIR', 'BUILD_WORKSPACE',
     'CALMJS_MODULE_REGISTRY_NAMES',
     'CALMJS_LOADERPLUGIN_REGISTRY_NAME',
     'CALMJS_LOADERPLUGIN_REGISTRY',
@@ -139,7 +158,7 @@ __all__ = [
     'EXPORT_TARGET', 'EXPORT_TARGET_OVERWRITE',
     'SOURCE_MODULE_NAMES', 'SOURCE_PACKAGE_NAMES',
     'TEST_MODULE_NAMES', 'TEST_MODULE_PATHS_MAP', 'TEST_PACKAGE_NAMES',
-    'TOOLCHAIN_BIN_PATH',
+    'TOOLCHAIN_BIN_PATH', 'TRANSPILED_SIZES', 'TRANSPILED_SIZES_TOTAL',
     'WORKING_DIR',
 ]
 
@@ -174,11 +193,21 @@ ADVICE_PACKAGES = 'advice_packages'
 # advice packages that have been applied to the spec via advice registry
 # apply_toolchain_spec method.
 ADVICE_PACKAGES_APPLIED_REQUIREMENTS = 'advice_packages_applied_requirements'
+# report the time spent by each advice after the toolchain is executed.
+ADVICE_PROFILE = 'advice_profile'
 # listing of absolute locations on the file system where these bundled
 # artifact files are.
 ARTIFACT_PATHS = 'artifact_paths'
 # build directory
 BUILD_DIR = 'build_dir'
+# the cache root for persistent build workspaces; used for the build
+# directory if one is not specified.
+BUILD_CACHE_DIR = 'build_cache_dir'
+# the calmjs.cache.BuildCache consulted for the outputs of the compile
+# entries before they are processed.
+BUILD_CACHE = 'build_cache'
+# the build workspace in use, if any.
+BUILD_WORKSPACE = 'build_workspace'
 # the key for overriding the advice registry to be use
 CALMJS_TOOLCHAIN_ADVICE_REGISTRY = 'calmjs_toolchain_advice_registry'
 # source registries that have been used
@@ -226,6 +255,11 @@ TEST_MODULE_PATHS_MAP = 'test_module_paths_map'
 TEST_PACKAGE_NAMES = 'test_package_names'
 # the binary that the toolchain encapsulates.
 TOOLCHAIN_BIN_PATH = 'toolchain_bin_path'
+# mapping of the module names to the sizes in bytes of their source and
+# of their transpiled target, for the modules transpiled in the run.
+TRANSPILED_SIZES = 'transpiled_sizes'
+# the total sizes in bytes of the sources and the transpiled targets.
+TRANSPILED_SIZES_TOTAL = 'transpiled_sizes_total'
 # the working directory
 WORKING_DIR = 'working_dir'
 
@@ -238,10 +272,36 @@ def _opener(*a):
     return codecs.open(*a, encoding='utf-8')
 
 
+_dist_versions = {}
+
+
+def _dist_version(project_name):
+    if project_name not in _dist_versions:
+        try:
+            _dist_versions[project_name] = get_distribution(
+                project_name).version
+        except Exception:
+            _dist_versions[project_name] = None
+    return _dist_versions[project_name]
+
+
 def partial_open(*a):
     return partial(codecs.open, *a, encoding='utf-8')
 
 
+def _file_digest(path):
+    """
+    Return the digest of the contents of the file at path, or None if
+    it is not a readable file.
+    """
+
+    try:
+        with open(path, 'rb') as fd:
+            return hashlib.sha1(fd.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
 def _check_key_exists(spec, keys):
     for key in keys:
         if key not in spec:
@@ -259,6 +319,35 @@ def _deprecation_warning(msg):
     logger.warning(msg)
 
 
+def _extract_stack_entries(frame):
+    """
+    Extract the (filename, lineno, name) entries of the stack from the
+    provided frame, outermost first, without reading any source lines
+    or retaining any references to the frames.
+    """
+
+    entries = []
+    while frame is not None:
+        code = frame.f_code
+        entries.append((code.co_filename, frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    entries.reverse()
+    return tuple(entries)
+
+
+def _format_stack_entries(entries):
+    """
+    Format the entries produced by _extract_stack_entries like how the
+    traceback.format_stack function would for the original frames.
+    """
+
+    return ''.join(format_list([
+        (filename, lineno, name,
+            linecache.getline(filename, lineno).strip() or None)
+        for filename, lineno, name in entries
+    ]))
+
+
 def dict_setget(d, key, value):
     value = d[key] = d.get(key, value)
     return value
@@ -285,6 +374,66 @@ def dict_update_overwrite_check(base, fresh):
     return result
 
 
+def _pack_spec_items(items):
+    """
+    Pickle the items of a spec, with registries reduced to their names
+    and the values that cannot be pickled dropped.
+    """
+
+    data = {}
+    registries = {}
+    dropped = []
+    for key, value in items:
+        if isinstance(value, BaseRegistry):
+            registries[key] = value.registry_name
+            continue
+        try:
+            data[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            dropped.append(key)
+    if dropped:
+        logger.debug(
+            "spec keys %r dropped from snapshot as their values cannot be "
+            "pickled", sorted(dropped))
+    return pickle.dumps((data, registries), pickle.HIGHEST_PROTOCOL)
+
+
+def _unpack_spec_items(blob):
+    data, registries = pickle.loads(blob)
+    result = {key: pickle.loads(value) for key, value in data.items()}
+    for key, name in registries.items():
+        registry = get_registry(name)
+        if registry is None:
+            logger.warning(
+                "spec key '%s' not restored as registry '%s' is unavailable",
+                key, name)
+            continue
+        result[key] = registry
+    return result
+
+
+# marks a value in the updates of a spec that replaces the current one,
+# for lists that were changed other than by appending to them.
+_SpecReplace = namedtuple('_SpecReplace', ['value'])
+
+
+def _spec_value_delta(base, value):
+    """
+    Reduce the value to the part that was added since base, for dicts
+    (the new or changed items) and for lists (the appended items); a
+    list that was otherwise changed will be marked as a replacement.
+    """
+
+    if isinstance(base, dict) and isinstance(value, dict):
+        return {k: v for k, v in value.items() if k not in base or (
+            base[k] is not v and base[k] != v)}
+    if isinstance(base, list) and isinstance(value, list):
+        if value[:len(base)] == base:
+            return value[len(base):]
+        return _SpecReplace(value)
+    return value
+
+
 def log_exc_reason(
         etype, value, tb,
         msg="{etype} raised at {filename}:{lineno}; reason: {value}",
@@ -546,6 +695,24 @@ def toolchain_spec_compile_entries(
     """
 
     processor = getattr(toolchain, 'compile_%s_entry' % process_name)
+    preparer = getattr(
+        toolchain, 'prepare_compile_%s_entries' % process_name, None)
+    if callable(preparer):
+        entries = list(entries)
+        preparer(spec, entries)
+    reused = getattr(
+        toolchain, 'reuse_compile_%s_entry' % process_name, None)
+    build_cache = spec.get(BUILD_CACHE)
+    if build_cache is not None and process_name in getattr(
+            toolchain, 'cacheable_compile_processes', ()):
+        processor = build_cache.memoize(
+            cls_to_name(type(toolchain)), process_name, processor,
+            config=toolchain.config_digest(), reused=reused)
+    workspace = spec.get(BUILD_WORKSPACE)
+    if workspace is not None and process_name in getattr(
+            toolchain, 'reusable_compile_processes', ()):
+        processor = workspace.memoize(
+            process_name, processor, reused=reused)
     modpath_logger = (
         partial(overwrite_log, toolchain.modpath_suffix)
         if callable(overwrite_log) else None)
@@ -578,7 +745,9 @@ def process_compile_entries(
             base.update(fresh)
 
     for entry in entries:
-        modpaths, targetpaths, export_module_names = processor(spec, entry)
+        with tracer.span(entry[0], 'compile', source=entry[1]):
+            modpaths, targetpaths, export_module_names = processor(
+                spec, entry)
         update(all_modpaths, modpaths, modpath_logger)
         update(all_targets, targetpaths, targetpath_logger)
         all_export_module_names.extend(export_module_names)
@@ -590,6 +759,57 @@ ToolchainSpecCompileEntry = namedtuple('ToolchainSpecCompileEntry', [
     'process_name', 'read_key', 'store_key', 'logger', 'log_level'])
 ToolchainSpecCompileEntry.__new__.__defaults__ = (None, None)
 
+# the trace of an advice invoked through Spec.handle; the outcome is one
+# of 'ok', 'cancel', 'abort' or 'error'.
+AdviceTrace = namedtuple('AdviceTrace', [
+    'group', 'name', 'duration', 'outcome'])
+
+
+def _advice_name(advice):
+    if isinstance(advice, partial):
+        return _advice_name(advice.func)
+    name = getattr(
+        advice, '__qualname__', getattr(advice, '__name__', None))
+    if name is None:
+        return repr(advice)
+    module = getattr(advice, '__module__', None)
+    return '%s:%s' % (module, name) if module else name
+
+
+def summarize_advice_trace(trace):
+    """
+    Summarize the provided advice trace into a list of tuples of the
+    group, the advice name, the number of calls, the total and the
+    maximum duration, along with the outcomes, with the most expensive
+    advices listed first.
+    """
+
+    summary = OrderedDict()
+    for entry in trace:
+        _aggregate_advice_trace(summary, entry)
+    return _summarize_advice_aggregates(summary)
+
+
+def _aggregate_advice_trace(summary, entry):
+    # fold the entry into the summary, keyed by the group and the name
+    # of the advice, with the count, the total and maximum durations
+    # along with the outcomes.
+    key = (entry.group, entry.name)
+    count, total, longest, outcomes = summary.get(key, (0, 0.0, 0.0, ()))
+    summary[key] = (
+        count + 1, total + entry.duration, max(longest, entry.duration),
+        outcomes if entry.outcome in outcomes else (
+            outcomes + (entry.outcome,)),
+    )
+
+
+def _summarize_advice_aggregates(summary):
+    return sorted((
+        (group, name, count, total, longest, outcomes)
+        for (group, name), (count, total, longest, outcomes) in
+        summary.items()
+    ), key=lambda row: -row[3])
+
 
 def debugger(spec, extras):
     if not spec.get(DEBUG):
@@ -612,12 +832,19 @@ class Spec(dict):
     instance.
     """
 
-    def __init__(self, *a, **kw):
-        self._deprecation_match_4_0 = [(re.compile(p), r) for p, r in (
-            ('^((?!generate)(.*))_source_map$', '\\1_sourcepath'),
-            ('_targets$', '_targetpaths'),
-        )]
+    _deprecation_match_4_0 = tuple((re.compile(p), r) for p, r in (
+        ('^((?!generate)(.*))_source_map$', '\\1_sourcepath'),
+        ('_targets$', '_targetpaths'),
+    ))
+    # memoized results of the deprecated key processing, as the keys
+    # in use are typically from a small set of constants.
+    _deprecated_keys = {}
+    _deprecated_keys_limit = 1024
+    # the number of the most recent advice trace entries retained; the
+    # aggregates for advice_summary are kept for all of them.
+    advice_trace_limit = 1024
 
+    def __init__(self, *a, **kw):
         clean_kw = {
             self.__process_deprecated_key(k): v for k, v in kw.items()}
 
@@ -625,15 +852,30 @@ class Spec(dict):
         self._advices = {}
         self._frames = {}
         self._called = set()
+        self._advice_trace = deque(maxlen=self.advice_trace_limit)
+        self._advice_summary = OrderedDict()
 
-    def __process_deprecated_key(self, key):
+    def __remap_deprecated_key(self, key):
         for patt, repl in self._deprecation_match_4_0:
             if patt.search(key):
-                break
-        else:
+                return patt.sub(repl, key)
+        return key
+
+    def __process_deprecated_key(self, key):
+        try:
+            new_key = self._deprecated_keys[key]
+        except KeyError:
+            new_key = self.__remap_deprecated_key(key)
+            if len(self._deprecated_keys) >= self._deprecated_keys_limit:
+                self._deprecated_keys.clear()
+            self._deprecated_keys[key] = new_key
+        except TypeError:
+            # unhashable keys will fail the dict lookup anyway.
+            return key
+
+        if new_key == key:
             return key
 
-        new_key = patt.sub(repl, key)
         _deprecation_warning(
             "Spec key '%s' has been remapped to '%s' in calmjs-3.0.0; this "
             "automatic remap will be removed by calmjs-4.0.0" % (key, new_key)
@@ -666,6 +908,25 @@ class Spec(dict):
         # logs without debugging enabled).
         return dict.__repr__(self)
 
+    @property
+    def advice_trace(self):
+        """
+        The trace of the advices invoked through the handle method thus
+        far, as a list of AdviceTrace entries in the order of execution,
+        limited to the most recent advice_trace_limit entries.
+        """
+
+        return list(self._advice_trace)
+
+    @property
+    def advice_summary(self):
+        """
+        The summary of all advices invoked through the handle method
+        thus far, in the format produced by summarize_advice_trace.
+        """
+
+        return _summarize_advice_aggregates(self._advice_summary)
+
     def update_selected(self, other, selected):
         """
         Like update, however a list of selected keys must be provided.
@@ -673,6 +934,77 @@ class Spec(dict):
 
         self.update({k: other[k] for k in selected})
 
+    def snapshot(self):
+        """
+        Return a snapshot of the data keys of this spec as a bytes
+        object, such that a copy of this spec may be created through
+        the restore class method, typically in a separate process.
+
+        Registry instances are recorded by their name and resolved
+        through calmjs.registry.get upon restoration.  Values that
+        cannot be pickled (such as callables bound to the toolchain)
+        are dropped, and so are the advices and any other internal
+        states of the spec.
+        """
+
+        return _pack_spec_items(self.items())
+
+    @classmethod
+    def restore(cls, snapshot):
+        """
+        Return a new spec from the snapshot produced by snapshot.
+        """
+
+        return cls(_unpack_spec_items(snapshot))
+
+    def snapshot_updates(self, snapshot):
+        """
+        Return the updates made to this spec since the snapshot it was
+        restored from, as a bytes object for the merge_updates method
+        of the originating spec.
+
+        For values that are dicts only the new or changed items are
+        included, and for lists only the appended items, unless the
+        existing items were changed, where the list will replace the
+        original.  Removed keys are not tracked.
+        """
+
+        base = _unpack_spec_items(snapshot)
+        return _pack_spec_items(
+            (key, _spec_value_delta(base.get(key), value))
+            for key, value in self.items()
+            if key not in base or (
+                base[key] is not value and base[key] != value)
+        )
+
+    def merge_updates(self, updates):
+        """
+        Merge the updates produced by snapshot_updates from the workers
+        into this spec, in the order provided.  Dicts are updated and
+        lists are extended (unless the worker changed the existing items
+        of the list), with every other value replaced.
+
+        The result only depends on the order of the updates, so they
+        should be provided in the order of the submission of the work
+        (as returned by map) and not in the order of completion.
+        """
+
+        for blob in updates:
+            for key, value in sorted(_unpack_spec_items(blob).items()):
+                current = self.get(key)
+                if isinstance(value, _SpecReplace):
+                    self[key] = value.value
+                elif isinstance(current, dict) and isinstance(value, dict):
+                    for name, old, new in dict_update_overwrite_check(
+                            current, value):
+                        logger.debug(
+                            "merging spec key '%s' replaced '%s' with %r "
+                            "(was %r)", key, name, new, old)
+                elif isinstance(current, list) and isinstance(value, list):
+                    current.extend(value)
+                else:
+                    self[key] = value
+
     def __advice_stack_frame_protection(self, frame):
         """
         Overriding of this is only permitted if and only if your name is
@@ -728,9 +1060,10 @@ class Spec(dict):
                 )
                 if debug > 1:
                     # use the memory address of the tuple which should
-                    # be stable
-                    self._frames[id(advice)] = ''.join(
-                        format_stack(frame.f_back))
+                    # be stable; only the cheap stack entries are kept
+                    # as they are only formatted on failure.
+                    self._frames[id(advice)] = _extract_stack_entries(
+                        frame.f_back)
 
         self._advices[name] = self._advices.get(name, [])
         self._advices[name].append(advice)
@@ -792,73 +1125,95 @@ class Spec(dict):
             logger.debug(
                 "handling %d advices in group '%s' ", len(advices), name)
 
-        while advices:
-            try:
-                # advice processing is done lifo (last in first out)
-                values = advices.pop()
-                advice, a, kw = values
-                if not ((callable(advice)) and
-                        isinstance(a, tuple) and
-                        isinstance(kw, dict)):
-                    raise TypeError
-            except ValueError:
-                logger.info('Spec advice extraction error: got %s', values)
-            except TypeError:
-                logger.info('Spec advice malformed: got %s', values)
-            else:
+        with tracer.span(name, 'advice_group', advices=len(advices)):
+            while advices:
                 try:
+                    # advice processing is done lifo (last in first out)
+                    values = advices.pop()
+                    advice, a, kw = values
+                    if not ((callable(advice)) and
+                            isinstance(a, tuple) and
+                            isinstance(kw, dict)):
+                        raise TypeError
+                except ValueError:
+                    logger.info('Spec advice extraction error: got %s', values)
+                except TypeError:
+                    logger.info('Spec advice malformed: got %s', values)
+                else:
+                    outcome = 'ok'
+                    started = default_timer()
                     try:
-                        advice(*a, **kw)
-                    except Exception as e:
-                        # get that back by the id.
-                        frame = self._frames.get(id(values))
-                        if frame:
-                            logger.info('Spec advice exception: %r', e)
-                            logger.info(
-                                'Traceback for original advice:\n%s', frame)
-                        # continue on for the normal exception
-                        raise
-                except AdviceCancel as e:
-                    logger.info(
-                        "advice %s in group '%s' signaled its cancellation "
-                        "during its execution: %s", advice, name, e
-                    )
-                    if self.get(DEBUG):
-                        logger.debug(
-                            'showing traceback for cancellation', exc_info=1,
+                        try:
+                            advice(*a, **kw)
+                        except Exception as e:
+                            # get that back by the id.
+                            frame = self._frames.get(id(values))
+                            if frame:
+                                logger.info('Spec advice exception: %r', e)
+                                logger.info(
+                                    'Traceback for original advice:\n%s',
+                                    _format_stack_entries(frame))
+                            # continue on for the normal exception
+                            raise
+                    except AdviceCancel as e:
+                        outcome = 'cancel'
+                        logger.info(
+                            "advice %s in group '%s' signaled its "
+                            "cancellation during its execution: %s",
+                            advice, name, e
                         )
-                except AdviceAbort as e:
-                    # this is a signaled error with a planned abortion
-                    logger.warning(
-                        "advice %s in group '%s' encountered a known error "
-                        "during its execution: %s; continuing with toolchain "
-                        "execution", advice, name, e
-                    )
-                    if self.get(DEBUG):
+                        if self.get(DEBUG):
+                            logger.debug(
+                                'showing traceback for cancellation',
+                                exc_info=1,
+                            )
+                    except AdviceAbort as e:
+                        # this is a signaled error with a planned abortion
+                        outcome = 'abort'
                         logger.warning(
-                            'showing traceback for error', exc_info=1,
+                            "advice %s in group '%s' encountered a known "
+                            "error during its execution: %s; continuing with "
+                            "toolchain execution", advice, name, e
                         )
-                except ToolchainCancel:
-                    # this is the safe cancel
-                    raise
-                except ToolchainAbort as e:
-                    logger.critical(
-                        "an advice in group '%s' triggered an abort: %s",
-                        name, str(e)
-                    )
-                    raise
-                except KeyboardInterrupt:
-                    raise ToolchainCancel('interrupted')
-                except Exception as e:
-                    # a completely unplanned failure
-                    logger.critical(
-                        "advice %s in group '%s' terminated due to an "
-                        "unexpected exception: %s", advice, name, e
-                    )
-                    if self.get(DEBUG):
+                        if self.get(DEBUG):
+                            logger.warning(
+                                'showing traceback for error', exc_info=1,
+                            )
+                    except ToolchainCancel:
+                        # this is the safe cancel
+                        outcome = 'cancel'
+                        raise
+                    except ToolchainAbort as e:
+                        outcome = 'abort'
                         logger.critical(
-                            'showing traceback for error', exc_info=1,
+                            "an advice in group '%s' triggered an abort: %s",
+                            name, str(e)
                         )
+                        raise
+                    except KeyboardInterrupt:
+                        outcome = 'cancel'
+                        raise ToolchainCancel('interrupted')
+                    except Exception as e:
+                        # a completely unplanned failure
+                        outcome = 'error'
+                        logger.critical(
+                            "advice %s in group '%s' terminated due to an "
+                            "unexpected exception: %s", advice, name, e
+                        )
+                        if self.get(DEBUG):
+                            logger.critical(
+                                'showing traceback for error', exc_info=1,
+                            )
+                    finally:
+                        trace = AdviceTrace(
+                            name, _advice_name(advice),
+                            default_timer() - started, outcome,
+                        )
+                        self._advice_trace.append(trace)
+                        _aggregate_advice_trace(self._advice_summary, trace)
+                        tracer.complete(
+                            trace.name, 'advice', started, trace.duration,
+                            group=name, outcome=outcome)
 
 
 class AdviceRegistry(BaseRegistry):
@@ -1203,6 +1558,24 @@ class Toolchain(BaseDriver):
     # subclasses may assign an identifier or instance of a compatible
     # loaderplugin registry for use with the encapsulated framework.
     loaderplugin_registry = None
+    # the compile processes that only depend on their source, such that
+    # their results may be reused from a persistent build workspace if
+    # the source is unchanged.
+    reusable_compile_processes = ('transpile', 'bundle')
+    # the compile processes where the outputs for the entries may be
+    # retrieved from the build cache, if one is available; the outputs
+    # must only be the targets and their source maps.
+    cacheable_compile_processes = ('transpile',)
+    # the names of the attributes that affect the outputs, for the
+    # config_digest that keys the build cache and the build workspace.
+    cache_config_attributes = (
+        'filename_suffix', 'sourcepath_suffix', 'modpath_suffix',
+        'targetpath_suffix',
+    )
+    # also compare the contents of the files when synchronizing bundled
+    # directories into the build directory, instead of only the size
+    # and modification time.
+    bundle_sync_checksum = False
 
     def __init__(self, *a, **kw):
         """
@@ -1242,6 +1615,25 @@ class Toolchain(BaseDriver):
             )
         return check
 
+    def config_digest(self):
+        """
+        Return the digest of the configuration of this toolchain that
+        may affect the outputs, which are the attributes named by
+        cache_config_attributes, along with the version of calmjs.parse
+        which provides the parser and the unparsers.  Attributes specific
+        to the host (e.g. the working_dir or the paths to the binaries)
+        must not be included, such that the build cache may be shared.
+        """
+
+        return fingerprint(
+            cls_to_name(type(self)),
+            [
+                (name, getattr(self, name, None))
+                for name in self.cache_config_attributes
+            ],
+            _dist_version('calmjs.parse'),
+        )
+
     # Setup related methods
 
     def setup_filename_suffix(self):
@@ -1358,13 +1750,77 @@ class Toolchain(BaseDriver):
 
     # Following are used for the transpile and bundle compile processes.
 
+    def _reset_build_target_cache(self, build_dir=None):
+        # the directories created and validated for the build_dir.
+        self._build_target_cache = (build_dir, set(), set())
+
+    def _get_build_target_cache(self, spec):
+        build_dir = spec[BUILD_DIR]
+        cache = getattr(self, '_build_target_cache', None)
+        if cache is None or cache[0] != build_dir:
+            self._reset_build_target_cache(build_dir)
+        return self._build_target_cache
+
     def _validate_build_target(self, spec, target):
         """
         Essentially validate that the target is inside the build_dir.
         """
 
-        if not realpath(target).startswith(spec[BUILD_DIR]):
+        build_dir, created, validated = self._get_build_target_cache(spec)
+        target_dir = dirname(target)
+        # the realpath of a target inside a validated directory can only
+        # lead outside of the build_dir if the target is a link.
+        if target_dir in validated and not islink(target):
+            return
+        if not realpath(target).startswith(build_dir):
             raise ValueError('build_target %s is outside build_dir' % target)
+        validated.add(target_dir)
+
+    def _make_build_target_dir(self, spec, target):
+        """
+        Ensure the directory for the target exists; directories that
+        were created or found to exist are remembered for the run.
+        """
+
+        build_dir, created, validated = self._get_build_target_cache(spec)
+        target_dir = dirname(target)
+        if target_dir in created:
+            return
+        if not exists(target_dir):
+            logger.debug("creating dir '%s'", target_dir)
+            makedirs(target_dir)
+        created.add(target_dir)
+
+    def prepare_build_targets(self, spec, entries):
+        """
+        Create all the directories required by the targets of the
+        entries in one pass, validating that they are inside build_dir,
+        such that the compile process for each of the entries will not
+        have to repeat this.  Directories that are outside the build_dir
+        are left for the validation done for each entry.
+        """
+
+        if not spec.get(BUILD_DIR):
+            return
+        build_dir, created, validated = self._get_build_target_cache(spec)
+        target_dirs = {
+            dirname(join(build_dir, normpath(entry[2])))
+            for entry in entries
+        } - created
+        for target_dir in sorted(target_dirs):
+            if not realpath(target_dir).startswith(build_dir):
+                continue
+            validated.add(target_dir)
+            if not exists(target_dir):
+                logger.debug("creating dir '%s'", target_dir)
+                makedirs(target_dir)
+            created.add(target_dir)
+
+    def prepare_compile_transpile_entries(self, spec, entries):
+        self.prepare_build_targets(spec, entries)
+
+    def prepare_compile_bundle_entries(self, spec, entries):
+        self.prepare_build_targets(spec, entries)
 
     # note that in the following methods, a shorthand notation is used
     # for some of the arguments: nearly all occurrences of source means
@@ -1374,10 +1830,7 @@ class Toolchain(BaseDriver):
         # ensure that the target is fully normalized.
         bd_target = join(spec[BUILD_DIR], normpath(target))
         self._validate_build_target(spec, bd_target)
-        if not exists(dirname(bd_target)):
-            logger.debug("creating dir '%s'", dirname(bd_target))
-            makedirs(dirname(bd_target))
-
+        self._make_build_target_dir(spec, bd_target)
         return bd_target
 
     def transpile_modname_source_target(self, spec, modname, source, target):
@@ -1417,6 +1870,27 @@ class Toolchain(BaseDriver):
         )
         write(self.transpiler, [
             read(self.parser, reader)], writer_main, writer_map)
+        self.record_transpiled_size(spec, modname, source, bd_target)
+
+    def record_transpiled_size(self, spec, modname, source, target):
+        """
+        Record the sizes of the source and the transpiled target for
+        the modname, along with the updated totals.
+        """
+
+        sizes = (getsize(source), getsize(target))
+        transpiled_sizes = dict_setget_dict(spec, TRANSPILED_SIZES)
+        # a module may be transpiled again in the same run.
+        previous = transpiled_sizes.get(modname, (0, 0))
+        transpiled_sizes[modname] = sizes
+        total = spec.get(TRANSPILED_SIZES_TOTAL, (0, 0))
+        spec[TRANSPILED_SIZES_TOTAL] = (
+            total[0] + sizes[0] - previous[0],
+            total[1] + sizes[1] - previous[1],
+        )
+        logger.debug(
+            "transpiled '%s' from %d bytes to %d bytes",
+            modname, sizes[0], sizes[1])
 
     def simple_transpile_modname_source_target(
             self, spec, modname, source, target):
@@ -1460,11 +1934,27 @@ class Toolchain(BaseDriver):
         self.transpile_modname_source_target(spec, modname, source, target)
         return transpiled_modpath, transpiled_target, export_module_name
 
+    def reuse_compile_transpile_entry(self, spec, entry, result):
+        """
+        Invoked for a transpile entry with the outputs reused from the
+        build workspace or the build cache instead of being transpiled
+        again, such that the transpiled sizes are recorded as if it was
+        transpiled.
+        """
+
+        modname, source, target, modpath = entry
+        if isinstance(self.transpiler, BaseUnparser):
+            self.record_transpiled_size(
+                spec, modname, source, join(spec[BUILD_DIR], normpath(target)))
+
     def compile_bundle_entry(self, spec, entry):
         """
         Handler for each entry for the bundle method of the compile
         process.  This copies the source file or directory into the
-        build directory.
+        build directory; directories are synchronized, such that only
+        the new or changed files are copied into an existing directory
+        from a previous build, with the files removed from the source
+        also removed.
         """
 
         modname, source, target, modpath = entry
@@ -1474,12 +1964,17 @@ class Toolchain(BaseDriver):
         if isfile(source):
             export_module_name.append(modname)
             copy_target = join(spec[BUILD_DIR], target)
-            if not exists(dirname(copy_target)):
-                makedirs(dirname(copy_target))
+            self._make_build_target_dir(spec, copy_target)
             shutil.copy(source, copy_target)
         elif isdir(source):
             copy_target = join(spec[BUILD_DIR], modname)
-            shutil.copytree(source, copy_target)
+            result = sync_directory(
+                source, copy_target, checksum=self.bundle_sync_checksum)
+            logger.debug(
+                "synchronized '%s' to '%s': %d files copied (%d bytes), "
+                "%d deleted, %d unchanged", source, copy_target,
+                result.copied, result.bytes, result.deleted, result.unchanged,
+            )
 
         return bundled_modpath, bundled_target, export_module_name
 
@@ -1699,6 +2194,8 @@ class Toolchain(BaseDriver):
         simple copying.
         """
 
+        # directories may have been changed since any previous run.
+        self._reset_build_target_cache()
         spec[EXPORT_MODULE_NAMES] = export_module_names = spec.get(
             EXPORT_MODULE_NAMES, [])
         if not isinstance(export_module_names, list):
@@ -1721,8 +2218,11 @@ class Toolchain(BaseDriver):
             sourcepath_dict = spec.get(spec_read_key, {})
             entries = self._gen_modname_source_target_modpath(
                 spec, sourcepath_dict)
-            (spec[spec_modpath_key], spec[spec_target_key],
-                new_module_names) = method(spec, entries)
+            with tracer.span(
+                    read_key, 'compile_entry', store_key=store_key,
+                    sources=len(sourcepath_dict)):
+                (spec[spec_modpath_key], spec[spec_target_key],
+                    new_module_names) = method(spec, entries)
             logger.debug(
                 "entry %r "
                 "wrote %d entries to spec[%r], "
@@ -1735,6 +2235,17 @@ class Toolchain(BaseDriver):
             )
             export_module_names.extend(new_module_names)
 
+        for entry, method, read_key, store_key in (
+                self._iter_compile_entries_methods()):
+            compile_entry(method, read_key, store_key)
+
+    def _iter_compile_entries_methods(self):
+        """
+        Private generator that resolves the compile_entries into a
+        4-tuple of the entry, the method to be invoked with the spec
+        and the generated entries, the read key and the store key.
+        """
+
         for entry in self.compile_entries:
             if isinstance(entry, ToolchainSpecCompileEntry):
                 log = partial(
@@ -1745,11 +2256,11 @@ class Toolchain(BaseDriver):
                         "'%s' to '%s'; configuration may now be invalid"
                     ),
                 ) if entry.logger else None
-                compile_entry(partial(
+                yield entry, partial(
                     toolchain_spec_compile_entries, self,
                     process_name=entry.process_name,
                     overwrite_log=log,
-                ), entry.read_key, entry.store_key)
+                ), entry.read_key, entry.store_key
                 continue
 
             m, read_key, store_key = entry
@@ -1764,7 +2275,95 @@ class Toolchain(BaseDriver):
                     )
                     continue
 
-            compile_entry(method, read_key, store_key)
+            yield entry, method, read_key, store_key
+
+    def recompile(self, spec, sourcepaths):
+        """
+        Compile again only the entries from the sourcepath maps in the
+        spec that have their sourcepath listed in sourcepaths, with the
+        resulting modpaths, targetpaths and export_module_names merged
+        into the existing values in the spec.  This requires that the
+        compile step has been done on the spec, and that the build_dir
+        is still available.
+
+        Returns the list of targetpaths that have changed as a result.
+        """
+
+        self._reset_build_target_cache()
+        sourcepaths = set(sourcepaths)
+        build_dir = spec[BUILD_DIR]
+        export_module_names = dict_setget(spec, EXPORT_MODULE_NAMES, [])
+        changed = []
+
+        for entry, method, read_key, store_key in (
+                self._iter_compile_entries_methods()):
+            sourcepath_dict = spec.get(read_key + self.sourcepath_suffix, {})
+            selected = {
+                modname: source
+                for modname, source in sourcepath_dict.items()
+                if source in sourcepaths
+            }
+            if not selected:
+                continue
+
+            entries = list(self._gen_modname_source_target_modpath(
+                spec, selected))
+            digests = [
+                (target, _file_digest(join(build_dir, target)))
+                for modname, source, target, modpath in entries
+            ]
+            with tracer.span(
+                    read_key, 'compile_entry', store_key=store_key,
+                    sources=len(selected)):
+                modpaths, targetpaths, new_module_names = method(
+                    spec, entries)
+            dict_setget_dict(spec, store_key + self.modpath_suffix).update(
+                modpaths)
+            dict_setget_dict(spec, store_key + self.targetpath_suffix).update(
+                targetpaths)
+            export_module_names.extend(
+                name for name in new_module_names
+                if name not in export_module_names
+            )
+            changed.extend(
+                target for target, digest in digests
+                if digest is None or digest != _file_digest(
+                    join(build_dir, target))
+            )
+
+        return changed
+
+    def rebuild(self, spec, sourcepaths):
+        """
+        Incrementally rebuild the spec after the files at sourcepaths
+        have been changed.  Only the affected compile entries will be
+        compiled again, and the assemble, link and finalize steps will
+        only be done if any of their outputs have actually changed.
+
+        The advices for the before and after groups of the assemble, link
+        and finalize steps are invoked again along with those steps, as
+        they may modify the outputs as they did for the original build;
+        the other advices, including those for the compile step, have
+        been handled as part of the original build and are not invoked.
+
+        Returns the list of targetpaths that have changed.
+        """
+
+        with tracer.span('recompile', 'toolchain'):
+            changed = self.recompile(spec, sourcepaths)
+        if not changed:
+            logger.info('compiled outputs unchanged; skipping assemble, link')
+            return changed
+
+        logger.info('%d compiled outputs changed; relinking', len(changed))
+        for p in ('assemble', 'link', 'finalize'):
+            # handling these groups again is expected for a rebuild.
+            spec._called.difference_update(('before_' + p, 'after_' + p))
+            spec.handle('before_' + p)
+            with tracer.span(p, 'toolchain'):
+                getattr(self, p)(spec)
+            spec.handle('after_' + p)
+        return changed
 
     def assemble(self, spec):
         """
@@ -1834,6 +2433,63 @@ class Toolchain(BaseDriver):
         )
         advice_registry.apply_toolchain_spec(self, spec)
 
+    def build_workspace_key(self, spec):
+        """
+        Return the parts that identify the build workspace for the spec.
+        """
+
+        export_target = spec.get(EXPORT_TARGET)
+        return [
+            cls_to_name(type(self)),
+            realpath(export_target) if export_target else None,
+            sorted(spec.get(SOURCE_PACKAGE_NAMES) or []),
+            self.config_digest(),
+            bool(spec.get(GENERATE_SOURCE_MAP)),
+        ]
+
+    def prune_build_workspace(self, spec):
+        """
+        Remove the outputs left in the build workspace by the previous
+        build that are no longer in any of the targetpath maps.
+        """
+
+        suffix = self.targetpath_suffix
+        spec[BUILD_WORKSPACE].prune([
+            target
+            for key, value in spec.items()
+            if key.endswith(suffix) and isinstance(value, dict)
+            for target in value.values()
+        ])
+
+    def setup_build_workspace(self, spec, hold=False):
+        """
+        Set up the persistent build workspace inside the cache root
+        specified by BUILD_CACHE_DIR as the build directory.  If the
+        workspace is locked by another build, nothing is done.
+
+        The workspace is closed (releasing the lock) at CLEANUP, unless
+        hold is True, in which case the caller must close the returned
+        workspace once it is done with it.
+        """
+
+        parts = self.build_workspace_key(spec)
+        workspace = BuildWorkspace(
+            spec[BUILD_CACHE_DIR], workspace_key(*parts), description=parts)
+        if not workspace.acquire():
+            logger.warning(
+                "build workspace '%s' is in use by another build; using a "
+                "temporary build directory instead", workspace.path,
+            )
+            return None
+
+        spec[BUILD_WORKSPACE] = workspace
+        spec[BUILD_DIR] = workspace.build_dir
+        spec.advise(AFTER_COMPILE, self.prune_build_workspace, spec)
+        spec.advise(SUCCESS, workspace.success)
+        if not hold:
+            spec.advise(CLEANUP, workspace.close)
+        return workspace
+
     def calf(self, spec):
         """
         Typical safe usage is this, which sets everything that could be
@@ -1851,7 +2507,15 @@ class Toolchain(BaseDriver):
         # BEFORE_SETUP and have the following ensure step be part of the
         # default setup.
 
+        if BUILD_CACHE not in spec:
+            build_cache = BuildCache.from_environ()
+            if build_cache is not None:
+                spec[BUILD_CACHE] = build_cache
+
         # ensure build directory is defined and sane.
+        if not spec.get(BUILD_DIR) and spec.get(BUILD_CACHE_DIR):
+            self.setup_build_workspace(spec)
+
         if not spec.get(BUILD_DIR):
             tempdir = realpath(mkdtemp())
             spec.advise(CLEANUP, shutil.rmtree, tempdir)
@@ -1883,7 +2547,8 @@ class Toolchain(BaseDriver):
             process = ('prepare', 'compile', 'assemble', 'link', 'finalize')
             for p in process:
                 spec.handle('before_' + p)
-                getattr(self, p)(spec)
+                with tracer.span(p, 'toolchain'):
+                    getattr(self, p)(spec)
                 spec.handle('after_' + p)
             spec.handle(SUCCESS)
         except ToolchainCancel:
@@ -1901,7 +2566,8 @@ class Toolchain(BaseDriver):
         Alias, also make this callable directly.
         """
 
-        self.calf(spec)
+        with tracer.span(cls_to_name(type(self)), 'toolchain'):
+            self.calf(spec)
 
 
 class NullToolchain(Toolchain):
@@ -1958,3 +2624,33 @@ class ES5Toolchain(Toolchain):
     def setup_transpiler(self):
         self.transpiler = pretty_printer()
         self.parser = parse
+
+
+class ES5MinifyToolchain(ES5Toolchain):
+    """
+    The ES5 toolchain, using the minify printer such that the modules
+    are minified as they are transpiled, without any separate pass.
+
+    Accepts the obfuscate keyword argument, which if true will also
+    shorten the identifiers nested within the scopes of every module.
+    """
+
+    cache_config_attributes = (
+        ES5Toolchain.cache_config_attributes + ('obfuscate',))
+
+    def __init__(self, *a, **kw):
+        self.obfuscate = kw.pop('obfuscate', False)
+        super(ES5MinifyToolchain, self).__init__(*a, **kw)
+
+    def setup_transpiler(self):
+        self.transpiler = minify_printer(obfuscate=self.obfuscate)
+        self.parser = parse
+
+    def compile(self, spec):
+        super(ES5MinifyToolchain, self).compile(spec)
+        source_size, target_size = spec.get(TRANSPILED_SIZES_TOTAL, (0, 0))
+        if source_size:
+            logger.info(
+                "minified %d modules from %d bytes to %d bytes (%.1f%%)",
+                len(spec.get(TRANSPILED_SIZES, {})), source_size,
+                target_size, 100.0 * target_size / source_size)
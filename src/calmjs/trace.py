@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Tracing of the execution of calmjs.
+
+Provides a tracer that records the spans of the various steps done by
+calmjs (e.g. construction of registries, toolchain phases, advices,
+compile entries and driver subprocesses), which are then written out
+as a JSON file in the Chrome trace event format, which may be loaded
+into ``chrome://tracing`` or Perfetto for a timeline of the run.
+
+Tracing is enabled by the global ``--trace`` option of the calmjs
+runtime, or by setting the ``CALMJS_TRACE`` environment variable to
+the path of the file to be written.  When tracing is not enabled, all
+the tracing calls are no-ops.
+"""
+
+from __future__ import absolute_import
+
+import json
+import os
+import threading
+from logging import getLogger
+from timeit import default_timer
+
+logger = getLogger(__name__)
+
+CALMJS_TRACE = 'CALMJS_TRACE'
+_json_scalars = (bool, int, float, type(u''), str, type(None))
+
+
+def _thread_id():
+    return threading.current_thread().ident
+
+
+class _NullSpan(object):
+    """
+    The span returned while tracing is disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span(object):
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'started')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.complete(
+            self.name, self.category, self.started,
+            default_timer() - self.started, **self.args)
+        return False
+
+
+class Tracer(object):
+    """
+    Collects trace events for a single run.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.events = []
+        self.origin = 0.0
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def start(self, path=None):
+        """
+        Start tracing, with the events to be written to the provided
+        path, or the path specified by the CALMJS_TRACE environment
+        variable if no path is provided.
+
+        Return True if tracing was started by this call, False if no
+        path was available or tracing was already started, such that
+        only the caller that started the tracing will stop it.
+        """
+
+        if self.enabled:
+            return False
+        path = path or os.environ.get(CALMJS_TRACE)
+        if not path:
+            return False
+        self.path = path
+        self.events = []
+        self.origin = default_timer()
+        self.pid = os.getpid()
+        self.enabled = True
+        logger.debug("tracing enabled; trace will be written to '%s'", path)
+        return True
+
+    def stop(self):
+        """
+        Stop tracing and write out the collected events.
+        """
+
+        if not self.enabled:
+            return
+        self.enabled = False
+        try:
+            with open(self.path, 'w') as fd:
+                self.dump(fd)
+        except (IOError, OSError) as e:
+            logger.error("failed to write trace to '%s': %s", self.path, e)
+        else:
+            logger.info(
+                "wrote %d trace events to '%s'", len(self.events), self.path)
+
+    def span(self, name, category='calmjs', **args):
+        """
+        Return a context manager that will record the duration of the
+        block it manages as an event.
+        """
+
+        if not self.enabled:
+            return _null_span
+        return _Span(self, name, category, args)
+
+    def complete(self, name, category, started, duration, **args):
+        """
+        Record a complete event that started at the provided time, as
+        returned by timeit.default_timer, with the provided duration in
+        seconds.
+        """
+
+        if not self.enabled:
+            return
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (started - self.origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': self.pid,
+            'tid': _thread_id(),
+        }
+        if args:
+            event['args'] = {
+                k: v if isinstance(v, _json_scalars) else repr(v)
+                for k, v in args.items()
+            }
+        with self._lock:
+            self.events.append(event)
+
+    def dump(self, stream):
+        """
+        Write the collected events to the stream as a trace event JSON.
+        """
+
+        json.dump({
+            'traceEvents': [{
+                'name': 'process_name',
+                'ph': 'M',
+                'pid': self.pid,
+                'args': {'name': 'calmjs'},
+            }] + sorted(self.events, key=lambda event: event['ts']),
+            'displayTimeUnit': 'ms',
+        }, stream)
+
+
+tracer = Tracer()
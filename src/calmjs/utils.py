@@ -5,10 +5,13 @@ Assortment of utility functions.
 
 from __future__ import absolute_import
 
+import hashlib
 import logging
 import os
 import re
+import shutil
 import sys
+from collections import namedtuple
 from contextlib import contextmanager
 from functools import partial
 from json import dump
@@ -17,8 +20,12 @@ from locale import getpreferredencoding
 from os import strerror
 from os.path import curdir
 from os.path import defpath
+from os.path import exists
+from os.path import isdir
+from os.path import join
 from os.path import normcase
 from os.path import pathsep
+from os.path import realpath
 from pdb import post_mortem
 from pdb import Pdb
 from subprocess import Popen
@@ -125,6 +132,99 @@ def raise_os_error(_errno, path=None):
     raise OSError(_errno, msg)
 
 
+SyncResult = namedtuple('SyncResult', [
+    'copied', 'deleted', 'unchanged', 'bytes'])
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(partial(fd.read, 65536), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _sync_file_unchanged(source, target, source_stat, checksum):
+    try:
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+    if isdir(target) or source_stat.st_size != target_stat.st_size:
+        return False
+    if int(source_stat.st_mtime) != int(target_stat.st_mtime):
+        return False
+    return not checksum or _file_sha256(source) == _file_sha256(target)
+
+
+def _remove_path(path):
+    if isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def sync_directory(source, target, checksum=False):
+    """
+    Synchronize the target directory with the source directory, in a
+    manner similar to rsync, where only the files that are new or have
+    changed (determined by their size and modification time, and also
+    their contents if checksum is True) are copied, and the files and
+    directories in target that are not present in source are deleted.
+    Symbolic links in source are followed, with the contents copied,
+    except for links to the directories that contain them.
+
+    Returns a SyncResult with the number of files copied, deleted and
+    left unchanged, and the number of bytes copied.
+    """
+
+    copied = deleted = unchanged = copied_bytes = 0
+    if exists(target) and not isdir(target):
+        os.unlink(target)
+        deleted += 1
+
+    for root, dirs, files in os.walk(source, followlinks=True):
+        rel = os.path.relpath(root, source)
+        target_root = target if rel == curdir else join(target, rel)
+        # skip the links that lead back to the directories containing
+        # them, which would otherwise be followed without end.
+        parts = [] if rel == curdir else rel.split(os.sep)
+        ancestors = set(
+            realpath(join(source, *parts[:index]))
+            for index in range(len(parts) + 1)
+        )
+        dirs[:] = [
+            name for name in dirs
+            if realpath(join(root, name)) not in ancestors
+        ]
+        if exists(target_root) and not isdir(target_root):
+            os.unlink(target_root)
+            deleted += 1
+        if not exists(target_root):
+            os.makedirs(target_root)
+
+        for name in files:
+            source_path = join(root, name)
+            target_path = join(target_root, name)
+            source_stat = os.stat(source_path)
+            if _sync_file_unchanged(
+                    source_path, target_path, source_stat, checksum):
+                unchanged += 1
+                continue
+            if isdir(target_path):
+                shutil.rmtree(target_path)
+                deleted += 1
+            shutil.copy2(source_path, target_path)
+            copied += 1
+            copied_bytes += source_stat.st_size
+
+        # remove everything in the target that is not in the source.
+        for name in sorted(set(os.listdir(target_root)) - set(dirs + files)):
+            _remove_path(join(target_root, name))
+            deleted += 1
+
+    return SyncResult(copied, deleted, unchanged, copied_bytes)
+
+
 def which(cmd, mode=os.F_OK | os.X_OK, path=None):
     """
     Given cmd, check where it is on PATH.
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Watching of source files for changes.
+
+Provides watchers that will block until any of the watched paths have
+been changed, for use by the ``--watch`` mode of the toolchain runtime.
+On Linux, inotify is used through ctypes, with a polling implementation
+provided as the fallback for every other platform or if inotify cannot
+be set up.
+
+Changes reported by the watchers are debounced, such that a burst of
+changes (e.g. an editor writing out a number of files, or writing a
+single file through a temporary file and a rename) will be reported
+together as a single set of paths.
+"""
+
+from __future__ import absolute_import
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from logging import getLogger
+from os.path import basename
+from os.path import dirname
+from os.path import isdir
+from os.path import join
+from timeit import default_timer
+
+logger = getLogger(__name__)
+
+# the duration in seconds that must pass without further changes before
+# the accumulated changes are reported.
+DEBOUNCE = 0.2
+# the interval in seconds between the scans done by the polling watcher.
+POLL_INTERVAL = 0.5
+
+# from sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE
+)
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[]
+_inotify_event = struct.Struct('iIII')
+
+
+def _fsencode(path):
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding() or 'utf-8')
+
+
+def _fsdecode(path):
+    if isinstance(path, bytes):
+        return path.decode(sys.getfilesystemencoding() or 'utf-8')
+    return path
+
+
+def inotify_libc():
+    """
+    Return the C library with the inotify functions, or None if it is
+    not available on this platform.
+    """
+
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        # ensure the functions are actually available
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Watcher(object):
+    """
+    The base watcher.
+    """
+
+    def __init__(self, paths, debounce=DEBOUNCE):
+        self.paths = set(paths)
+        self.debounce = debounce
+
+    def _poll(self, timeout):
+        """
+        Wait up to timeout seconds (forever if None) for changes, and
+        return the set of changed paths, which is empty if none changed
+        within that time.
+        """
+
+        raise NotImplementedError
+
+    def wait(self, timeout=None):
+        """
+        Wait up to timeout seconds (forever if None) for the watched
+        paths to change, and return the set of changed paths once no
+        further changes are seen for the debounce duration.
+        """
+
+        changed = self._poll(timeout)
+        while changed:
+            more = self._poll(self.debounce)
+            if not more:
+                break
+            changed.update(more)
+        return changed
+
+    def close(self):
+        """
+        Release the resources held by this watcher.
+        """
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not isdir(path):
+        return (st.st_mtime, st.st_size, st.st_ino)
+    # the modification time of a directory is not changed by the files
+    # within being modified, so every file within is stamped.
+    stamps = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        stamps.extend(
+            (join(root, name), _stamp(join(root, name)))
+            for name in sorted(files)
+        )
+    return (st.st_mtime, tuple(stamps))
+
+
+class PollingWatcher(Watcher):
+    """
+    A watcher that repeatedly scans the status of the watched paths,
+    including every file within the watched directories.
+    """
+
+    def __init__(self, paths, debounce=DEBOUNCE, interval=POLL_INTERVAL):
+        super(PollingWatcher, self).__init__(paths, debounce)
+        self.interval = interval
+        self.stamps = {path: _stamp(path) for path in self.paths}
+
+    def scan(self):
+        changed = set()
+        for path, stamp in self.stamps.items():
+            current = _stamp(path)
+            if current != stamp:
+                self.stamps[path] = current
+                changed.add(path)
+        return changed
+
+    def _poll(self, timeout):
+        deadline = None if timeout is None else default_timer() + timeout
+        while True:
+            changed = self.scan()
+            if changed:
+                return changed
+            remaining = (
+                self.interval if deadline is None else
+                min(self.interval, deadline - default_timer())
+            )
+            if remaining <= 0:
+                return changed
+            time.sleep(remaining)
+
+
+class InotifyWatcher(Watcher):
+    """
+    A watcher making use of inotify on Linux.  The directories that
+    contain the watched paths are watched, such that files replaced
+    through a rename will also be tracked.  The watched directories are
+    watched along with all the directories within them, including the
+    ones created afterwards.
+    """
+
+    def __init__(self, paths, debounce=DEBOUNCE, libc=None):
+        super(InotifyWatcher, self).__init__(paths, debounce)
+        self.libc = inotify_libc() if libc is None else libc
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+        # a mapping of the watch descriptor to a mapping of the names
+        # of the entries within the directory to the watched path; the
+        # None key is for the directory (or the directory containing
+        # it) being watched.
+        self.watches = {}
+        # the directory for each of the watch descriptors.
+        self.directories = {}
+        directories = {}
+        for path in self.paths:
+            if not isdir(path):
+                directories.setdefault(dirname(path), {})[
+                    basename(path)] = path
+
+        try:
+            for directory, names in directories.items():
+                self.add_watch(directory, names)
+            for path in self.paths:
+                if isdir(path):
+                    self.add_tree_watch(path, path)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, directory, names):
+        wd = self.libc.inotify_add_watch(
+            self.fd, _fsencode(directory), IN_WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), directory)
+        self.directories[wd] = directory
+        self.watches.setdefault(wd, {}).update(names)
+
+    def add_tree_watch(self, directory, path):
+        """
+        Watch the directory and every directory within it, with changes
+        reported as changes to path.
+        """
+
+        for root, dirs, files in os.walk(directory):
+            self.add_watch(root, {None: path})
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return set()
+            raise
+
+        changed = set()
+        offset = 0
+        while offset + _inotify_event.size <= len(data):
+            wd, mask, cookie, length = _inotify_event.unpack_from(
+                data, offset)
+            offset += _inotify_event.size
+            name = _fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            names = self.watches.get(wd)
+            if not names:
+                continue
+            if None in names:
+                changed.add(names[None])
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_new_directory(
+                        join(self.directories[wd], name), names[None])
+            if name in names:
+                changed.add(names[name])
+        return changed
+
+    def _watch_new_directory(self, directory, path):
+        try:
+            self.add_tree_watch(directory, path)
+        except OSError as e:
+            # it may have been removed already.
+            logger.debug("failed to watch directory '%s': %s", directory, e)
+
+    def _poll(self, timeout):
+        deadline = None if timeout is None else default_timer() + timeout
+        while True:
+            remaining = (
+                None if deadline is None else
+                max(deadline - default_timer(), 0))
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return set()
+            changed = self.read_events()
+            # events for unwatched entries in the same directories will
+            # be ignored.
+            if changed:
+                return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(paths, debounce=DEBOUNCE):
+    """
+    Return the most appropriate watcher for the current platform.
+    """
+
+    if inotify_libc() is not None:
+        try:
+            return InotifyWatcher(paths, debounce)
+        except OSError as e:
+            logger.info(
+                'unable to watch using inotify, using polling instead: %s', e)
+    return PollingWatcher(paths, debounce)
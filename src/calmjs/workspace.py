@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent build workspaces for toolchains.
+
+By default, a toolchain will build inside a temporary directory that
+is removed once the build is done, such that nothing can be reused by
+the next run.  The workspace provided here is a build directory kept
+inside a cache root, keyed by the toolchain class, the export target
+and the source packages, such that a subsequent build of the same
+thing will reuse the same directory.
+
+Every workspace tracks a manifest of the compile entries that have
+been processed, along with the status of the source at the time, such
+that entries with unchanged sources may be reused without being
+processed again, and that outputs from previous builds that are no
+longer produced may be cleaned out.  A lock file is held for the
+duration of a build, such that concurrent builds will not make use of
+the same workspace; where available, the lock is an advisory lock on
+that file, which is released by the system if the build is terminated.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+from logging import getLogger
+from os.path import exists
+from os.path import isdir
+from os.path import join
+from os.path import normpath
+from os.path import realpath
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def workspace_key(*parts):
+    """
+    Produce the key for a workspace from the provided JSON serializable
+    parts.
+    """
+
+    return hashlib.sha1(json.dumps(
+        parts, sort_keys=True).encode('utf8')).hexdigest()[:20]
+
+
+def source_stamp(path):
+    """
+    Return a JSON serializable value that will change when the file or
+    directory at path is changed, or None if it does not exist.
+    """
+
+    try:
+        if not isdir(path):
+            st = os.stat(path)
+            return [st.st_mtime, st.st_size]
+        count, size, mtime = 0, 0, os.stat(path).st_mtime
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                st = os.stat(join(root, name))
+                count += 1
+                size += st.st_size
+                mtime = max(mtime, st.st_mtime)
+        return [mtime, size, count]
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class BuildWorkspace(object):
+    """
+    A persistent build directory inside a cache root.
+    """
+
+    def __init__(self, root, key, description=None):
+        """
+        Arguments:
+
+        root
+            The cache root directory where workspaces are kept.
+        key
+            The key identifying this workspace.
+        description
+            A JSON serializable value describing what the workspace is
+            for, recorded in the manifest.
+        """
+
+        self.path = join(realpath(root), key)
+        self.build_dir = join(self.path, 'build')
+        self.lock_path = join(self.path, 'lock')
+        self.manifest_path = join(self.path, 'manifest.json')
+        self.description = description
+        self.locked = False
+        self._lock_fd = None
+        self.succeeded = False
+        # the records from the previous run, and the records from the
+        # current run, keyed by the process name and the entry.
+        self.previous = {}
+        self.current = {}
+        self.reused = 0
+
+    def acquire(self):
+        """
+        Create the workspace if needed and lock it for use.  Return
+        True if the lock was acquired, False if the workspace is locked
+        by another running build.
+        """
+
+        if not isdir(self.build_dir):
+            os.makedirs(self.build_dir)
+
+        if fcntl is not None:
+            acquired = self._acquire_flock()
+        else:  # pragma: no cover
+            acquired = self._acquire_exclusive()
+        if not acquired:
+            return False
+
+        self.locked = True
+        self.load()
+        logger.info("using build workspace '%s'", self.path)
+        return True
+
+    def _acquire_flock(self):
+        # the lock file is never removed, such that every build will
+        # lock the same file.
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            os.close(fd)
+            if e.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                return False
+            raise
+        os.ftruncate(fd, 0)
+        os.write(fd, ('%d\n' % os.getpid()).encode('ascii'))
+        self._lock_fd = fd
+        return True
+
+    def _read_lock_pid(self, path):
+        try:
+            with open(path) as fd:
+                return int(fd.read().strip() or 0)
+        except (IOError, OSError, ValueError):
+            return 0
+
+    def _acquire_exclusive(self):
+        # for systems without fcntl, where the existence of the lock
+        # file is the lock.
+        for attempt in range(2):
+            try:
+                fd = os.open(
+                    self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            else:
+                with os.fdopen(fd, 'w') as f:
+                    f.write('%d\n' % os.getpid())
+                return True
+
+            pid = self._read_lock_pid(self.lock_path)
+            if pid and _pid_alive(pid):
+                return False
+            # move the stale lock aside, which only one of the builds
+            # racing to do so will succeed with; if the lock that was
+            # moved is not the stale one, another build has replaced it
+            # in the meantime, so it is restored.
+            stale_path = '%s.%d' % (self.lock_path, os.getpid())
+            try:
+                os.rename(self.lock_path, stale_path)
+            except OSError:
+                continue
+            if self._read_lock_pid(stale_path) != pid:
+                try:
+                    os.rename(stale_path, self.lock_path)
+                except OSError:
+                    pass
+                return False
+            logger.debug(
+                "removed stale lock '%s' held by pid %d", self.lock_path, pid)
+            os.unlink(stale_path)
+        return False
+
+    def release(self):
+        """
+        Release the lock held on the workspace.
+        """
+
+        if not self.locked:
+            return
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        else:  # pragma: no cover
+            try:
+                os.unlink(self.lock_path)
+            except OSError:
+                logger.warning(
+                    "failed to remove lock '%s'", self.lock_path)
+        self.locked = False
+
+    def load(self):
+        self.previous = {}
+        try:
+            with open(self.manifest_path) as fd:
+                manifest = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return
+        if manifest.get('version') != MANIFEST_VERSION:
+            return
+        for record in manifest.get('records', []):
+            key = (record['process'],) + tuple(record['entry'])
+            self.previous[key] = record
+
+    def save(self):
+        """
+        Write the manifest for the current run.  If the run has not
+        succeeded, the records from the previous run that have not been
+        superseded are retained.
+        """
+
+        records = {} if self.succeeded else dict(self.previous)
+        records.update(self.current)
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'description': self.description,
+            'records': list(records.values()),
+        }
+        try:
+            with open(self.manifest_path, 'w') as fd:
+                json.dump(manifest, fd)
+        except (IOError, OSError) as e:
+            logger.warning(
+                "failed to write manifest '%s': %s", self.manifest_path, e)
+
+    def success(self):
+        self.succeeded = True
+
+    def close(self):
+        """
+        Save the manifest and release the lock.
+        """
+
+        if self.locked:
+            self.save()
+            if self.reused:
+                logger.info(
+                    "reused %d compiled entries from build workspace '%s'",
+                    self.reused, self.path)
+        self.release()
+
+    def _build_path(self, target):
+        path = join(self.build_dir, normpath(target))
+        if not realpath(path).startswith(self.build_dir):
+            return None
+        return path
+
+    def _remove_target(self, target):
+        path = self._build_path(target)
+        if path is None:
+            return
+        if isdir(path):
+            shutil.rmtree(path)
+        elif exists(path):
+            os.unlink(path)
+        if exists(path + '.map'):
+            os.unlink(path + '.map')
+
+    def memoize(self, process_name, processor, reused=None):
+        """
+        Wrap the processor for the compile entries of the process_name,
+        such that an entry with a source unchanged since the previous
+        run will have the recorded results returned without invoking
+        the processor, provided that its targets are still present.
+        If provided, reused will be called with the spec, the entry and
+        the results for every entry that was reused.
+        """
+
+        def wrapper(spec, entry):
+            key = (process_name,) + tuple(entry)
+            stamp = source_stamp(entry[1])
+            record = self.previous.get(key)
+            if record is not None and stamp is not None and (
+                    record['stamp'] == stamp):
+                modpaths, targetpaths, export_module_names = record['result']
+                if all(
+                        exists(self._build_path(target) or '')
+                        for target in targetpaths.values()):
+                    self.current[key] = record
+                    self.reused += 1
+                    result = (
+                        dict(modpaths), dict(targetpaths),
+                        list(export_module_names))
+                    if reused is not None:
+                        reused(spec, entry, result)
+                    return result
+
+            result = processor(spec, entry)
+            if stamp is not None:
+                self.current[key] = {
+                    'process': process_name,
+                    'entry': list(entry),
+                    'stamp': stamp,
+                    'result': [result[0], result[1], list(result[2])],
+                }
+            return result
+
+        return wrapper
+
+    def prune(self, targets):
+        """
+        Remove the targets produced by the previous run that are not
+        among the provided targets.  Return the removed targets.
+        """
+
+        previous = set()
+        for record in self.previous.values():
+            previous.update(record['result'][1].values())
+        stale = sorted(previous - set(targets))
+        for target in stale:
+            logger.debug("removing stale target '%s'", target)
+            self._remove_target(target)
+        if stale:
+            logger.info(
+                "removed %d stale targets from build workspace '%s'",
+                len(stale), self.path)
+        return stale